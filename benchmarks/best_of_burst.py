@@ -0,0 +1,121 @@
+"""
+Best-of-burst frame selection: scoring N frames with CamUtils.sharpness on
+the full frame and on the 170 px crop, against Camera's batched score of
+strided centre crops (gather + CamUtils.sharpness_batch). Frames are one
+synthetic scene blurred by a different amount each, so the expected ranking
+is known; the batched ranking is checked against it. Then capture_best on
+the camera (synthetic when picamera2 is missing), time to the saved frame.
+
+    python -m benchmarks.best_of_burst [--counts 8,16,32] [--width 2028] [--height 1520] [--output ./bench_best]
+"""
+import argparse
+import os
+import shutil
+import time
+
+import cv2 as cv
+import numpy as np
+
+from src.camera import Camera
+from src.camera.utils import CamUtils
+
+
+def scene(width, height, count):
+    # one textured frame, then progressively blurred copies in shuffled order
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 256, (height // 8, width // 8, 3), dtype=np.uint8)
+    base = cv.resize(base, (width, height), interpolation=cv.INTER_NEAREST)
+    blur = rng.permutation(count)
+    frames = [
+        base if b == 0 else cv.GaussianBlur(base, (0, 0), 0.3 + 0.4 * b)
+        for b in blur
+    ]
+    return frames, blur
+
+
+def timed(fn, repeat=5):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return float(np.median(times)), result
+
+
+def centre(image, side):
+    h, w = image.shape[:2]
+    return image[(h - side) // 2 : (h + side) // 2, (w - side) // 2 : (w + side) // 2]
+
+
+def batched(frames, side, step):
+    h, w = frames[0].shape[:2]
+    y, x = (h - side) // 2, (w - side) // 2
+    out = len(range(0, side, step))
+    crops = np.empty((len(frames), out, out, 3), dtype=np.uint8)
+    for i, frame in enumerate(frames):
+        np.copyto(crops[i], frame[y : y + side : step, x : x + side : step])
+    return CamUtils.sharpness_batch(crops)
+
+
+def agreement(scores, blur):
+    # fraction of frame pairs ordered like their blur, sharper scores higher
+    order = np.argsort(-np.asarray(scores), kind="stable")
+    ranks = np.empty(len(order), dtype=int)
+    ranks[order] = np.arange(len(order))
+    a, b = np.triu_indices(len(blur), 1)
+    return float(np.mean((ranks[a] < ranks[b]) == (blur[a] < blur[b])))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--counts", default="8,16,32")
+    parser.add_argument("--width", type=int, default=2028)
+    parser.add_argument("--height", type=int, default=1520)
+    parser.add_argument("--crop", type=int, default=256)
+    parser.add_argument("--step", type=int, default=2)
+    parser.add_argument("--output", default="./bench_best")
+    args = parser.parse_args()
+
+    counts = [int(c) for c in args.counts.split(",")]
+    for count in counts:
+        frames, blur = scene(args.width, args.height, count)
+        methods = {
+            "full frame": lambda: [CamUtils.sharpness(f) for f in frames],
+            "170 px crop": lambda: [CamUtils.sharpness(centre(f, 170)) for f in frames],
+            "batched crops": lambda: batched(frames, args.crop, args.step),
+        }
+        print(f"N={count}")
+        for name, fn in methods.items():
+            elapsed, scores = timed(fn)
+            best = int(np.argmax(scores))
+            print(
+                f"  {name:>13}: {elapsed * 1e3:7.2f} ms, "
+                f"sharpest found: {blur[best] == 0}, "
+                f"pair agreement {agreement(scores, blur) * 100:5.1f}%"
+            )
+
+    os.makedirs(args.output, exist_ok=True)
+    cam = Camera()
+    preview = cam.consumer("benchmark")
+    for _ in range(int(cam.frames.fps() or 20) + 5):
+        preview.wait_for_frame()
+    fps = cam.frames.fps()
+    for count in counts:
+        # the ring holds 2 s
+        seconds = min(count / fps, 1.9)
+        t0 = time.perf_counter()
+        future = cam.capture_best(args.output, seconds=seconds, keep=1)
+        decided = time.perf_counter() - t0
+        result = future.result()
+        print(
+            f"capture_best over the last {seconds:4.2f} s: "
+            f"selected in {decided * 1e3:6.2f} ms, saved after "
+            f"{(time.perf_counter() - t0) * 1e3:6.1f} ms, dropped {result.dropped}"
+        )
+        time.sleep(seconds)
+    cam.close()
+    shutil.rmtree(args.output, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
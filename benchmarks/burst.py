@@ -0,0 +1,61 @@
+"""
+Sustained burst write rate per sensor mode: capture the next N frames at the
+mode's full rate and stream them to local disk through the gallery writer.
+Uses the real camera when picamera2 is available.
+
+    python -m benchmarks.burst [--count 60] [--ext .png] [--workers 2] [--output ./bench_burst]
+"""
+import argparse
+import dataclasses
+import os
+import shutil
+import time
+
+from src.camera import Camera, GalleryWriter
+from src.camera.backend import SENSOR_MODES
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=60)
+    parser.add_argument("--ext", default=".png")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--queue", type=int, default=8)
+    parser.add_argument("--output", default="./bench_burst")
+    args = parser.parse_args()
+
+    cam = Camera()
+    preview = cam.consumer("benchmark")
+
+    for mode in SENSOR_MODES:
+        params = dataclasses.replace(cam._params_request, resolution=mode["size"])
+        cam.reconfigure(params)
+        for _ in range(5):
+            preview.wait_for_frame()
+
+        # fresh writer per mode so the timing stats are per mode
+        cam.writer.close()
+        cam.writer = GalleryWriter(workers=args.workers, max_queue=args.queue)
+
+        output = os.path.join(args.output, f"{mode['size'][0]}x{mode['size'][1]}")
+        os.makedirs(output, exist_ok=True)
+
+        started = time.perf_counter()
+        result = cam.capture_burst(output, count=args.count, ext=args.ext).result()
+        elapsed = time.perf_counter() - started
+
+        size = sum(os.path.getsize(p) for p in result.paths)
+        print(
+            f"{mode['format']} {mode['size'][0]}x{mode['size'][1]} "
+            f"@ {mode['fps']:6.2f} fps: {len(result.paths) / elapsed:6.2f} fps written, "
+            f"{result.dropped}/{args.count} dropped, "
+            f"{size / elapsed / 2**20:7.1f} MiB/s, "
+            f"encode {cam.writer.encode_time.summary()['mean'] * 1e3:.1f} ms/frame"
+        )
+        shutil.rmtree(output)
+
+    cam.close()
+
+
+if __name__ == "__main__":
+    main()
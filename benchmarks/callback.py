@@ -0,0 +1,67 @@
+"""
+Time spent inside the picamera2 pre_callback (i.e. until the request is
+released) for the old in-callback cvtColor and the lazy copy, plus what the
+preview consumer then pays for its downscale and centre crop.
+
+    python -m benchmarks.callback [--frames 200] [--width 2028] [--height 1520]
+
+On the device, Camera.callback_latency.summary() reports the live numbers.
+"""
+import argparse
+import time
+
+import cv2 as cv
+import numpy as np
+
+from src.camera.types import LazyFrame
+
+
+def timed(fn, n):
+    timings = np.empty(n)
+    for i in range(n):
+        t0 = time.perf_counter()
+        fn()
+        timings[i] = time.perf_counter() - t0
+    return timings
+
+
+def report(name, timings):
+    print(
+        f"{name:>28}: {timings.mean() * 1e3:7.3f} ms mean, "
+        f"{np.percentile(timings, 99) * 1e3:7.3f} ms p99"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--width", type=int, default=2028)
+    parser.add_argument("--height", type=int, default=1520)
+    args = parser.parse_args()
+
+    mapped = np.random.randint(0, 255, (args.height, args.width, 3), dtype=np.uint8)
+    slot = np.empty_like(mapped)
+    print(f"{args.width}x{args.height}, {args.frames} frames")
+
+    report("callback: cvtColor (before)", timed(
+        lambda: cv.cvtColor(mapped, cv.COLOR_BGR2RGB, dst=slot), args.frames
+    ))
+    report("callback: copy (after)", timed(lambda: np.copyto(slot, mapped), args.frames))
+
+    def preview_full():
+        frame = cv.cvtColor(slot, cv.COLOR_BGR2RGB)
+        cv.resize(frame, (426, 320), interpolation=cv.INTER_LANCZOS4)
+        h, w = frame.shape[:2]
+        frame[h // 2 - 85 : h // 2 + 85, w // 2 - 85 : w // 2 + 85].copy()
+
+    def preview_lazy():
+        image = LazyFrame(slot, "bgr")
+        image.resize((426, 320), interpolation=cv.INTER_LANCZOS4)
+        image.center_crop(170)
+
+    report("preview: full frame convert", timed(preview_full, args.frames))
+    report("preview: lazy convert", timed(preview_lazy, args.frames))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+CameraServer request throughput: GET /params and POST /exposure_time from
+concurrent clients, over one keep-alive connection per client and over a new
+connection per request, plus /params latency while another client stalls
+mid-request. Uses the synthetic camera unless picamera2 is available.
+
+    python -m benchmarks.control_server [--clients 1,8] [--seconds 3] [--port 4590]
+"""
+import argparse
+import http.client
+import json
+import logging
+import socket
+import threading
+import time
+
+import numpy as np
+
+from src.camera import Camera, CameraServer
+
+
+def client(port, keep_alive, stop, latencies, errors):
+    conn = None
+    i = 0
+    while not stop.is_set():
+        if conn is None or not keep_alive:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        try:
+            t0 = time.perf_counter()
+            if i % 4:
+                conn.request("GET", "/params")
+            else:
+                body = json.dumps({"value": 10000 + i % 100})
+                conn.request(
+                    "POST",
+                    "/exposure_time",
+                    body,
+                    {"Content-Type": "application/json"},
+                )
+            response = conn.getresponse()
+            response.read()
+            latencies.append(time.perf_counter() - t0)
+            if response.will_close or not keep_alive:
+                conn.close()
+                conn = None
+        except (OSError, http.client.HTTPException):
+            errors.append(1)
+            conn = None
+        i += 1
+    if conn is not None:
+        conn.close()
+
+
+def run(port, clients, keep_alive, seconds):
+    stop = threading.Event()
+    latencies, errors = [], []
+    threads = [
+        threading.Thread(target=client, args=(port, keep_alive, stop, latencies, errors))
+        for _ in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    latencies = np.array(latencies)
+    print(
+        f"{clients:3d} clients, {'keep-alive' if keep_alive else 'new conn  '}: "
+        f"{len(latencies) / seconds:7.1f} req/s, "
+        f"{latencies.mean() * 1e3:6.2f} ms mean, "
+        f"{np.percentile(latencies, 99) * 1e3:6.2f} ms p99, {len(errors)} errors"
+    )
+
+
+def slow_client(port, seconds):
+    # a client that stalls mid-request, like a phone dropping off Wi-Fi
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.sendall(b"GET /params HTTP/1.1\r\n")
+    time.sleep(seconds)
+    sock.sendall(b"Host: bench\r\n\r\n")
+    sock.recv(65536)
+    sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", default="1,8")
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--port", type=int, default=4590)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)  # per-request INFO logs
+    cam = Camera()
+    server = CameraServer(cam, port=args.port, callback_capture=cam.capture_and_save)
+    server.start()
+    time.sleep(0.5)
+
+    for clients in [int(c) for c in args.clients.split(",")]:
+        for keep_alive in (True, False):
+            run(args.port, clients, keep_alive, args.seconds)
+
+    slow = threading.Thread(target=slow_client, args=(args.port, 1.0))
+    slow.start()
+    time.sleep(0.05)
+    conn = http.client.HTTPConnection("127.0.0.1", args.port, timeout=10)
+    t0 = time.perf_counter()
+    conn.request("GET", "/params")
+    conn.getresponse().read()
+    elapsed = time.perf_counter() - t0
+    print(f"/params while another client stalls for 1 s: {elapsed * 1e3:.1f} ms")
+    conn.close()
+    slow.join()
+
+    server.stop()
+    cam.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Server CPU for keeping phone UIs up to date: each client either polls
+GET /params at --rate or holds one GET /events subscription at the same
+rate. Clients run in a separate process, and only the CPU of threads the
+server started is counted (from /proc/*/schedstat, Linux only), so the camera capture
+threads do not blur the numbers. Uses the synthetic camera unless
+picamera2 is available.
+
+    python -m benchmarks.events [--clients 0,1,8,32] [--rate 5] [--seconds 5] [--port 4591]
+"""
+import argparse
+import http.client
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+from src.camera import Camera, CameraServer
+
+
+def thread_cpu():
+    # seconds on CPU per live thread of this process, schedstat is in ns
+    # where stat would only count scheduler ticks
+    times = {}
+    for tid in os.listdir("/proc/self/task"):
+        try:
+            with open(f"/proc/self/task/{tid}/schedstat") as f:
+                times[tid] = int(f.read().split()[0]) / 1e9
+        except FileNotFoundError:
+            continue
+    return times
+
+
+def server_cpu(camera_threads):
+    return sum(t for tid, t in thread_cpu().items() if tid not in camera_threads)
+
+
+def poller(port, rate, stop, received):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    while not stop.is_set():
+        conn.request("GET", "/params")
+        conn.getresponse().read()
+        with received.get_lock():
+            received.value += 1
+        time.sleep(1 / rate)
+    conn.close()
+
+
+def subscriber(port, rate, stop, received):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    conn.request("GET", f"/events?rate={rate}")
+    response = conn.getresponse()
+    while not stop.is_set():
+        if response.fp.readline().startswith(b"data: "):
+            with received.get_lock():
+                received.value += 1
+    conn.close()
+
+
+def clients(target, port, count, rate, stop, received):
+    threads = [
+        threading.Thread(target=target, args=(port, rate, stop, received))
+        for _ in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", default="0,1,8,32")
+    parser.add_argument("--rate", type=float, default=5)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--port", type=int, default=4591)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)  # per-request INFO logs
+    ctx = multiprocessing.get_context("fork")
+    cam = Camera()
+    time.sleep(0.5)
+    camera_threads = set(thread_cpu())
+    server = CameraServer(cam, port=args.port, events_rate=args.rate)
+    server.start()
+    time.sleep(0.5)
+
+    for name, target in (("poll /params", poller), ("sse /events", subscriber)):
+        for count in [int(c) for c in args.clients.split(",")]:
+            stop = ctx.Event()
+            received = ctx.Value("l", 0)
+            proc = ctx.Process(
+                target=clients,
+                args=(target, args.port, count, args.rate, stop, received),
+            )
+            proc.start()
+            time.sleep(1)
+
+            start = received.value
+            cpu, wall = server_cpu(camera_threads), time.perf_counter()
+            time.sleep(args.seconds)
+            cpu = server_cpu(camera_threads) - cpu
+            wall = time.perf_counter() - wall
+            updates = (received.value - start) / wall
+
+            stop.set()
+            proc.join()
+            time.sleep(0.5)
+
+            per_update = cpu / (updates * wall) if updates else 0.0
+            print(
+                f"{name} {count:3d} clients: {cpu / wall * 100:5.2f}% server CPU, "
+                f"{per_update * 1e6:6.1f} us per update, "
+                f"{updates / max(count, 1):5.1f} updates/s per client"
+            )
+
+    server.stop()
+    cam.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Ring buffer vs. the old list-based FrameList, fed like Camera._on_frame.
+
+    python -m benchmarks.framelist [--frames 200] [--width 2028] [--height 1520]
+"""
+import argparse
+import time
+import tracemalloc
+from typing import List
+
+import cv2 as cv
+import numpy as np
+
+from src.camera.types import (
+    CameraFrameWrapper,
+    CameraParameters,
+    LazyFrame,
+    RuntimeFrameMetadata,
+)
+from src.camera.utils import FrameList
+
+
+class LegacyFrameList:
+    def __init__(self, capacity_seconds=2):
+        self._list: List[CameraFrameWrapper] = list()
+        self._capacity = capacity_seconds
+
+    def add(self, frame: CameraFrameWrapper):
+        self._list.append(frame)
+        to_remove = 0
+        for i, f in enumerate(self._list):
+            if time.monotonic() - f.timestamp > self._capacity:
+                to_remove += 1
+
+        self._list = self._list[to_remove:]
+
+
+def feed_legacy(frames: LegacyFrameList, src, params, runtime):
+    frame = cv.cvtColor(src, cv.COLOR_BGR2RGB)
+    frames.add(
+        CameraFrameWrapper(LazyFrame(frame, "rgb"), params, time.monotonic(), runtime)
+    )
+
+
+def feed_ring(frames: FrameList, src, params, runtime):
+    np.copyto(frames.next_slot(), src)
+    frames.commit(params, runtime, time.monotonic(), order="bgr")
+
+
+def run(name, feed, frames, src, n):
+    params = CameraParameters(1.0, (2.0, 2.0), 10000, resolution=src.shape[1::-1])
+    runtime = RuntimeFrameMetadata(lux=100.0, temperature=5000.0)
+
+    # fill the buffer first so both variants are measured in steady state
+    for _ in range(n):
+        feed(frames, src, params, runtime)
+
+    tracemalloc.start()
+    allocated = 0
+    timings = np.empty(n)
+    for i in range(n):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        t0 = time.perf_counter()
+        feed(frames, src, params, runtime)
+        timings[i] = time.perf_counter() - t0
+        allocated += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+
+    per_frame = allocated / n
+    print(
+        f"{name:>6}: {timings.mean() * 1e3:7.3f} ms/frame mean, "
+        f"{np.percentile(timings, 99) * 1e3:7.3f} ms p99, "
+        f"{per_frame / 2**20:8.3f} MiB allocated/frame "
+        f"({per_frame / src.nbytes:.2f} frame buffers)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--width", type=int, default=2028)
+    parser.add_argument("--height", type=int, default=1520)
+    parser.add_argument("--capacity", type=float, default=0.5)
+    args = parser.parse_args()
+
+    src = np.random.randint(0, 255, (args.height, args.width, 3), dtype=np.uint8)
+    print(f"{args.width}x{args.height}, {args.frames} frames, {args.capacity}s capacity")
+
+    run("list", feed_legacy, LegacyFrameList(args.capacity), src, args.frames)
+
+    ring = FrameList(args.capacity)
+    ring.resize((args.width, args.height))
+    run("ring", feed_ring, ring, src, args.frames)
+
+
+if __name__ == "__main__":
+    main()
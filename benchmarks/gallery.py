@@ -0,0 +1,133 @@
+"""
+Listing and browsing a gallery of --count captures: the StaticHTTPServer
+directory listing against GalleryServer's paginated /api/index, and one
+page of full images against one page of cached and uncached thumbnails.
+The same encoded capture is written --count times with increasing mtimes.
+
+    python -m benchmarks.gallery [--count 10000] [--galleries 1] [--size 1014x760] [--per-page 60] [--output ./bench_gallery]
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import shutil
+import time
+
+import cv2 as cv
+import numpy as np
+
+from src.network.gallery import GalleryServer
+from src.network.static import StaticHTTPServer
+
+
+def make_gallery(output, count, galleries, size):
+    width, height = size
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    image = np.dstack([x + 0 * y, y + 0 * x, (x + y) / 2]).astype(np.uint8)
+    image[::16] = 0  # some detail, a flat gradient compresses to nothing
+    encoded = cv.imencode(".png", image)[1].tobytes()
+
+    now = time.time() - count
+    for i in range(count):
+        directory = os.path.join(output, f"gallery{i % galleries}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"capture{i:05d}.png")
+        with open(path, "wb") as f:
+            f.write(encoded)
+        os.utime(path, (now + i, now + i))
+    return len(encoded)
+
+
+def get(conn, path):
+    t0 = time.perf_counter()
+    conn.request("GET", path)
+    response = conn.getresponse()
+    body = response.read()
+    return time.perf_counter() - t0, body
+
+
+def timed(conn, path, repeat=5):
+    times = []
+    for _ in range(repeat):
+        elapsed, body = get(conn, path)
+        times.append(elapsed)
+    return float(np.median(times)), body
+
+
+def fetch_all(conn, paths):
+    t0 = time.perf_counter()
+    size = 0
+    for path in paths:
+        size += len(get(conn, path)[1])
+    return time.perf_counter() - t0, size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--galleries", type=int, default=1)
+    parser.add_argument("--size", default="1014x760")
+    parser.add_argument("--per-page", type=int, default=60)
+    parser.add_argument("--port", type=int, default=4890)
+    parser.add_argument("--output", default="./bench_gallery")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    size = tuple(int(v) for v in args.size.split("x"))
+    shutil.rmtree(args.output, ignore_errors=True)
+    t0 = time.perf_counter()
+    file_size = make_gallery(args.output, args.count, args.galleries, size)
+    print(
+        f"{args.count} captures of {file_size / 1024:.0f} KiB in {args.galleries} "
+        f"galleries, written in {time.perf_counter() - t0:.1f} s"
+    )
+
+    static = StaticHTTPServer(args.output, port=args.port)
+    static.start()
+    conn = http.client.HTTPConnection("127.0.0.1", args.port)
+    elapsed, body = timed(conn, "/gallery0/")
+    print(f"static listing of gallery0/: {elapsed * 1e3:7.1f} ms, {len(body) / 1024:.0f} KiB, unsorted")
+    conn.close()
+    static.stop()
+
+    gallery = GalleryServer(args.output, port=args.port + 1)
+    t0 = time.perf_counter()
+    gallery.start()
+    print(f"index build on start: {(time.perf_counter() - t0) * 1e3:7.1f} ms")
+    gallery.index.refresh_interval = 0.0  # every request refreshes
+
+    conn = http.client.HTTPConnection("127.0.0.1", args.port + 1)
+    per_page = args.per_page
+    elapsed, body = timed(conn, f"/api/index?page=0&per_page={per_page}")
+    first = json.loads(body)
+    print(f"/api/index newest page:     {elapsed * 1e3:7.1f} ms, {len(body) / 1024:.0f} KiB")
+    last = first["pages"] - 1
+    elapsed, _ = timed(conn, f"/api/index?page={last}&per_page={per_page}")
+    print(f"/api/index oldest page:     {elapsed * 1e3:7.1f} ms")
+
+    path = os.path.join(args.output, "gallery0", "new.png")
+    shutil.copyfile(os.path.join(args.output, first["items"][0]["path"]), path)
+    t0 = time.perf_counter()
+    gallery.index.refresh(force=True)
+    print(f"refresh after one new file: {(time.perf_counter() - t0) * 1e3:7.1f} ms")
+    t0 = time.perf_counter()
+    gallery.index.refresh(force=True)
+    print(f"refresh, nothing changed:   {(time.perf_counter() - t0) * 1e3:7.2f} ms")
+
+    items = first["items"]
+    elapsed, nbytes = fetch_all(conn, [item["url"] for item in items])
+    print(f"page of full images:        {elapsed * 1e3:7.1f} ms, {nbytes / 2**20:6.1f} MiB")
+    elapsed, nbytes = fetch_all(conn, [item["thumbnail"] for item in items])
+    print(f"page of thumbnails, cold:   {elapsed * 1e3:7.1f} ms, {nbytes / 2**20:6.1f} MiB")
+    elapsed, nbytes = fetch_all(conn, [item["thumbnail"] for item in items])
+    print(f"page of thumbnails, cached: {elapsed * 1e3:7.1f} ms, {nbytes / 2**20:6.1f} MiB")
+
+    conn.close()
+    gallery.stop()
+    shutil.rmtree(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Gallery metadata queries over index.jsonl at --count captures: the first
+query (parses the whole file), repeated queries, a query right after one
+more capture was appended, and the cost of embedding the metadata into an
+encoded PNG and JPEG.
+
+    python -m benchmarks.metadata [--count 10000] [--output ./bench_metadata]
+"""
+import argparse
+import os
+import shutil
+import time
+
+import cv2 as cv
+import numpy as np
+
+from src.camera.metadata import CaptureIndex, embed
+from src.camera.types import CaptureMetadata
+
+
+def record(i, rng):
+    return CaptureMetadata(
+        timestamp=1.7e9 + i,
+        seq=i,
+        exposure_time=int(rng.integers(100, 1_000_000)),
+        analogue_gain=float(rng.uniform(1, 22)),
+        colour_gains=(2.25, 3.25),
+        lux=float(rng.uniform(0, 1000)),
+        temperature=float(rng.uniform(2500, 8000)),
+        resolution=(2028, 1520),
+        sharpness=float(rng.uniform(0, 10)),
+        burst=f"burst{i // 10}",
+        burst_index=i % 10,
+    )
+
+
+def timed(fn, repeat=1):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - t0) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--output", default="./bench_metadata")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    shutil.rmtree(args.output, ignore_errors=True)
+    os.makedirs(args.output)
+    writer = CaptureIndex()
+    t0 = time.perf_counter()
+    for i in range(args.count):
+        writer.append(os.path.join(args.output, f"{i:05d}.png"), record(i, rng))
+    elapsed = time.perf_counter() - t0
+    print(f"append: {elapsed / args.count * 1e6:6.1f} us per capture")
+
+    reader = CaptureIndex()
+    dark = lambda: reader.query(args.output, ranges={"lux": (None, 10)})
+    sharpest = lambda: reader.query(
+        args.output, equals={"burst": "burst42"}, order="-sharpness", limit=1
+    )
+    elapsed, result = timed(dark)
+    print(f"first query, lux <= 10:      {elapsed * 1e3:6.1f} ms, {len(result)} captures")
+    elapsed, result = timed(dark, 20)
+    print(f"lux <= 10:                   {elapsed * 1e3:6.1f} ms")
+    elapsed, result = timed(sharpest, 20)
+    print(f"sharpest of a burst:         {elapsed * 1e3:6.1f} ms, {result[0]['file']}")
+    writer.append(os.path.join(args.output, "new.png"), record(args.count, rng))
+    elapsed, result = timed(dark)
+    print(f"lux <= 10 after one append:  {elapsed * 1e3:6.1f} ms")
+
+    image = np.random.randint(0, 256, (1520, 2028, 3), dtype=np.uint8)
+    metadata = record(0, rng)
+    for ext in (".png", ".jpg"):
+        encoded = cv.imencode(ext, image)[1].tobytes()
+        elapsed, _ = timed(lambda: embed(encoded, ext, metadata), 20)
+        print(f"embed into {ext} of {len(encoded) / 2**20:4.1f} MiB: {elapsed * 1e3:5.2f} ms")
+
+    shutil.rmtree(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+PreviewRenderer against the per-frame overlay code main.py and main_fb.py
+used to inline (resize, crop copy, cv.line crosshairs, copyMakeBorder and
+shadowed putText redrawn every frame), for both display layouts. Frames
+come from a 2028x1520 main and 640x480 lores pair. The text lines are the
+display's: sharpness and the rates change every frame, the rest does not.
+Prints time and allocations per frame, plus the renderer's stage breakdown.
+
+    python -m benchmarks.preview [--frames 300]
+"""
+import argparse
+import time
+import tracemalloc
+
+import cv2 as cv
+import numpy as np
+
+from src.camera.preview import STAGES, PreviewRenderer
+from src.camera.types import (
+    CameraFrameWrapper,
+    CameraParameters,
+    LazyFrame,
+    RuntimeFrameMetadata,
+)
+from src.camera.utils import CamUtils
+
+LAYOUTS = {
+    # main.py: X11 window, preview right aligned
+    "window": dict(
+        size=(480, 320),
+        crop_side=170,
+        align="right",
+        interpolation=cv.INTER_LANCZOS4,
+        font_scale=0.3,
+        line_height=10,
+    ),
+    # main_fb.py: 800x480 framebuffer
+    "framebuffer": dict(
+        size=(800, 480),
+        crop_side=350,
+        align="center",
+        interpolation=cv.INTER_NEAREST,
+        font_scale=0.38,
+        line_height=14,
+        channels=4,
+    ),
+}
+
+
+def lines(frame, sharpness, i):
+    return [
+        "192.168.0.17",
+        f"sharpness {sharpness:.1f}",
+        f"gain {frame.metadata.analogue_gain:.1f}",
+        f"shutter {CamUtils.microseconds_to_seconds(frame.metadata.exposure_time):.7f}",
+        f"lux: {frame.runtime_metadata.lux}",
+        f"temperature: {frame.runtime_metadata.temperature}",
+        f"frames per second: {19.0 + (i % 7) * 0.1:3.1f}",
+    ]
+
+
+def legacy(frame, i, size, crop_side, align, interpolation, font_scale, line_height, channels=3):
+    # the loop body both entry points used to carry
+    width, height = size
+    new_width = int(height * frame.preview.shape[1] / frame.preview.shape[0])
+    lores = frame.preview.resize((new_width, height), interpolation=interpolation)
+    crop = frame.image.center_crop(crop_side)
+    crop_color = np.mean(crop, axis=(0, 1)).astype(np.uint8)
+    r, g, b = crop_color[0], crop_color[1], crop_color[2]
+    luminance = 0.299 * r + 0.587 * g + 0.114 * b
+    color = (0, 0, 0) if luminance > 127 else (255, 255, 255)
+    sharpness = CamUtils.sharpness(crop)
+
+    h, w = crop.shape[:2]
+    cv.line(crop, (w // 2 - 4, h // 2), (w // 2 + 4, h // 2), color, 1)
+    cv.line(crop, (w // 2, h // 2 - 4), (w // 2, h // 2 + 4), color, 1)
+    pad_left = width - new_width if align == "right" else (width - new_width) // 2
+    lores = cv.copyMakeBorder(
+        lores, 0, 0, pad_left, width - new_width - pad_left, cv.BORDER_CONSTANT, value=[0, 0, 0]
+    )
+    h, w = lores.shape[:2]
+    cv.line(lores, (w // 2 - 8, h // 2), (w // 2 + 8, h // 2), color, 1)
+    cv.line(lores, (w // 2, h // 2 - 8), (w // 2, h // 2 + 8), color, 1)
+    lores[h - crop_side - 10 : h - 10, 10 : 10 + crop_side] = crop
+
+    for n, text in enumerate(lines(frame, sharpness, i)):
+        y = 30 + n * line_height
+        cv.putText(lores, text, (11, y + 1), cv.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 0), 2)
+        cv.putText(lores, text, (10, y), cv.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255), 1)
+
+    if channels == 4:
+        # main_fb.py's frame_to_framebuffer_format
+        bgra = np.zeros((height, width, 4), dtype=np.uint8)
+        bgra[:, :, :3] = lores
+        bgra[:, :, 3] = 255
+        return bgra
+    return lores
+
+
+def rendered(renderer):
+    def render(frame, i):
+        sharpness = renderer.draw(frame)
+        return renderer.draw_text(lines(frame, sharpness, i))
+
+    return render
+
+
+def allocated(render, frames, n=50):
+    # separate pass, tracemalloc slows every allocation down
+    tracemalloc.start()
+    total = 0
+    for i in range(n):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        render(frames[i % len(frames)], i)
+        total += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    return total / n
+
+
+def run(name, make, frames, n):
+    per_frame = allocated(make(), frames)
+    render = make()
+    for i in range(10):
+        render(frames[i % len(frames)], i)
+    timings = np.empty(n)
+    for i in range(n):
+        t0 = time.perf_counter()
+        render(frames[i % len(frames)], i)
+        timings[i] = time.perf_counter() - t0
+    print(
+        f"  {name:>8}: {timings.mean() * 1e3:6.2f} ms/frame mean, "
+        f"{np.percentile(timings, 99) * 1e3:6.2f} ms p99, "
+        f"{per_frame / 1024:7.1f} KiB allocated/frame"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=300)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(4):
+        image = cv.GaussianBlur(
+            rng.integers(0, 256, (1520, 2028, 3), dtype=np.uint8), (0, 0), 1 + i
+        )
+        frames.append(
+            CameraFrameWrapper(
+                LazyFrame(image, "bgr"),
+                CameraParameters(1.0 + i, (2.0, 2.0), 10000, resolution=(2028, 1520)),
+                time.monotonic(),
+                RuntimeFrameMetadata(lux=100.0, temperature=5000.0),
+                lores=LazyFrame(cv.resize(image, (640, 480)), "bgr"),
+            )
+        )
+
+    for layout, options in LAYOUTS.items():
+        print(layout)
+        run("legacy", lambda: lambda frame, i: legacy(frame, i, **options), frames, args.frames)
+        renderers = []
+
+        def make():
+            renderers.append(PreviewRenderer(**options))
+            return rendered(renderers[-1])
+
+        run("renderer", make, frames, args.frames)
+        summary = renderers[-1].timing_summary()
+        print("  stages:  " + ", ".join(f"{s} {summary[s]:.3f} ms" for s in STAGES))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+DNG from the packed raw stream vs. the PNG gallery path, per frame.
+
+    python -m benchmarks.raw [--count 10] [--width 2028] [--height 1520] [--bits 12]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import cv2 as cv
+import numpy as np
+
+from src.camera.raw import RawWriter, unpack, write_dng
+
+METADATA = {
+    "ExposureTime": 10000,
+    "AnalogueGain": 2.0,
+    "ColourGains": (2.0, 1.8),
+    "ColourTemperature": 5000,
+    "Lux": 400.0,
+    "SensorBlackLevels": (4096, 4096, 4096, 4096),
+    "ColourCorrectionMatrix": (1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0),
+}
+
+
+def report(name, timings, paths):
+    size = np.mean([os.path.getsize(p) for p in paths])
+    print(
+        f"{name:>12}: {np.mean(timings) * 1e3:8.2f} ms/frame mean, "
+        f"{np.percentile(timings, 99) * 1e3:8.2f} ms p99, "
+        f"{size / 2**20:6.2f} MiB/file"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=10)
+    parser.add_argument("--width", type=int, default=2028)
+    parser.add_argument("--height", type=int, default=1520)
+    parser.add_argument("--bits", type=int, default=12, choices=(10, 12))
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    # fork the pool before allocating frames, as Camera does
+    pool = RawWriter(args.workers)
+
+    size = (args.width, args.height)
+    fmt = f"SRGGB{args.bits}_CSI2P"
+    stride = (args.width * args.bits // 8 + 63) // 64 * 64
+    raw = np.random.randint(0, 256, (args.height, stride), dtype=np.uint8)
+    bgr = np.random.randint(0, 256, (args.height, args.width, 3), dtype=np.uint8)
+    print(f"{args.width}x{args.height} {fmt}, {args.count} frames")
+
+    with tempfile.TemporaryDirectory() as out:
+        path = lambda name, i, ext: os.path.join(out, f"{name}{i:04d}{ext}")
+
+        # what _on_frame pays for a raw capture
+        timings = []
+        for _ in range(args.count):
+            t0 = time.perf_counter()
+            raw.copy()
+            timings.append(time.perf_counter() - t0)
+        print(f"{'raw copy':>12}: {np.mean(timings) * 1e3:8.2f} ms/frame mean")
+
+        timings = []
+        for _ in range(args.count):
+            t0 = time.perf_counter()
+            unpack(raw, fmt, size)
+            timings.append(time.perf_counter() - t0)
+        print(f"{'unpack':>12}: {np.mean(timings) * 1e3:8.2f} ms/frame mean")
+
+        timings, paths = [], []
+        for i in range(args.count):
+            paths.append(path("png", i, ".png"))
+            t0 = time.perf_counter()
+            ok, encoded = cv.imencode(".png", cv.cvtColor(bgr, cv.COLOR_BGR2RGB))
+            with open(paths[-1], "wb") as f:
+                f.write(encoded.tobytes())
+            timings.append(time.perf_counter() - t0)
+        report("png", timings, paths)
+
+        timings, paths = [], []
+        for i in range(args.count):
+            paths.append(path("dng", i, ".dng"))
+            t0 = time.perf_counter()
+            write_dng(paths[-1], raw, fmt, size, METADATA)
+            timings.append(time.perf_counter() - t0)
+        report("dng", timings, paths)
+
+        paths = [path("pool", i, ".dng") for i in range(args.count)]
+        t0 = time.perf_counter()
+        futures = [pool.submit(p, raw.copy(), fmt, size, METADATA) for p in paths]
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - t0
+        report(f"dng pool x{args.workers}", [elapsed / args.count], paths)
+
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Latency of one slider update: live set_controls vs. the old full
+stop/configure/start. Uses the real camera when picamera2 is available.
+
+    python -m benchmarks.reconfigure [--updates 20]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from src.camera import Camera
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=20)
+    args = parser.parse_args()
+
+    cam = Camera()
+    preview = cam.consumer("benchmark")
+    preview.wait_for_frame()
+    params = cam._params_request
+
+    for name, apply in (
+        ("restart", lambda p: cam._restart(p, cam._controls_for(p))),
+        ("live", cam.reconfigure),
+    ):
+        timings = np.empty(args.updates)
+        for i in range(args.updates):
+            params.analogue_gain = 1.0 + i % 8
+            t0 = time.perf_counter()
+            apply(params)
+            timings[i] = time.perf_counter() - t0
+            preview.wait_for_frame()
+
+        print(
+            f"{name:>8}: {timings.mean() * 1e3:8.2f} ms mean, "
+            f"{timings.max() * 1e3:8.2f} ms max per update"
+        )
+
+    cam._cam.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Which sensor modes can be recorded without drops: record each mode for a
+few seconds through the encoder process and report recorded fps, drops
+and encoder latency. Uses the real camera when picamera2 is available.
+
+    python -m benchmarks.record [--seconds 5] [--preroll 1] [--stream main] [--output ./bench_record]
+"""
+import argparse
+import dataclasses
+import os
+import shutil
+import time
+
+from src.camera import Camera
+from src.camera.backend import SENSOR_MODES
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--preroll", type=float, default=1)
+    parser.add_argument("--stream", default="main", choices=("main", "lores"))
+    parser.add_argument("--output", default="./bench_record")
+    args = parser.parse_args()
+
+    cam = Camera()
+    preview = cam.consumer("benchmark")
+
+    for mode in SENSOR_MODES:
+        params = dataclasses.replace(cam._params_request, resolution=mode["size"])
+        cam.reconfigure(params)
+        # let the ring fill so the pre-roll is there
+        deadline = time.monotonic() + args.preroll + 0.5
+        while time.monotonic() < deadline:
+            preview.wait_for_frame()
+
+        output = os.path.join(args.output, f"{mode['size'][0]}x{mode['size'][1]}")
+        cam.recorder.start(output, preroll_seconds=args.preroll, stream=args.stream)
+        time.sleep(args.seconds)
+        stats = cam.recorder.stop()
+
+        total = stats["recorded"] + stats["dropped_ring"] + stats["dropped_encoder"]
+        latency = stats["encode_latency"]
+        size = sum(os.path.getsize(p) for p in stats["segments"])
+        print(
+            f"{mode['format']} {mode['size'][0]}x{mode['size'][1]} "
+            f"@ {mode['fps']:6.2f} fps: {stats['recorded'] / stats['seconds']:6.2f} fps recorded, "
+            f"{stats['dropped_ring'] + stats['dropped_encoder']}/{total} dropped, "
+            f"encoder latency {latency['mean'] * 1e3:.1f} ms mean "
+            f"{latency['p99'] * 1e3:.1f} ms p99, "
+            f"{size / stats['seconds'] / 2**20:5.1f} MiB/s"
+        )
+        shutil.rmtree(output)
+
+    cam.close()
+
+
+if __name__ == "__main__":
+    main()
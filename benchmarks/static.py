@@ -0,0 +1,161 @@
+"""
+StaticHTTPServer against the stock single-threaded SimpleHTTPRequestHandler
+it replaced. It measures:
+
+- bytes and time to load the controls UI, first visit and revalidation
+- throughput and server CPU for a large capture
+- index.html latency while another client slowly downloads that capture
+
+Clients run in a separate process so only the server side is measured.
+
+    python -m benchmarks.static [--size-mb 200] [--slow-seconds 2] [--port 4690]
+"""
+import argparse
+import functools
+import http.client
+import http.server
+import multiprocessing
+import os
+import shutil
+import socket
+import socketserver
+import threading
+import time
+
+from src.network.static import StaticHTTPServer
+
+UI_FILES = ("index.html", "CustomSlider.js")
+
+
+class StockHTTPServer:
+    # the previous StaticHTTPServer
+    def __init__(self, directory, port):
+        handler = functools.partial(
+            http.server.SimpleHTTPRequestHandler, directory=directory
+        )
+
+        class ReuseAddressServer(socketserver.TCPServer):
+            allow_reuse_address = True
+
+        self.httpd = ReuseAddressServer(("", port), handler)
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def load_ui(port, results):
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    for visit in ("first", "revalidate"):
+        t0 = time.perf_counter()
+        nbytes = 0
+        for name in UI_FILES:
+            headers = {"Accept-Encoding": "gzip"}
+            tag = results.get(name)
+            if visit == "revalidate" and tag:
+                headers["If-None-Match"] = tag
+            conn.request("GET", f"/{name}", headers=headers)
+            response = conn.getresponse()
+            nbytes += len(response.read())
+            results[name] = response.getheader("ETag")
+        results[visit] = (time.perf_counter() - t0, nbytes)
+    conn.close()
+
+
+def download(port, results):
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    t0 = time.perf_counter()
+    conn.request("GET", "/capture.bin")
+    response = conn.getresponse()
+    nbytes = 0
+    while chunk := response.read(1 << 20):
+        nbytes += len(chunk)
+    results["download"] = (time.perf_counter() - t0, nbytes)
+    conn.close()
+
+
+def slow_download(port, seconds):
+    # a phone on bad Wi-Fi, reads a little every 100 ms
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 16)
+    sock.sendall(b"GET /capture.bin HTTP/1.1\r\nHost: bench\r\n\r\n")
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        sock.recv(1 << 16)
+        time.sleep(0.1)
+    sock.close()
+
+
+def in_process(ctx, target, *args):
+    manager = ctx.Manager()
+    results = manager.dict()
+    proc = ctx.Process(target=target, args=(*args, results))
+    proc.start()
+    proc.join()
+    return dict(results)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=200)
+    parser.add_argument("--slow-seconds", type=float, default=2)
+    parser.add_argument("--port", type=int, default=4690)
+    parser.add_argument("--output", default="./bench_static")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    for name in UI_FILES:
+        shutil.copy(os.path.join("src/client", name), args.output)
+    with open(os.path.join(args.output, "capture.bin"), "wb") as f:
+        for _ in range(args.size_mb):
+            f.write(os.urandom(1 << 20))
+
+    ctx = multiprocessing.get_context("fork")
+    servers = {
+        "stock": lambda port: StockHTTPServer(args.output, port),
+        "static": lambda port: StaticHTTPServer(args.output, port=port),
+    }
+    # request logs on stderr would dominate the timings
+    http.server.SimpleHTTPRequestHandler.log_message = lambda self, *args: None
+
+    for port, (name, factory) in enumerate(servers.items(), args.port):
+        server = factory(port)
+        server.start()
+        time.sleep(0.2)
+
+        ui = in_process(ctx, load_ui, port)
+        for visit in ("first", "revalidate"):
+            elapsed, nbytes = ui[visit]
+            print(f"{name:>6} UI {visit:>10}: {elapsed * 1e3:6.1f} ms, {nbytes / 1024:6.1f} KiB")
+
+        cpu = time.process_time()
+        elapsed, nbytes = in_process(ctx, download, port)["download"]
+        cpu = time.process_time() - cpu
+        print(
+            f"{name:>6} capture:  {nbytes / elapsed / 2**20:7.1f} MiB/s, "
+            f"{cpu / elapsed * 100:5.1f}% server CPU"
+        )
+
+        slow = ctx.Process(target=slow_download, args=(port, args.slow_seconds))
+        slow.start()
+        time.sleep(0.3)
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        t0 = time.perf_counter()
+        conn.request("GET", "/index.html")
+        conn.getresponse().read()
+        print(
+            f"{name:>6} index.html during a slow download: "
+            f"{(time.perf_counter() - t0) * 1e3:7.1f} ms"
+        )
+        conn.close()
+        slow.join()
+        server.stop()
+
+    shutil.rmtree(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Server CPU per added /video.mjpg viewer, for the threaded and the asyncio
+ImageStream. Frames are fed at --fps, viewers are simulated by non-blocking
+sockets in a separate process so only the server side is measured.
+
+    python -m benchmarks.stream [--server threaded,async] [--viewers 0,1,8,32,64] [--seconds 5] [--fps 30] [--port 5099]
+"""
+import argparse
+import multiprocessing
+import selectors
+import socket
+import threading
+import time
+
+import numpy as np
+
+from src.network.image import AsyncImageStream, ImageStream
+
+SERVERS = {"threaded": ImageStream, "async": AsyncImageStream}
+
+
+def viewers(port, count, stop):
+    selector = selectors.DefaultSelector()
+    for _ in range(count):
+        sock = socket.create_connection(("127.0.0.1", port))
+        sock.sendall(b"GET /video.mjpg HTTP/1.1\r\nHost: bench\r\n\r\n")
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ)
+
+    while not stop.is_set():
+        for key, _ in selector.select(timeout=0.1):
+            try:
+                key.fileobj.recv(1 << 20)
+            except BlockingIOError:
+                pass
+
+    for key in list(selector.get_map().values()):
+        key.fileobj.close()
+
+
+def feed(stream, fps, stop):
+    frames = [
+        np.random.randint(0, 256, (480, 640, 3), dtype=np.uint8) for _ in range(4)
+    ]
+    i = 0
+    while not stop.is_set():
+        stream.input_image(frames[i % len(frames)])
+        i += 1
+        time.sleep(1 / fps)
+
+
+def measure(stream, counts, args, ctx):
+    stream.start()
+    stop_feed = threading.Event()
+    threading.Thread(target=feed, args=(stream, args.fps, stop_feed), daemon=True).start()
+
+    baseline = None
+    for count in counts:
+        stop = ctx.Event()
+        proc = ctx.Process(target=viewers, args=(args.port, count, stop))
+        proc.start()
+        time.sleep(1)
+
+        encoded = stream.encoded
+        sent = sum(c.sent for c in stream.clients)
+        threads = threading.active_count()
+        cpu, wall = time.process_time(), time.perf_counter()
+        time.sleep(args.seconds)
+        cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+        encoded = (stream.encoded - encoded) / wall
+        sent = (sum(c.sent for c in stream.clients) - sent) / wall
+        dropped = sum(c.dropped for c in stream.clients)
+
+        stop.set()
+        proc.join()
+        time.sleep(0.5)
+
+        load = cpu / wall * 100
+        if baseline is None:
+            baseline = load
+        per_viewer = (load - baseline) / count if count else 0.0
+        print(
+            f"{count:3d} viewers: {load:6.1f}% CPU, {per_viewer:5.2f}% per viewer, "
+            f"{threads:3d} threads, {encoded:5.1f} encodes/s, "
+            f"{sent / max(count, 1):5.1f} fps per viewer, {dropped} dropped"
+        )
+
+    stop_feed.set()
+    stream.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--server", default="threaded,async")
+    parser.add_argument("--viewers", default="0,1,8,32,64")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--port", type=int, default=5099)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("fork")
+    counts = [int(n) for n in args.viewers.split(",")]
+
+    for server in args.server.split(","):
+        print(server)
+        stream = SERVERS[server](args.port, host="127.0.0.1", fps=args.fps)
+        measure(stream, counts, args, ctx)
+        time.sleep(0.5)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Latency from ImageStream.input_image() to a decoded frame at a /video.mjpg
+or /frames.ws viewer. Each fed frame carries its index as black/white
+blocks, so any ImageStream version can be measured over MJPEG.
+
+    python -m benchmarks.stream_latency [--transport mjpeg,ws] [--display-fps 20,35,60] [--seconds 5] [--port 5098]
+"""
+import argparse
+import base64
+import json
+import multiprocessing
+import os
+import socket
+import struct
+import time
+
+import cv2 as cv
+import numpy as np
+
+from src.network.image import WS_HEADER, AsyncImageStream
+
+BITS = 20
+BLOCK = 24
+
+
+def stamp(image, index):
+    for bit in range(BITS):
+        value = 255 if index >> bit & 1 else 0
+        image[:BLOCK, bit * BLOCK : (bit + 1) * BLOCK] = value
+
+
+def read_stamp(image):
+    row = image[BLOCK // 2, BLOCK // 2 :: BLOCK][:BITS, 1]
+    return sum(1 << bit for bit, v in enumerate(row) if v > 127)
+
+
+def mjpeg_frames(sock):
+    sock.sendall(b"GET /video.mjpg HTTP/1.1\r\nHost: bench\r\n\r\n")
+    buffer = b""
+    while True:
+        chunk = yield
+        buffer += chunk
+        while True:
+            start = buffer.find(b"\xff\xd8")
+            end = buffer.find(b"\xff\xd9", start + 2)
+            if start < 0 or end < 0:
+                break
+            jpeg, buffer = buffer[start : end + 2], buffer[end + 2 :]
+            image = cv.imdecode(np.frombuffer(jpeg, np.uint8), cv.IMREAD_COLOR)
+            yield read_stamp(image), None
+
+
+def ws_frames(sock):
+    key = base64.b64encode(os.urandom(16)).decode()
+    sock.sendall(
+        f"GET /frames.ws HTTP/1.1\r\nHost: bench\r\nUpgrade: websocket\r\n"
+        f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n"
+        f"Sec-WebSocket-Version: 13\r\n\r\n".encode()
+    )
+    buffer = b""
+    while b"\r\n\r\n" not in buffer:
+        buffer += yield
+    buffer = buffer[buffer.index(b"\r\n\r\n") + 4 :]
+
+    while True:
+        while True:
+            length, offset = (buffer[1] & 0x7F, 2) if len(buffer) >= 2 else (0, 2)
+            if length == 126:
+                offset = 4
+                length = struct.unpack("!H", buffer[2:4])[0] if len(buffer) >= 4 else 1 << 62
+            elif length == 127:
+                offset = 10
+                length = struct.unpack("!Q", buffer[2:10])[0] if len(buffer) >= 10 else 1 << 62
+            if len(buffer) >= 2 and len(buffer) >= offset + length:
+                break
+            buffer += yield
+        message, buffer = buffer[offset : offset + length], buffer[offset + length :]
+
+        _, _, _, _, meta_len, seq, _ = WS_HEADER.unpack_from(message)
+        meta = json.loads(message[WS_HEADER.size : WS_HEADER.size + meta_len])
+        pixels = np.frombuffer(message[WS_HEADER.size + meta_len :], np.uint8)
+        cv.imdecode(pixels, cv.IMREAD_COLOR)
+        yield seq, meta
+
+
+def viewer(port, transport, published, results, stop):
+    sock = socket.create_connection(("127.0.0.1", port))
+    sock.settimeout(0.5)
+    frames = {"mjpeg": mjpeg_frames, "ws": ws_frames}[transport](sock)
+    next(frames)
+    latencies = []
+    seen = set()
+    while not stop.is_set():
+        try:
+            chunk = sock.recv(1 << 20)
+        except socket.timeout:
+            continue
+        if not chunk:
+            break
+        item = frames.send(chunk)
+        while item is not None:
+            index, _ = item
+            if index in seen:
+                latencies.append(-1.0)  # duplicate of a frame already shown
+            else:
+                seen.add(index)
+                latencies.append(time.monotonic() - published[index])
+            item = next(frames)
+    sock.close()
+    results.extend(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transport", default="mjpeg,ws")
+    parser.add_argument("--display-fps", default="20,35,60")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--port", type=int, default=5098)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("fork")
+    manager = ctx.Manager()
+
+    stream = AsyncImageStream(args.port, host="127.0.0.1")
+    stream.start()
+    base = np.random.randint(0, 256, (480, 640, 3), dtype=np.uint8)
+
+    runs = [
+        (transport, int(fps))
+        for transport in args.transport.split(",")
+        for fps in args.display_fps.split(",")
+    ]
+    for transport, fps in runs:
+        published = ctx.Array("d", 1 << BITS, lock=False)
+        results = manager.list()
+        stop = ctx.Event()
+        proc = ctx.Process(
+            target=viewer, args=(args.port, transport, published, results, stop)
+        )
+        proc.start()
+
+        cpu = time.process_time()
+        end = time.monotonic() + args.seconds
+        index = 0
+        while time.monotonic() < end:
+            image = base.copy()
+            stamp(image, index)
+            published[index] = time.monotonic()
+            stream.input_image(image, seq=index, params={"index": index})
+            index += 1
+            time.sleep(1 / fps)
+        cpu = time.process_time() - cpu
+
+        stop.set()
+        proc.join()
+
+        latencies = np.array(results)
+        fresh = latencies[latencies >= 0]
+        print(
+            f"{transport:>5} display {fps:3d} fps: {len(fresh):4d}/{index} frames shown, "
+            f"{np.sum(latencies < 0):4d} duplicates, "
+            f"latency {np.mean(fresh) * 1e3:6.1f} ms mean "
+            f"{np.percentile(fresh, 99) * 1e3:6.1f} ms p99, "
+            f"{cpu / args.seconds * 100:5.1f}% CPU"
+        )
+
+    stream.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,14 +5,15 @@ from src.camera import (
     CamUtils,
     CameraServer,
     CameraFrameWrapper,
+    PreviewRenderer,
 )
 from src.camera.server import CameraParameterHandler
 
 from src.network.static import StaticHTTPServer
-from src.network.image import ImageStream
+from src.network.gallery import GalleryServer
+from src.network.image import AsyncImageStream
 import cv2 as cv
 import dataclasses
-import numpy as np
 import time
 import subprocess
 import os
@@ -34,14 +35,17 @@ servers = [
         CameraServer(camera=cam, callback_capture=cam.capture_and_save, port=4500),
     ),
     ("Camera controls frontend", StaticHTTPServer("./src/client", port=4600)),
-    ("Gallery", StaticHTTPServer("./gallery/", port=4800)),
-    ("Image stream", ImageStream(5000)),
+    ("Gallery", GalleryServer("./gallery/", port=4800)),
+    ("Image stream", AsyncImageStream(5000)),
 ]
 
 for _, server in servers:
     server.start()
+
+# index and thumbnail every capture as it is saved
+cam.writer.on_written.append(servers[2][1].added)
     
-image_display: ImageStream = servers[-1][1]
+image_display: AsyncImageStream = servers[-1][1]
 
 
 os.environ["DISPLAY"] = ":0"
@@ -52,125 +56,56 @@ cv.setWindowProperty("f", cv.WND_PROP_FULLSCREEN, cv.WINDOW_FULLSCREEN)
 print("got there")
 
 prev_darkened = None
+preview = cam.consumer("preview")
+# 480 x 320, preview right aligned with the 170 px hires crop bottom left
+renderer = PreviewRenderer(
+    (480, 320),
+    crop_side=170,
+    align="right",
+    interpolation=cv.INTER_LANCZOS4,
+    font_scale=0.3,
+    line_height=10,
+)
+frame_count = 0
 try:
     while True:
-        # 320 x 480
-        frame: CameraFrameWrapper = cam.capture(-1)
-        lores = cv.resize(frame.frame, (426, 320), interpolation=cv.INTER_LANCZOS4)
+        frame: CameraFrameWrapper = preview.wait_for_frame()
 
         CameraParameterHandler.camera_params = cam._params_latest
 
-        # cross cfg
-        line_length = 8
-        crop_line_lenght = 4
-        thickness = 1
-
-        # get hires crop from frame
-        pad_side = 170
-        margin = 10
-        h, w = frame.frame.shape[:2]
-        cx, cy = w // 2, h // 2
-        crop = frame.frame[
-            cy - pad_side // 2 : cy + pad_side // 2,
-            cx - pad_side // 2 : cx + pad_side // 2,
-        ]
-
-        # get most contrast color
-        crop_color = np.mean(crop, axis=(0, 1)).astype(np.uint8)
-
-        r, g, b = crop_color[0], crop_color[1], crop_color[2]
-        luminance = 0.299 * r + 0.587 * g + 0.114 * b
-
-        if luminance > 127:
-            color = (0, 0, 0)
-        else:
-            color = (255, 255, 255)
-
-        # Calculate sharpnesss
-        crop_gray = cv.cvtColor(crop, cv.COLOR_BGR2GRAY)
-        g1 = cv.blur(crop_gray, (13, 13))
-        edge_map = cv.absdiff(crop_gray, g1)
-        sharpness = np.mean(edge_map)
-
-        # draw cross on crop
-        h, w = crop.shape[:2]
-        cx, cy = w // 2, h // 2
-        cv.line(
-            crop,
-            (cx - crop_line_lenght, cy),
-            (cx + crop_line_lenght, cy),
-            color,
-            thickness,
+        sharpness = renderer.draw(frame)
+        hz = cam.frames.fps()
+
+        lores = renderer.draw_text(
+            [
+                f"{address}",
+                f"sharpness {sharpness:.1f}",
+                f"gain {frame.metadata.analogue_gain:.1f}",
+                f"shutter {CamUtils.microseconds_to_seconds(frame.metadata.exposure_time):.7f}",
+                f"lux: {frame.runtime_metadata.lux}",
+                f"temperature: {frame.runtime_metadata.temperature}",
+                f"frames per second: {hz:3.1f}",
+            ]
         )
-        cv.line(
-            crop,
-            (cx, cy - crop_line_lenght),
-            (cx, cy + crop_line_lenght),
-            color,
-            thickness,
-        )
-
-        # draw cross and cxcy
-        h, w = lores.shape[:2]
-        cx, cy = w // 2, h // 2
 
-        cv.line(lores, (cx - line_length, cy), (cx + line_length, cy), color, thickness)
-        cv.line(lores, (cx, cy - line_length), (cx, cy + line_length), color, thickness)
-
-        # pad left with black
-        lores = cv.copyMakeBorder(
-            lores, 0, 0, 480 - 426, 0, cv.BORDER_CONSTANT, value=[0, 0, 0]
+        # the stream encodes on its own thread, the renderer reuses lores
+        image_display.input_image(
+            renderer.snapshot(), seq=frame.seq, timestamp=frame.timestamp, params=frame.metadata
         )
-
-        # paste gires crop to lores
-        lores_h, lores_w = lores.shape[:2]
-        lores[
-            lores_h - pad_side - margin : lores_h - margin, margin : margin + pad_side
-        ] = crop
-
-        # text
-        font = cv.FONT_HERSHEY_SIMPLEX
-        font_scale = 0.3
-        shadow_offset = 1
-        line_height = 10
-        start_x = 10
-        start_y = 30
-
-        hz = len(cam.frames._list) / cam.frames._capacity
-
-        text_items = [
-            f"{address}",
-            f"sharpness {sharpness:.1f}",
-            f"gain {frame.metadata.analogue_gain:.1f}",
-            f"shutter {CamUtils.microseconds_to_seconds(frame.metadata.exposure_time):.7f}",
-            f"lux: {frame.runtime_metadata.lux}",
-            f"temperature: {frame.runtime_metadata.temperature}",
-            f"frames per second: {hz:3.1f}",
-        ]
-
-        for i, text in enumerate(text_items):
-            y = start_y + (i * line_height)
-            cv.putText(
-                lores,
-                text,
-                (start_x + shadow_offset, y + shadow_offset),
-                font,
-                font_scale,
-                (0, 0, 0),
-                2,
-            )
-            cv.putText(lores, text, (start_x, y), font, font_scale, (255, 255, 255), 1)
-
-        image_display.input_image(lores)
         cv.imshow("f", lores)
         cv.waitKey(100)
 
+        frame_count += 1
+        if frame_count % 100 == 0:
+            print(f"Preview stages (ms): {renderer.timing_summary()}")
+
 except KeyboardInterrupt:
     cv.destroyAllWindows()
 
 finally:
     for _, server in servers:
         server.stop()
+    cam.close()
 
 """ 
 Todo: 
@@ -182,11 +117,11 @@ Todo:
         [low priority] WebRTC for that without compression. (since it uses udp streams under the hood)
     [mid priority] Camera server should set parameters per-parameter 
     [mid priority] There should be link to gallery on controlls page and last frame preview too. 
-    [mid priority] Gallery should have images top-to-bottom new ones, with pagination on view. (currently list of links to images with top are older.)
-    [low priority] Add EXIF to frames or use picamera helpers.
     [high priority] auto ip adress in js 
     
 Done:
+    [done] Add EXIF to frames (PNG tEXt / JPEG EXIF, plus index.jsonl per gallery)
+    [done] Gallery should have images top-to-bottom new ones, with pagination on view. (gallery.html, served at the GalleryServer root on :4800)
     [skip] How to get RAW images. (not so simple) (need for noise pattern and more natural colors).
         # low since offed denoising and this already looks ok 
     [done] Calculate good lux value and make helper that will allow not to overbrighten image
@@ -116,17 +116,6 @@ def touch_monitor_thread(touch_device, on_touch_callback):
     finally:
         print("Touch monitor thread exiting")
 
-def frame_to_framebuffer_format(frame, width, height):
-    if frame.shape[1] != width or frame.shape[0] != height:
-        frame = cv.resize(frame, (width, height), interpolation=cv.INTER_NEAREST)
-    
-    bgra = np.zeros((height, width, 4), dtype=np.uint8)
-    bgra[:, :, :3] = frame
-    bgra[:, :, 3] = 255
-    
-    return bgra
-
-
 if not os.path.exists("./galleries/"):
     os.makedirs("./galleries/")
 
@@ -151,10 +140,12 @@ def main():
         CamUtils,
         CameraServer,
         CameraFrameWrapper,
+        PreviewRenderer,
     )
     from src.camera.server import CameraParameterHandler
     from src.network.static import StaticHTTPServer
-    from src.network.image import ImageStream
+    from src.network.gallery import GalleryServer
+    from src.network.image import AsyncImageStream
     import subprocess
     
     try:
@@ -181,14 +172,16 @@ def main():
                 CameraServer(camera=cam, callback_capture=cam.capture_and_save, port=4500),
             ),
             ("Camera controls frontend", StaticHTTPServer("./src/client", port=4600)),
-            ("Gallery", StaticHTTPServer("./galleries/", port=4800)),
-            ("Image stream", ImageStream(5000)),
+            ("Gallery", GalleryServer("./galleries/", port=4800)),
+            ("Image stream", AsyncImageStream(5000)),
         ]
         
         for name, server in servers:
             print(f"Starting server: {name}")
             server.start()
         
+        # index and thumbnail every capture as it is saved
+        cam.writer.on_written.append(servers[2][1].added)
         image_display = servers[-1][1]
         
         
@@ -252,6 +245,18 @@ def main():
         
         test_simple_colors(fbmap, width, height)
         
+        preview = cam.consumer("preview")
+        # composed straight into the framebuffer's BGRA layout
+        renderer = PreviewRenderer(
+            (width, height),
+            crop_side=350,
+            align="center",
+            interpolation=cv.INTER_NEAREST,
+            font_scale=0.38,
+            line_height=14,
+            channels=4,
+            sharpness=False,
+        )
         while True:
             current_time = time.time()
             elapsed_since_last_frame = current_time - last_frame_time
@@ -262,84 +267,15 @@ def main():
             
             last_frame_time = time.time()
             
-            frame: CameraFrameWrapper = cam.capture(-1)
+            frame: CameraFrameWrapper = preview.wait_for_frame()
             
             if is_touched:
                 print(f"Processing touch at ({last_touch_x}, {last_touch_y}) - capturing and saving image")
                 cam.capture_and_save(output_path=current_gallery)
                 is_touched = False
             
-            aspect_ratio = frame.frame.shape[1] / frame.frame.shape[0]
-            new_width = int(height * aspect_ratio)
-            lores = cv.resize(frame.frame, (new_width, height), interpolation=cv.INTER_NEAREST)
-            
-            if new_width < width:
-                pad_left = (width - new_width) // 2
-                pad_right = width - new_width - pad_left
-                lores = cv.copyMakeBorder(
-                    lores, 0, 0, pad_left, pad_right, cv.BORDER_CONSTANT, value=[0, 0, 0]
-                )
-            elif new_width > width:
-                start_x = (new_width - width) // 2
-                lores = lores[:, start_x:start_x + width]
-            
-            pad_side = 350
-            margin = 10
-            h, w = frame.frame.shape[:2]
-            cx, cy = w // 2, h // 2
-            crop = frame.frame[
-                cy - pad_side // 2 : cy + pad_side // 2,
-                cx - pad_side // 2 : cx + pad_side // 2,
-            ]
-            
-            line_length = 8
-            crop_line_length = 4
-            thickness = 1
-            
-            crop_color = np.mean(crop, axis=(0, 1)).astype(np.uint8)
-            r, g, b = crop_color[0], crop_color[1], crop_color[2]
-            luminance = 0.299 * r + 0.587 * g + 0.114 * b
-            
-            if luminance > 127:
-                color = (0, 0, 0)
-            else:
-                color = (255, 255, 255)
-            
-            h, w = crop.shape[:2]
-            cx, cy = w // 2, h // 2
-            cv.line(
-                crop,
-                (cx - crop_line_length, cy),
-                (cx + crop_line_length, cy),
-                color,
-                thickness,
-            )
-            cv.line(
-                crop,
-                (cx, cy - crop_line_length),
-                (cx, cy + crop_line_length),
-                color,
-                thickness,
-            )
-            
-            h, w = lores.shape[:2]
-            cx, cy = w // 2, h // 2
-            cv.line(lores, (cx - line_length, cy), (cx + line_length, cy), color, thickness)
-            cv.line(lores, (cx, cy - line_length), (cx, cy + line_length), color, thickness)
-            
-            lores_h, lores_w = lores.shape[:2]
-            lores[
-                lores_h - pad_side - margin : lores_h - margin, margin : margin + pad_side
-            ] = crop
-            
-            font = cv.FONT_HERSHEY_SIMPLEX
-            font_scale = 0.38
-            shadow_offset = 1
-            line_height = 14
-            start_x = 10
-            start_y = 30
-            
-            hz = len(cam.frames._list) / cam.frames._capacity
+            renderer.draw(frame)
+            hz = cam.frames.fps()
             
             text_items = [
                 f"{address}",
@@ -352,32 +288,26 @@ def main():
                 text_items.append(f"Touch: enabled ({last_touch_x},{last_touch_y})")
             else:
                 text_items.append("Touch: disabled")
-                
-            for i, text in enumerate(text_items):
-                y = start_y + (i * line_height)
-                cv.putText(
-                    lores,
-                    text,
-                    (start_x + shadow_offset, y + shadow_offset),
-                    font,
-                    font_scale,
-                    (0, 0, 0),
-                    2,
-                )
-                cv.putText(lores, text, (start_x, y), font, font_scale, (255, 255, 255), 1)
             
-            image_display.input_image(lores)
+            fb_frame = renderer.draw_text(text_items)
             
-            fb_frame = frame_to_framebuffer_format(lores, width, height)
+            # the stream encodes on its own thread, the renderer reuses fb_frame
+            image_display.input_image(
+                renderer.snapshot(), seq=frame.seq, timestamp=frame.timestamp, params=frame.metadata
+            )
             
             fbmap.seek(0)
-            fbmap.write(fb_frame.tobytes())
+            fbmap.write(fb_frame)
             
             frame_count += 1
             
             if frame_count % 30 == 0:
                 elapsed = time.time() - start_time
                 print(f"FPS: {frame_count/elapsed:.1f}, Running time: {elapsed:.1f}s")
+                print(f"Consumers: {cam.frames.consumer_stats()}")
+                print(f"Callback latency: {cam.callback_latency.summary()}")
+                print(f"Gallery writer: {cam.writer.stats()}")
+                print(f"Preview stages (ms): {renderer.timing_summary()}")
     
     except KeyboardInterrupt:
         print("Interrupted by user")
@@ -399,6 +329,7 @@ def main():
         try:
             for _, server in servers:
                 server.stop()
+            cam.close()
         except:
             pass
         
@@ -2,3 +2,9 @@ from .types import CameraFrameWrapper, CameraParameters, CameraParameter
 from .camera import Camera
 from .utils import CamUtils, Config
 from .server import CameraServer
+from .control_worker import ControlUpdateWorker
+from .backend import SyntheticCamera
+from .writer import GalleryWriter
+from .raw import RawWriter
+from .recorder import Recorder
+from .preview import PreviewRenderer
@@ -0,0 +1,230 @@
+import contextlib
+import logging
+import threading
+import time
+import types
+
+import cv2 as cv
+import numpy as np
+
+try:
+    import picamera2 as pc2
+    from libcamera import controls
+except ImportError:
+    pc2 = None
+    controls = None
+
+logger = logging.getLogger("camera-backend")
+
+
+# imx477 sensor modes, see README
+SENSOR_MODES = [
+    {"format": "SRGGB10_CSI2P", "size": (1332, 990), "fps": 120.05},
+    {"format": "SRGGB12_CSI2P", "size": (2028, 1080), "fps": 50.03},
+    {"format": "SRGGB12_CSI2P", "size": (2028, 1520), "fps": 40.01},
+    {"format": "SRGGB12_CSI2P", "size": (4056, 3040), "fps": 10.00},
+]
+
+
+class SyntheticRequest:
+    def __init__(self, arrays, metadata):
+        self._arrays = arrays
+        self._metadata = metadata
+
+    def make_array(self, name):
+        return self._arrays[name]
+
+    def get_metadata(self):
+        return dict(self._metadata)
+
+
+class SyntheticCamera:
+    camera_controls = {
+        "AnalogueGain": (1.0, 22.26, 1.0),
+        "ExposureTime": (0, 66666, 20000),
+        "ColourGains": (0.0, 32.0, None),
+    }
+
+    # libcamera applies controls a couple of frames after they are requested
+    control_delay_frames = 2
+
+    def __init__(self):
+        self.pre_callback = None
+        self.sensor_modes = SENSOR_MODES
+        self._config = None
+        self._buffers = {}
+        self._controls = {
+            "AnalogueGain": 1.0,
+            "ExposureTime": 10000,
+            "ColourGains": (2.0, 2.0),
+            "AeEnable": True,
+            "AwbEnable": True,
+        }
+        self._pending = []
+        self._frame_index = 0
+        self._thread = None
+        self._running = False
+        self._lock = threading.Lock()
+
+    def set_logging(self, level=None):
+        pass
+
+    def create_still_configuration(self, main=None, lores=None, raw=None, **kwargs):
+        main = {"format": "BGR888", "size": (2028, 1520), **(main or {})}
+        cfg = {"main": main, "lores": None, "raw": None, "controls": {}}
+        if lores is not None:
+            cfg["lores"] = {"format": "BGR888", "size": (640, 480), **lores}
+        if raw is not None:
+            mode = self.sensor_mode(raw.get("size", main["size"]))
+            cfg["raw"] = {"format": mode["format"], "size": mode["size"], **raw}
+        return cfg
+
+    def sensor_mode(self, size):
+        for mode in self.sensor_modes:
+            if mode["size"][0] >= size[0] and mode["size"][1] >= size[1]:
+                return mode
+        return self.sensor_modes[-1]
+
+    def configure(self, cfg):
+        if self._running:
+            raise RuntimeError("Camera must be stopped before configuring")
+        self._config = cfg
+        self._buffers = {}
+        for name in ("main", "lores"):
+            if cfg.get(name):
+                w, h = cfg[name]["size"]
+                x = np.linspace(0, 255, w, dtype=np.float32)
+                y = np.linspace(0, 255, h, dtype=np.float32)[:, None]
+                base = np.empty((h, w, 3), dtype=np.uint8)
+                base[..., 0] = x
+                base[..., 1] = y
+                base[..., 2] = (x + y) / 2
+                self._buffers[name] = (base, np.empty_like(base))
+
+        self._raw = None
+        if cfg.get("raw"):
+            # static sensor noise is enough for the raw paths
+            w, h = cfg["raw"]["size"]
+            bits = 10 if cfg["raw"]["format"].startswith("SRGGB10") else 12
+            stride = (w * bits // 8 + 63) // 64 * 64
+            cfg["raw"]["stride"] = stride
+            self._raw = np.random.randint(0, 256, (h, stride), dtype=np.uint8)
+
+    def camera_configuration(self):
+        return self._config
+
+    def set_controls(self, new_controls):
+        with self._lock:
+            self._pending.append(
+                (self._frame_index + self.control_delay_frames, dict(new_controls))
+            )
+
+    def start(self):
+        if self._running:
+            return
+        if self._config is None:
+            self.configure(self.create_still_configuration())
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+
+    def _apply_pending(self):
+        with self._lock:
+            due = [c for at, c in self._pending if at <= self._frame_index]
+            self._pending = [p for p in self._pending if p[0] > self._frame_index]
+        for new_controls in due:
+            # manual values switch the matching algorithm off, as in libcamera
+            if "ExposureTime" in new_controls or "AnalogueGain" in new_controls:
+                new_controls.setdefault("AeEnable", False)
+            if "ColourGains" in new_controls:
+                new_controls.setdefault("AwbEnable", False)
+            self._controls.update(new_controls)
+
+    def _metadata(self, frame_duration):
+        c = self._controls
+        auto = c.get("AeEnable", False)
+        # as on the sensor, the exposure cannot outlast the longest frame
+        longest = c.get("FrameDurationLimits", (0, 1_000_000_000))[1]
+        return {
+            "AnalogueGain": 2.0 if auto else float(c["AnalogueGain"]),
+            "ExposureTime": 16000 if auto else min(int(c["ExposureTime"]), longest),
+            "ColourGains": (
+                (2.0, 2.0) if c.get("AwbEnable") else tuple(c["ColourGains"])
+            ),
+            "Lux": 400.0,
+            "ColourTemperature": 5000,
+            "SensorTimestamp": time.monotonic_ns(),
+            "SensorBlackLevels": (4096, 4096, 4096, 4096),
+            "ColourCorrectionMatrix": (1.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 1.0),
+            "FrameDuration": int(frame_duration * 1_000_000),
+        }
+
+    def _render(self):
+        arrays = {}
+        for name, (base, out) in self._buffers.items():
+            np.copyto(out, base)
+            h, w = out.shape[:2]
+            side = max(8, h // 8)
+            x = (self._frame_index * 4) % max(1, w - side)
+            top = h // 2 - side // 2
+            cv.rectangle(out, (x, top), (x + side, top + side), (255, 255, 255), -1)
+            arrays[name] = out
+        if self._raw is not None:
+            arrays["raw"] = self._raw
+        return arrays
+
+    def _run(self):
+        mode = self.sensor_mode(self._config["main"]["size"])
+        frame_duration = 1 / mode["fps"]
+        next_frame = time.monotonic()
+        while self._running:
+            self._apply_pending()
+            request = SyntheticRequest(self._render(), self._metadata(frame_duration))
+            if self.pre_callback is not None:
+                try:
+                    self.pre_callback(request)
+                except Exception as e:
+                    logger.error(f"Error in pre_callback: {e}")
+            self._frame_index += 1
+
+            next_frame += frame_duration
+            delay = next_frame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_frame = time.monotonic()
+
+
+def mapped_array(request, stream):
+    if isinstance(request, SyntheticRequest):
+        mapped = types.SimpleNamespace(array=request.make_array(stream))
+        return contextlib.nullcontext(mapped)
+    return pc2.MappedArray(request, stream)
+
+
+def create_backend():
+    if pc2 is None:
+        logger.warning("picamera2 not available, using synthetic camera")
+        return SyntheticCamera()
+    return pc2.Picamera2()
+
+
+def probe_camera_controls():
+    if pc2 is None:
+        return SyntheticCamera.camera_controls
+
+    camera = pc2.Picamera2()
+    camera.set_logging(level=logging.CRITICAL)
+    camera.configure(camera.create_still_configuration(raw={}))
+    camera_controls = camera.camera_controls
+    camera.close()
+    return camera_controls
@@ -2,27 +2,99 @@ import os
 
 os.environ["LIBCAMERA_LOG_LEVELS"] = "3"
 
-from .types import CameraFrameWrapper, CameraParameters, RuntimeFrameMetadata
-from .utils import FrameList, Config, CamUtils
+from .types import (
+    BurstResult,
+    CameraFrameWrapper,
+    CameraParameters,
+    ControlChange,
+    LazyFrame,
+    RuntimeFrameMetadata,
+)
+from .utils import FrameList, FrameConsumer, Config, CamUtils, RollingStats
+from .backend import controls, create_backend, mapped_array
+from .writer import GalleryWriter
+from .metadata import capture_metadata
+from .raw import RawWriter, parse_format
+from .recorder import Recorder, VideoEncoder
 
-from libcamera import controls
-
-import picamera2 as pc2
 import threading
+import dataclasses
+import logging
 import numpy as np
-import cv2 as cv
 import time
 
+from collections import OrderedDict
+from concurrent.futures import Future, wait
 from datetime import datetime
+from typing import Iterable, List, Optional
+
+
+logger = logging.getLogger("camera")
+
+# what Picamera2's still configuration starts with, the sensor clamps it to
+# the mode's real range
+STILL_FRAME_DURATION_LIMITS = (100, 1_000_000_000)
+
+
+class ChangeExpiredError(KeyError):
+    # a change id that existed but has left the history
+    def __init__(self, change_id: int):
+        super().__init__(f"Control change {change_id} expired")
+        self.change_id = change_id
+
+
+class ChangeTimeoutError(TimeoutError):
+    # a change that never showed up in frame metadata in time
+    def __init__(self, change_id: int):
+        super().__init__(f"Control change {change_id} not applied in time")
+        self.change_id = change_id
 
 
 class Camera:
-    def __init__(self):
+    def __init__(self, backend=None, lores_size=(640, 480)):
         self.cfg = Config()
-        self._cam = pc2.Picamera2()
+        # first, so the worker process forks before the camera and ring exist
+        self.raw_writer = RawWriter()
+        self.video_encoder = VideoEncoder()
+        self._cam = backend if backend is not None else create_backend()
         self._cam.pre_callback = self._on_frame
+        self._lores_size = lores_size
+        # probed once while the camera is idle, Picamera2 reconfigures the
+        # sensor to list them
+        self._sensor_modes = list(getattr(self._cam, "sensor_modes", None) or ())
 
         self.frames = FrameList(2)
+        self.writer = GalleryWriter()
+        self.recorder = Recorder(self, self.video_encoder)
+        self.callback_latency = RollingStats()
+        self.reconfigure_latency = RollingStats()
+        self._controls_active = {}
+        self._active_layout = None
+
+        # frames between set_controls and the first frame showing them,
+        # libcamera's delay for exposure and gain on the imx477
+        self.control_delay_frames = getattr(self._cam, "control_delay_frames", 2)
+        # requested control changes, matched against per-frame metadata
+        self.change_timeout_frames = 30
+        # every slider request reserves an id, so this is sized for a long
+        # drag (tens of requests per second for tens of seconds), not for
+        # the worker's one apply per frame
+        self.change_history = 2048
+        # best-of-burst scores a best_crop square at the centre, every
+        # best_step-th pixel
+        self.best_crop = 256
+        self.best_step = 2
+        self._changes: "OrderedDict[int, ControlChange]" = OrderedDict()
+        self._pending_changes = []
+        self._changes_lock = threading.Lock()
+        self._last_change_id = 0
+
+        self._raw_config = None
+        # of the newest frame in microseconds, what the sensor actually runs
+        # at under the current FrameDurationLimits
+        self._frame_duration = None
+        self._raw_requests = []
+        self._raw_lock = threading.Lock()
 
         self._params_latest = CameraParameters(
             1, (2.25, 3.25), CamUtils.seconds_to_microseconds(1 / 64)
@@ -30,21 +102,32 @@ class Camera:
         self._params_request = CameraParameters(
             7, (2.25, 3.25), CamUtils.seconds_to_microseconds(1 / 64)
         )
-        self._frame_not_captured = threading.Event()
         self.reconfigure(self._params_request)
 
     def _on_frame(self, request):
-        with pc2.MappedArray(request, "main") as m:
-            frame = np.array(m.array, copy=False)
-            frame = cv.cvtColor(frame, cv.COLOR_BGR2RGB)
+        started = time.perf_counter()
+        with mapped_array(request, "main") as m:
+            h, w = m.array.shape[:2]
+            if self.frames.resolution != (w, h):
+                self.frames.resize((w, h), self.frames.lores_resolution)
+
+            # one memcpy into the ring buffer slot, colour conversion happens
+            # lazily on the consumer side (CameraFrameWrapper.image)
+            np.copyto(self.frames.next_slot(), m.array)
+
+            lores_slot = self.frames.next_lores_slot()
+            if lores_slot is not None:
+                with mapped_array(request, "lores") as l:
+                    np.copyto(lores_slot, l.array)
 
             frame_metadata = request.get_metadata()
+            self._frame_duration = frame_metadata.get("FrameDuration")
 
             params = CameraParameters(
                 analogue_gain=frame_metadata["AnalogueGain"],
                 exposure_time=frame_metadata["ExposureTime"],
                 colour_gains=frame_metadata["ColourGains"],
-                resolution=frame.shape[:2][::-1],
+                resolution=(w, h),
             )
 
             runtime_meta = RuntimeFrameMetadata(
@@ -52,82 +135,526 @@ class Camera:
                 temperature=frame_metadata["ColourTemperature"],
             )
 
-            self.frames.add(
-                CameraFrameWrapper(
-                    frame=frame,
-                    metadata=params,
-                    timestamp=time.monotonic(),
-                    runtime_metadata=runtime_meta,
-                )
-            )
+            self.frames.commit(params, runtime_meta, time.monotonic(), order="bgr")
 
             self._params_latest = params
-            self._frame_not_captured.set()
+            if self._raw_requests:
+                self._grab_raw(request, frame_metadata)
+            if self._pending_changes:
+                self._match_changes(params, self.frames.seq)
 
-    def set_auto(self):
-        self._cam.stop()
-        self._cam.set_controls({
-                "AeEnable": True,
-                "AwbEnable": True,
-        })
-        self._cam.start()
-    
-        
-    def reconfigure(self, params: CameraParameters):
-        self._params_request = params
+        self.callback_latency.add(time.perf_counter() - started)
 
-        self._cam.stop()
-        cfg = self._cam.create_still_configuration(
-            main={"size": params.resolution}, raw={"size": params.resolution}
+    def set_auto(self, change_ids: Iterable[int] = ()) -> int:
+        self._params_request.AeEnable = True
+        self._params_request.AwbEnable = True
+        change_id = self._track_changes(change_ids, self._params_request)
+        self._apply_controls({"AeEnable": True, "AwbEnable": True})
+        return change_id
+
+    def _grab_raw(self, request, frame_metadata):
+        with self._raw_lock:
+            pending, self._raw_requests = self._raw_requests, []
+
+        # only the memcpy happens here, unpacking and DNG writing run in the
+        # raw writer process
+        with mapped_array(request, "raw") as m:
+            raw = m.array.copy()
+        fmt, size = self._raw_config["format"], self._raw_config["size"]
+
+        # called right after commit, the newest frame is this request's
+        metadata = capture_metadata(self.frames.by_seq(self.frames.seq))
+        for path, result in pending:
+            written = self.raw_writer.submit(path, raw, fmt, size, frame_metadata)
+            written.add_done_callback(
+                lambda f, result=result: self._forward(f, result, metadata)
+            )
+
+    def _forward(self, source: Future, target: Future, metadata=None):
+        if source.exception() is not None:
+            target.set_exception(source.exception())
+        else:
+            if metadata is not None:
+                self.writer.index.append(source.result(), metadata)
+            target.set_result(source.result())
+
+    def capture_raw(self, output_path="gallery/") -> Future:
+        # raw buffers live only as long as their request, so this takes the
+        # next frame's raw stream
+        path = os.path.join(output_path, self._capture_id(self.frames.seq + 1) + ".dng")
+        result = Future()
+        try:
+            parse_format(self._raw_config["format"])
+        except ValueError as e:
+            result.set_exception(e)
+            return result
+        with self._raw_lock:
+            self._raw_requests.append((path, result))
+        return result
+
+    def reserve_change(self) -> ControlChange:
+        with self._changes_lock:
+            self._last_change_id += 1
+            change = ControlChange(self._last_change_id)
+            self._changes[change.id] = change
+            while len(self._changes) > self.change_history:
+                self._changes.popitem(last=False)
+        return change
+
+    def _track_changes(self, change_ids: Iterable[int], params: CameraParameters):
+        change_ids = list(change_ids) or [self.reserve_change().id]
+        target = dataclasses.replace(params)
+        with self._changes_lock:
+            for change_id in change_ids:
+                change = self._changes.get(change_id)
+                if change is None:
+                    continue
+                change.target = target
+                change.requested_seq = self.frames.seq
+                self._pending_changes.append(change)
+        return change_ids[-1]
+
+    @staticmethod
+    def _close(value, target, rel_tol, abs_tol=0.0):
+        return abs(value - target) <= max(abs_tol, rel_tol * abs(target))
+
+    def _matches(self, target: CameraParameters, params: CameraParameters):
+        if target.AeEnable:
+            # nothing fixed to compare against, the algorithms take over
+            return True
+        return (
+            self._close(params.exposure_time, target.exposure_time, 0.02, 100)
+            and self._close(params.analogue_gain, target.analogue_gain, 0.02)
+            and all(
+                self._close(a, b, 0.01)
+                for a, b in zip(params.colour_gains, target.colour_gains)
+            )
         )
-        self._cam.configure(cfg)
 
+    def _match_changes(self, params: CameraParameters, seq: int):
+        with self._changes_lock:
+            pending = self._pending_changes
+            matched = -1
+            for i, change in enumerate(pending):
+                if seq > change.requested_seq and self._matches(change.target, params):
+                    matched = i
+
+            still_pending = []
+            for i, change in enumerate(pending):
+                if i <= matched:
+                    # a match also settles the older changes it superseded
+                    change.effective_seq = seq
+                    change.applied.set()
+                elif seq - change.requested_seq > self.change_timeout_frames:
+                    logger.warning(f"control change {change.id} never showed up in metadata")
+                    change.applied.set()
+                else:
+                    still_pending.append(change)
+            self._pending_changes = still_pending
+
+    def _controls_for(self, params: CameraParameters):
         exposure_time = (
             int(params.exposure_time)
             if isinstance(params.exposure_time, float)
             else params.exposure_time
         )
 
-        camcontrols = {
+        camcontrols = {}
+        if controls is not None:
+            camcontrols.update({
                 # AwbModeEnum
                 "NoiseReductionMode": controls.draft.NoiseReductionModeEnum.HighQuality,
-        }
+            })
         if params.AeEnable:
             camcontrols.update({
                 "AeEnable": True,
                 "AwbEnable": True,
-                "AeMeteringMode": controls.AeMeteringModeEnum.CentreWeighted,
-                "AeExposureMode": controls.AeExposureModeEnum.Long,  # Long exposure mode helps in low light
-                "AwbMode": controls.AwbModeEnum.Auto,
                 "ExposureValue": 4.0,
                 "FrameDurationLimits": (33333, 100000)  
             })
+            if controls is not None:
+                camcontrols.update({
+                    "AeMeteringMode": controls.AeMeteringModeEnum.CentreWeighted,
+                    "AeExposureMode": controls.AeExposureModeEnum.Long,  # Long exposure mode helps in low light
+                    "AwbMode": controls.AwbModeEnum.Auto,
+                })
         else: 
             camcontrols = {**camcontrols,
+                "AeEnable": False,
+                "AwbEnable": False,
+                # live updates only send changed keys, so leaving auto mode
+                # has to undo its limits: AE's FrameDurationLimits would cap
+                # the manual exposure at 100 ms
+                "ExposureValue": 0.0,
+                "FrameDurationLimits": STILL_FRAME_DURATION_LIMITS,
                 "ExposureTime": exposure_time,
                 "AnalogueGain": params.analogue_gain,
-                "ColourGains": params.colour_gains
+                "ColourGains": tuple(params.colour_gains)
             }
-            
-            print("AAAA ")
-        print(camcontrols)
-        self._cam.set_controls(
-            camcontrols   
+        return camcontrols
+
+    def _stream_layout(self, params: CameraParameters):
+        return tuple(params.resolution), self._lores_size
+
+    def _restart(self, params: CameraParameters, camcontrols):
+        self._cam.stop()
+        lores = None
+        if self._lores_size is not None:
+            lores = {"size": self._lores_size, "format": "BGR888"}
+        cfg = self._cam.create_still_configuration(
+            main={"size": params.resolution},
+            lores=lores,
+            raw=self._raw_stream(params.resolution),
+        )
+        self._cam.configure(cfg)
+        self._raw_config = self._cam.camera_configuration()["raw"]
+        self.frames.resize(
+            cfg["main"]["size"],
+            cfg["lores"]["size"] if lores is not None else None,
+            fps=self._mode_fps(self._raw_config),
         )
 
+        self._cam.set_controls(camcontrols)
+        self._controls_active = dict(camcontrols)
+        self._active_layout = self._stream_layout(params)
         self._cam.start()
 
+    def _raw_stream(self, size) -> dict:
+        # an explicit Bayer format from the sensor mode that covers size;
+        # without one a Pi 5 hands out its compressed PISP_COMP1 raw, which
+        # write_dng cannot unpack
+        covering = [
+            m for m in self._sensor_modes
+            if m["size"][0] >= size[0] and m["size"][1] >= size[1]
+        ]
+        if covering:
+            mode = min(covering, key=lambda m: m["size"][0] * m["size"][1])
+        elif self._sensor_modes:
+            mode = max(self._sensor_modes, key=lambda m: m["size"][0] * m["size"][1])
+        else:
+            return {"size": size}
+        return {"size": tuple(mode["size"]), "format": str(mode["format"])}
+
+    def frame_rate(self) -> Optional[float]:
+        """
+        The rate frames arrive at from the sensor, before any consumer drops
+        them. From the newest frame's FrameDuration, the sensor mode's rate
+        until there is one.
+        """
+        if self._frame_duration:
+            return 1_000_000 / self._frame_duration
+        return self._mode_fps(self._raw_config)
+
+    def _mode_fps(self, raw_config) -> Optional[float]:
+        # the configured sensor mode's maximum rate, sizes the frame ring
+        if not raw_config:
+            return None
+        size = tuple(raw_config["size"])
+        for mode in self._sensor_modes:
+            if tuple(mode["size"]) == size:
+                return float(mode["fps"])
+        return None
+
+    def _apply_controls(self, camcontrols):
+        changed = {
+            k: v for k, v in camcontrols.items() if self._controls_active.get(k) != v
+        }
+        if "AeEnable" in changed or "AwbEnable" in changed:
+            # the algorithms moved the values since we last set them
+            changed = dict(camcontrols)
+        if changed:
+            self._cam.set_controls(changed)
+            self._controls_active.update(changed)
+        return changed
+
+    def reconfigure(
+        self, params: CameraParameters, change_ids: Iterable[int] = ()
+    ) -> int:
+        started = time.perf_counter()
+        self._params_request = params
+        camcontrols = self._controls_for(params)
+        change_id = self._track_changes(change_ids, params)
+
+        if self._active_layout != self._stream_layout(params):
+            self._restart(params, camcontrols)
+            changed, mode = camcontrols, "restart"
+        else:
+            # control-only change, the running pipeline picks it up
+            changed, mode = self._apply_controls(camcontrols), "live"
+
+        elapsed = time.perf_counter() - started
+        self.reconfigure_latency.add(elapsed)
+        logger.debug(f"reconfigure ({mode}, {elapsed * 1000:.1f} ms): {changed}")
+        return change_id
+
     def capture(self, seconds_ago=0.1):
         if seconds_ago == -1:
-            self._frame_not_captured.wait()
-            self._frame_not_captured.clear()
+            # one-shot: the next frame, no consumer left behind per request
+            return self.frames.wait_for_frame(self.frames.seq)
 
         return self.frames.get(seconds_ago)
 
-    def capture_and_save(self, output_path="gallery/", seconds_ago=0.1):
+    def capture_after(
+        self, change_id: int, timeout=2.0
+    ) -> Optional[CameraFrameWrapper]:
+        change = self._changes.get(change_id)
+        if change is None:
+            if 0 < change_id <= self._last_change_id:
+                raise ChangeExpiredError(change_id)
+            raise KeyError(f"Unknown control change {change_id}")
+        if not change.applied.wait(timeout) or change.effective_seq is None:
+            return None
+
+        frame = self.frames.by_seq(change.effective_seq)
+        if frame is None:
+            # already overwritten, every newer frame carries the change too
+            frame = self.frames.wait_for_frame(change.effective_seq - 1)
+        return frame
+
+    def consumer(self, name: str) -> FrameConsumer:
+        return self.frames.consumer(name)
+
+    def pin(self, frame: CameraFrameWrapper) -> Optional[LazyFrame]:
+        # one memcpy out of the ring slot, conversion happens on the reader;
+        # None if the producer lapped the slot while it was being copied
+        pinned = LazyFrame(frame.image.raw.copy(), frame.image.order)
+        if not self.frames.is_intact(frame):
+            logger.warning(f"frame {frame.seq} was overwritten while being copied")
+            return None
+        return pinned
+
+    def _next_frames(self, count: int):
+        # the next count frames in seq order, None for every one the
+        # producer lapped before it was reached or that never came; the
+        # ring absorbs the caller's back-pressure until it is lapped
+        seq = self.frames.seq
+        for i in range(count):
+            if self.frames.wait_for_frame(seq, timeout=1.0) is None:
+                yield from [None] * (count - i)
+                return
+            seq += 1
+            yield self.frames.by_seq(seq)
+
+    def capture_and_save(
+        self,
+        output_path="gallery/",
+        seconds_ago=0.1,
+        after_change=None,
+        burst_seconds=None,
+        burst_count=None,
+        raw=False,
+        best=None,
+    ):
+        if raw:
+            return self.capture_raw(output_path)
+        if best is not None:
+            if burst_seconds is None and burst_count is None:
+                burst_seconds = 0.5
+            return self.capture_best(
+                output_path,
+                seconds=burst_seconds,
+                count=burst_count,
+                seconds_ago=seconds_ago,
+                keep=best,
+            )
+        if burst_seconds is not None or burst_count is not None:
+            return self.capture_burst(
+                output_path,
+                seconds=burst_seconds,
+                count=burst_count,
+                seconds_ago=seconds_ago,
+            )
+
+        if after_change is not None:
+            frame = self.capture_after(after_change)
+            if frame is None:
+                logger.warning(f"control change {after_change} not applied, nothing saved")
+                raise ChangeTimeoutError(after_change)
+        else:
+            frame = self.capture(seconds_ago)
+        image = self.pin(frame)
+        if image is None:
+            return
+        path = os.path.join(output_path, self._capture_id(frame.seq) + ".png")
+
+        return self.writer.submit(image, path, metadata=capture_metadata(frame))
+
+    def capture_burst(
+        self,
+        output_path="gallery/",
+        seconds=None,
+        count=None,
+        seconds_ago=0.0,
+        ext=".png",
+    ) -> Future:
+        # seconds: the buffered window ending seconds_ago, count: the next
+        # count frames. Resolves to a BurstResult once every file is written.
+        result = Future()
+
+        if seconds is not None:
+            end = time.monotonic() - seconds_ago
+            frames = self.frames.frames_between(end - seconds, end)
+            burst = self._capture_id(frames[0].seq if frames else self.frames.seq)
+            prefix = os.path.join(output_path, burst)
+            pinned = []
+            for frame in frames:
+                image = self.pin(frame)
+                if image is not None:
+                    pinned.append((image, capture_metadata(frame, burst, len(pinned))))
+            dropped = len(frames) - len(pinned)
+            target, args = self._write_burst, (pinned, dropped, prefix, ext, result)
+        else:
+            prefix = os.path.join(output_path, self._capture_id(self.frames.seq + 1))
+            target, args = self._collect_burst, (int(count), prefix, ext, result)
+
+        threading.Thread(target=target, args=args, daemon=True).start()
+        return result
+
+    @staticmethod
+    def _capture_id(first_seq: int) -> str:
+        # names capture files and the metadata burst field: the wall clock
+        # alone repeats for two captures in the same second, the first
+        # frame's seq does not
         now = datetime.now()
-        formatted_time = now.strftime("%Y.%m.%d-%H:%M:%S") + ".png"
-        frame = self.capture(seconds_ago)
-        path = os.path.join(output_path, formatted_time)
+        return f"{now.strftime('%Y.%m.%d-%H:%M:%S')}.{now.microsecond // 1000:03d}-{first_seq}"
+
+    @staticmethod
+    def _burst_path(prefix, index, ext):
+        return f"{prefix}-burst{index:04d}{ext}"
+
+    def _finish_burst(
+        self, futures: List[Future], dropped, result: Future, scores=()
+    ):
+        wait(futures)
+        ok = [f.exception() is None for f in futures]
+        paths = [f.result() for f, saved in zip(futures, ok) if saved]
+        scores = [float(s) for s, saved in zip(scores, ok) if saved]
+        if dropped:
+            logger.warning(f"burst dropped {dropped} frames")
+        result.set_result(BurstResult(paths, dropped, scores))
+
+    def _write_burst(self, pinned: List[tuple], dropped, prefix, ext, result: Future):
+        # pinned: (image, metadata) pairs
+        futures = [
+            self.writer.submit(image, self._burst_path(prefix, i, ext), metadata=metadata)
+            for i, (image, metadata) in enumerate(pinned)
+        ]
+        self._finish_burst(futures, dropped, result)
+
+    def _collect_burst(self, count, prefix, ext, result: Future):
+        futures = []
+        dropped = 0
+        for frame in self._next_frames(count):
+            image = self.pin(frame) if frame is not None else None
+            if image is None:
+                dropped += 1
+                continue
+
+            index = len(futures)
+            metadata = capture_metadata(frame, os.path.basename(prefix), index)
+            path = self._burst_path(prefix, index, ext)
+            futures.append(self.writer.submit(image, path, metadata=metadata))
+
+        self._finish_burst(futures, dropped, result)
 
-        cv.imwrite(path, frame.frame)
+    def capture_best(
+        self,
+        output_path="gallery/",
+        seconds=None,
+        count=None,
+        seconds_ago=0.0,
+        keep=1,
+        ext=".png",
+    ) -> Future:
+        # like capture_burst, but frames are ranked by sharpness on small
+        # centre crops first and only the keep sharpest are copied out and
+        # saved (all of them, sharpest first, when keep is None or <= 0).
+        # Resolves to a BurstResult with the scores.
+        result = Future()
+
+        if seconds is not None:
+            # scored and pinned here, before the ring laps the window
+            end = time.monotonic() - seconds_ago
+            frames = self.frames.frames_between(end - seconds, end)
+            burst = self._capture_id(frames[0].seq if frames else self.frames.seq)
+            prefix = os.path.join(output_path, burst)
+            frames, crops, dropped = self._gather_crops(frames)
+            self._save_best(frames, crops, dropped, keep, prefix, ext, result)
+        else:
+            prefix = os.path.join(output_path, self._capture_id(self.frames.seq + 1))
+            threading.Thread(
+                target=self._collect_best,
+                args=(int(count), keep, prefix, ext, result),
+                daemon=True,
+            ).start()
+        return result
+
+    def _crop_buffer(self, count):
+        # strided centre crops, a few KiB per frame instead of a full copy
+        h, w = self.frames.resolution[1], self.frames.resolution[0]
+        side = min(self.best_crop, h, w)
+        window = (
+            slice((h - side) // 2, (h - side) // 2 + side, self.best_step),
+            slice((w - side) // 2, (w - side) // 2 + side, self.best_step),
+        )
+        out = len(range(0, side, self.best_step))
+        return window, np.empty((count, out, out, 3), dtype=np.uint8)
+
+    def _gather_crops(self, frames: List[CameraFrameWrapper]):
+        window, crops = self._crop_buffer(len(frames))
+        kept = []
+        for frame in frames:
+            np.copyto(crops[len(kept)], frame.image.raw[window])
+            if self.frames.is_intact(frame):
+                kept.append(frame)
+        return kept, crops[: len(kept)], len(frames) - len(kept)
+
+    def _collect_best(self, count, keep, prefix, ext, result: Future):
+        # the crop is taken on arrival so a long burst is scored even once
+        # the ring has lapped its first frames
+        window, crops = self._crop_buffer(count)
+        frames = []
+        dropped = 0
+        for frame in self._next_frames(count):
+            if frame is not None:
+                np.copyto(crops[len(frames)], frame.image.raw[window])
+                if self.frames.is_intact(frame):
+                    frames.append(frame)
+                    continue
+            dropped += 1
+        crops = crops[: len(frames)]
+        self._save_best(frames, crops, dropped, keep, prefix, ext, result)
+
+    def _save_best(self, frames, crops, dropped, keep, prefix, ext, result: Future):
+        scores = CamUtils.sharpness_batch(crops) if len(frames) else np.empty(0)
+        if not keep or keep <= 0:
+            keep = len(frames)
+
+        selected, saved_scores = [], []
+        burst = os.path.basename(prefix)
+        for index in np.argsort(-scores, kind="stable"):
+            if len(selected) == keep:
+                break
+            frame = frames[index]
+            image = self.pin(frame)
+            if image is None:
+                # lapped while scoring, the next sharpest is still buffered
+                dropped += 1
+                continue
+            metadata = capture_metadata(frame, burst, int(index))
+            path = self._burst_path(prefix, int(index), ext)
+            selected.append(self.writer.submit(image, path, metadata=metadata))
+            saved_scores.append(scores[index])
+
+        threading.Thread(
+            target=self._finish_burst,
+            args=(selected, dropped, result, saved_scores),
+            daemon=True,
+        ).start()
+
+    def close(self):
+        self.recorder.stop()
+        self._cam.stop()
+        self.writer.close()
+        self.raw_writer.close()
+        self.video_encoder.close()
@@ -0,0 +1,143 @@
+import dataclasses
+import logging
+import threading
+
+from .camera import Camera
+from .types import ControlChange
+
+logger = logging.getLogger("control-worker")
+
+
+class ControlUpdateWorker:
+    parameters = (
+        "analogue_gain",
+        "red_gain",
+        "blue_gain",
+        "exposure_time",
+        "resolution",
+        "auto",
+    )
+    # what auto mode overrides
+    manual = ("analogue_gain", "red_gain", "blue_gain", "exposure_time")
+
+    def __init__(self, camera: Camera, frame_timeout=0.5):
+        self.camera = camera
+        self.frame_timeout = frame_timeout
+        self.applied = 0
+        self.merged = 0
+        self._pending = {}
+        self._pending_changes = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._consumer = camera.consumer("control-worker")
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def submit(self, **updates) -> ControlChange:
+        unknown = set(updates) - set(self.parameters)
+        if unknown:
+            raise ValueError(f"Unknown parameters: {sorted(unknown)}")
+
+        with self._lock:
+            # latest wins, also between auto mode and manual values; a
+            # queued resolution is independent of either and stays
+            if updates.get("auto"):
+                for name in self.manual:
+                    self._pending.pop(name, None)
+            elif self._pending.get("auto"):
+                del self._pending["auto"]
+            self.merged += len(set(updates) & set(self._pending))
+            self._pending.update(updates)
+
+            change = self.camera.reserve_change()
+            # an estimate: applied right after the next frame, then the
+            # sensor's control delay; change tracking sets effective_seq to
+            # the frame that actually carries it
+            change.expected_seq = (
+                self.camera.frames.seq + 1 + self.camera.control_delay_frames
+            )
+            self._pending_changes.append(change.id)
+        self._wakeup.set()
+        return change
+
+    def _run(self):
+        while self._running:
+            self._wakeup.wait()
+            if not self._running:
+                break
+
+            # at most one apply per frame period
+            self._consumer.wait_for_frame(timeout=self.frame_timeout)
+
+            with self._lock:
+                updates, self._pending = self._pending, {}
+                change_ids, self._pending_changes = self._pending_changes, []
+                self._wakeup.clear()
+
+            if updates:
+                try:
+                    self._apply(updates, change_ids)
+                except Exception as e:
+                    logger.error(f"Error applying {updates}: {e}")
+
+    def _apply(self, updates, change_ids):
+        request = self.camera._params_request
+        auto = updates.pop("auto", None)
+        if auto:
+            if "resolution" in updates:
+                params = dataclasses.replace(
+                    request,
+                    resolution=tuple(updates["resolution"]),
+                    AeEnable=True,
+                    AwbEnable=True,
+                )
+                self.camera.reconfigure(params, change_ids)
+            else:
+                self.camera.set_auto(change_ids)
+            self.applied += 1
+            return
+
+        if auto is None and set(updates) == {"resolution"}:
+            # a mode change alone keeps the current auto/manual state
+            params = dataclasses.replace(request, resolution=tuple(updates["resolution"]))
+            self.camera.reconfigure(params, change_ids)
+            self.applied += 1
+            return
+
+        # leaving auto mode: start from what the algorithms picked
+        base = self.camera._params_latest if request.AeEnable else request
+        params = dataclasses.replace(
+            base, resolution=request.resolution, AeEnable=False, AwbEnable=False
+        )
+
+        blue, red = params.colour_gains
+        for name, value in updates.items():
+            if name == "analogue_gain":
+                params.analogue_gain = float(value)
+            elif name == "red_gain":
+                red = float(value)
+            elif name == "blue_gain":
+                blue = float(value)
+            elif name == "exposure_time":
+                params.exposure_time = float(value)
+            elif name == "resolution":
+                params.resolution = tuple(value)
+        params.colour_gains = blue, red
+
+        self.camera.reconfigure(params, change_ids)
+        self.applied += 1
+        logger.info(f"Applied {updates} at frame {self.camera.frames.seq}")
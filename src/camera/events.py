@@ -0,0 +1,140 @@
+import dataclasses
+import json
+import logging
+import threading
+import time
+from typing import Callable, Optional, Tuple
+
+from .camera import Camera
+from .utils import CamUtils
+
+logger = logging.getLogger("camera-events")
+
+
+class TelemetryPublisher:
+    """
+    Samples the newest frame at most `rate` times a second and publishes
+    camera parameters, runtime metadata, sharpness and pipeline stats as one
+    JSON snapshot. The snapshot is built and serialized once per sample and
+    shared by every subscriber, subscribers only wait for a newer version.
+    While nobody is subscribed the thread sleeps and touches no frames.
+    """
+
+    crop_side = 170
+
+    def __init__(
+        self,
+        camera: Camera,
+        rate=5.0,
+        stats: Optional[Callable[[], dict]] = None,
+        frame_timeout=0.5,
+    ):
+        self.camera = camera
+        self.rate = rate
+        self.frame_timeout = frame_timeout
+        self.published = 0
+        self._stats = stats
+        self._version = 0
+        self._payload: Optional[bytes] = None
+        self._subscribers = 0
+        self._published = threading.Condition()
+        self._thread = None
+        self._running = False
+
+    @property
+    def subscribers(self) -> int:
+        return self._subscribers
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._published:
+            self._running = False
+            self._published.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def subscribe(self):
+        with self._published:
+            self._subscribers += 1
+            self._published.notify_all()
+
+    def unsubscribe(self):
+        with self._published:
+            self._subscribers -= 1
+
+    def wait(self, version: int, timeout=None) -> Tuple[int, Optional[bytes]]:
+        # newest snapshot after `version`, (version, None) on timeout or stop
+        with self._published:
+            self._published.wait_for(
+                lambda: self._version > version or not self._running, timeout
+            )
+            if self._version > version:
+                return self._version, self._payload
+            return version, None
+
+    def _snapshot(self, frame) -> Optional[dict]:
+        frames = self.camera.frames
+        crop = frame.image.center_crop(self.crop_side, order="bgr")
+        if not frames.is_intact(frame):
+            return None
+
+        request = self.camera._params_request
+        params = dataclasses.asdict(frame.metadata)
+        params["auto_mode"] = request.AeEnable and request.AwbEnable
+        stats = {
+            "fps": frames.fps(),
+            "callback_latency": self.camera.callback_latency.summary(),
+            "consumers": frames.consumer_stats(),
+            "recording": self.camera.recorder.recording,
+            "subscribers": self._subscribers,
+        }
+        if self._stats is not None:
+            stats.update(self._stats())
+        return {
+            "seq": frame.seq,
+            "timestamp": frame.timestamp,
+            "params": params,
+            "runtime": dataclasses.asdict(frame.runtime_metadata),
+            "sharpness": CamUtils.sharpness(crop),
+            "stats": stats,
+        }
+
+    def _run(self):
+        frames = self.camera.frames
+        seq = 0
+        next_at = time.monotonic()
+        while self._running:
+            with self._published:
+                self._published.wait_for(
+                    lambda: self._subscribers > 0 or not self._running
+                )
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            next_at = max(next_at + 1 / self.rate, time.monotonic())
+
+            frame = frames.wait_for_frame(seq, timeout=self.frame_timeout)
+            if frame is None:
+                continue
+            seq = frame.seq
+            try:
+                snapshot = self._snapshot(frame)
+            except Exception as e:
+                logger.error(f"Telemetry snapshot failed: {e}")
+                continue
+            if snapshot is None:
+                continue
+
+            payload = json.dumps(snapshot, default=float).encode()
+            with self._published:
+                self._version += 1
+                self._payload = payload
+                self.published += 1
+                self._published.notify_all()
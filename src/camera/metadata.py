@@ -0,0 +1,173 @@
+import dataclasses
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from .raw import _IFD
+from .types import CameraFrameWrapper, CaptureMetadata
+
+# one per gallery directory, a JSON object per line, only ever appended
+INDEX_NAME = "index.jsonl"
+
+
+def capture_metadata(
+    frame: CameraFrameWrapper, burst: Optional[str] = None, burst_index=None
+) -> CaptureMetadata:
+    # sharpness is left to the writer thread, it needs the pixels
+    return CaptureMetadata(
+        timestamp=time.time() - (time.monotonic() - frame.timestamp),
+        seq=frame.seq,
+        exposure_time=int(frame.metadata.exposure_time),
+        analogue_gain=float(frame.metadata.analogue_gain),
+        colour_gains=tuple(float(g) for g in frame.metadata.colour_gains),
+        lux=float(frame.runtime_metadata.lux),
+        temperature=float(frame.runtime_metadata.temperature),
+        resolution=tuple(frame.metadata.resolution),
+        burst=burst,
+        burst_index=burst_index,
+    )
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return (
+        struct.pack(">I", len(data))
+        + kind
+        + data
+        + struct.pack(">I", zlib.crc32(kind + data))
+    )
+
+
+def _png_text(encoded: bytes, text: Dict[str, str]) -> bytes:
+    # tEXt chunks right after IHDR (8 byte signature + 25 byte chunk)
+    chunks = b"".join(
+        _png_chunk(b"tEXt", key.encode("latin-1") + b"\0" + value.encode("latin-1"))
+        for key, value in text.items()
+    )
+    return encoded[:33] + chunks + encoded[33:]
+
+
+def _jpeg_exif(encoded: bytes, metadata: CaptureMetadata, description: str) -> bytes:
+    ifd = _IFD()
+    ifd.add(270, 2, description)  # ImageDescription
+    ifd.add(305, 2, "vaflya-cam")
+    ifd.add(306, 2, datetime.fromtimestamp(metadata.timestamp).strftime("%Y:%m:%d %H:%M:%S"))
+    # same flat layout as the DNG writer, no separate Exif IFD
+    ifd.add(33434, 5, [(metadata.exposure_time, 1_000_000)])  # ExposureTime
+    ifd.add(34855, 3, int(metadata.analogue_gain * 100))  # ISOSpeedRatings
+    tiff = ifd.write(b"")
+
+    segment = b"Exif\0\0" + tiff
+    app1 = b"\xff\xe1" + struct.pack(">H", len(segment) + 2) + segment
+    # after SOI and the JFIF APP0 segment if there is one
+    offset = 2
+    if encoded[2:4] == b"\xff\xe0":
+        offset = 4 + struct.unpack(">H", encoded[4:6])[0]
+    return encoded[:offset] + app1 + encoded[offset:]
+
+
+def embed(encoded: bytes, ext: str, metadata: CaptureMetadata) -> bytes:
+    # the JSON form of metadata as PNG tEXt or JPEG EXIF ImageDescription,
+    # other formats are written unchanged
+    description = json.dumps(dataclasses.asdict(metadata))
+    ext = ext.lower()
+    if ext == ".png":
+        created = datetime.fromtimestamp(metadata.timestamp).isoformat()
+        return _png_text(
+            encoded,
+            {
+                "Description": description,
+                "Software": "vaflya-cam",
+                "Creation Time": created,
+            },
+        )
+    if ext in (".jpg", ".jpeg"):
+        return _jpeg_exif(encoded, metadata, description)
+    return encoded
+
+
+class CaptureIndex:
+    """
+    Appends and reads the per-gallery index.jsonl. Every record is a
+    CaptureMetadata plus the file name, so gallery queries never open an
+    image. Readers keep the records parsed so far and only read what was
+    appended since, the file is rebuilt from scratch if it shrinks.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # index path -> (bytes read, records)
+        self._read: Dict[str, Tuple[int, List[dict]]] = {}
+
+    def append(self, path: str, metadata: CaptureMetadata):
+        record = dict(file=os.path.basename(path), **dataclasses.asdict(metadata))
+        line = json.dumps(record) + "\n"
+        index = os.path.join(os.path.dirname(path), INDEX_NAME)
+        # one write per record, O_APPEND keeps concurrent writers' lines whole
+        with self._lock, open(index, "a") as f:
+            f.write(line)
+
+    def records(self, directory: str) -> List[dict]:
+        index = os.path.join(directory, INDEX_NAME)
+        with self._lock:
+            offset, records = self._read.get(index, (0, []))
+            try:
+                size = os.path.getsize(index)
+            except FileNotFoundError:
+                self._read.pop(index, None)
+                return []
+            if size < offset:
+                offset, records = 0, []
+            if size > offset:
+                records = list(records)
+                with open(index, "rb") as f:
+                    f.seek(offset)
+                    data = f.read(size - offset)
+                # a line still being written waits for the next read
+                complete = data.rfind(b"\n") + 1
+                for line in data[:complete].splitlines():
+                    if line.strip():
+                        records.append(json.loads(line))
+                offset += complete
+                self._read[index] = (offset, records)
+            return records
+
+    def query(
+        self,
+        directory: str,
+        ranges: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None,
+        equals: Optional[Dict[str, object]] = None,
+        order: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[dict]:
+        """
+        Records of one gallery. ranges maps a field to inclusive (min, max)
+        bounds, either may be None; equals maps a field to a required value.
+        order is a field name, "-field" for descending; records without the
+        field sort last.
+        """
+        result = []
+        for record in self.records(directory):
+            if equals and any(record.get(k) != v for k, v in equals.items()):
+                continue
+            if ranges and not all(
+                record.get(k) is not None
+                and (low is None or record[k] >= low)
+                and (high is None or record[k] <= high)
+                for k, (low, high) in ranges.items()
+            ):
+                continue
+            result.append(record)
+
+        if order:
+            key = order.lstrip("-")
+            descending = order.startswith("-")
+            present = [r for r in result if r.get(key) is not None]
+            missing = [r for r in result if r.get(key) is None]
+            present.sort(key=lambda r: r[key], reverse=descending)
+            result = present + missing
+        return result[:limit] if limit is not None else result
@@ -0,0 +1,269 @@
+import time
+from typing import Dict, List, Literal, Optional, Sequence, Tuple
+
+import cv2 as cv
+import numpy as np
+
+from .types import CameraFrameWrapper
+from .utils import CamUtils, RollingStats
+
+STAGES = ("preview", "crop", "crosshair", "text")
+
+
+class _TextStrip:
+    # one rasterised text line: its box in the output and per pixel factors
+    # for out = out * clear * keep / 255 + add, all uint8 so blending is
+    # two saturating OpenCV calls
+    def __init__(
+        self,
+        text: str,
+        origin: Tuple[int, int],
+        font_scale: float,
+        shadow: int,
+        background: np.ndarray,
+        channels: int,
+    ):
+        font = cv.FONT_HERSHEY_SIMPLEX
+        # thin text is measured, far cheaper than at thickness 2, the pad
+        # covers the shadow's extra pixel and the offset
+        (w, h), baseline = cv.getTextSize(text, font, font_scale, 1)
+        pad = 2 + shadow
+        self.text = text
+        x0, y0 = origin[0] - pad, origin[1] - h - pad
+        shape = (h + baseline + 2 * pad, w + 2 * pad)
+        at = (pad, h + pad)
+        # coverage of the same two putText calls the display loop made,
+        # 0/255 where putText does not antialias
+        shadow_mask = np.zeros(shape, dtype=np.uint8)
+        glyph_mask = np.zeros(shape, dtype=np.uint8)
+        cv.putText(shadow_mask, text, (at[0] + shadow, at[1] + shadow), font, font_scale, 255, 2)
+        cv.putText(glyph_mask, text, at, font, font_scale, 255, 1)
+
+        height, width = background.shape
+        top, left = max(0, -y0), max(0, -x0)
+        bottom = max(top, min(shape[0], height - y0))
+        right = max(left, min(shape[1], width - x0))
+        self.box = (slice(y0 + top, y0 + bottom), slice(x0 + left, x0 + right))
+        self.visible = bottom > top and right > left
+        if not self.visible:
+            return
+
+        shadow_mask = shadow_mask[top:bottom, left:right]
+        glyph_mask = glyph_mask[top:bottom, left:right]
+        # black shadow, then white glyph over it; alpha is left alone
+        keep = cv.multiply(255 - shadow_mask, 255 - glyph_mask, scale=1 / 255)
+        # 0 where nothing else repaints the output, so the strip is blended
+        # over black there instead of over its own previous frame
+        clear = (~background[self.box]).view(np.uint8)
+        alpha = [np.full_like(keep, 255)] * (channels - 3)
+        self.keep = cv.merge([keep] * 3 + alpha)
+        self.add = cv.merge([glyph_mask] * 3 + [a * 0 for a in alpha])
+        self.clear = cv.merge([clear] * 3 + [a // 255 for a in alpha])
+
+
+class PreviewRenderer:
+    """
+    The display overlay shared by main.py and main_fb.py: the preview scaled
+    to the output height, a full resolution centre crop in the bottom left
+    corner, crosshairs in a contrasting colour and shadowed text lines.
+
+    Everything is composed into one preallocated output buffer. Areas the
+    preview does not cover stay black from allocation instead of a
+    copyMakeBorder per frame, the crosshairs are a pixel index computed
+    once and text lines are rasterised to coverage masks that are reused
+    until the line changes. channels=4 adds an opaque alpha channel for framebuffers.
+    Per-stage times in ms are kept in `timings`.
+    """
+
+    def __init__(
+        self,
+        size: Tuple[int, int] = (480, 320),
+        crop_side=170,
+        margin=10,
+        align: Literal["left", "center", "right"] = "center",
+        interpolation=cv.INTER_NEAREST,
+        font_scale=0.3,
+        line_height=10,
+        text_origin: Tuple[int, int] = (10, 30),
+        shadow=1,
+        line_length=8,
+        crop_line_length=4,
+        channels=3,
+        order: Literal["bgr", "rgb"] = "rgb",
+        sharpness=True,
+    ):
+        self.width, self.height = size
+        self.crop_side = min(crop_side, self.height - 2 * margin)
+        self.margin = margin
+        self.align = align
+        self.interpolation = interpolation
+        self.font_scale = font_scale
+        self.line_height = line_height
+        self.text_origin = text_origin
+        self.shadow = shadow
+        self.line_length = line_length
+        self.crop_line_length = crop_line_length
+        self.channels = channels
+        self.order = order
+        self.sharpness = sharpness
+
+        self.output = np.zeros((self.height, self.width, channels), dtype=np.uint8)
+        if channels == 4:
+            self.output[..., 3] = 255
+        self.timings: Dict[str, RollingStats] = {s: RollingStats() for s in STAGES}
+        self._strips: List[_TextStrip] = []
+        self._layout_for: Optional[Tuple[int, int]] = None
+        # pixels no stage paints every frame, until draw() knows better
+        self._background = np.ones((self.height, self.width), dtype=bool)
+        self._scratch: Optional[np.ndarray] = None
+
+    def _layout(self, preview_shape):
+        # placement depends only on the preview's aspect ratio, so it is
+        # worked out once and again only when the sensor mode changes
+        h, w = preview_shape[:2]
+        self._layout_for = (w, h)
+        scaled = int(self.height * w / h)
+        offset = {
+            "left": 0,
+            "center": (self.width - scaled) // 2,
+            "right": self.width - scaled,
+        }[self.align]
+        # (resize width, columns of the resized preview that are shown,
+        # where they go in the output)
+        src = slice(max(0, -offset), max(0, -offset) + min(scaled, self.width))
+        dst = slice(max(0, offset), max(0, offset) + src.stop - src.start)
+        self._preview = (scaled, src, dst)
+        self._scratch = np.empty((self.height, scaled, 3), dtype=np.uint8)
+
+        side, margin = self.crop_side, self.margin
+        self._crop_at = (self.height - side - margin, margin)
+
+        self.output[..., :3] = 0
+        self._strips = []
+        self._background = np.ones((self.height, self.width), dtype=bool)
+        self._background[:, dst] = False
+        y, x = self._crop_at
+        self._background[y : y + side, x : x + side] = False
+
+        mask = np.zeros((self.height, self.width), dtype=np.uint8)
+        cx, cy = (dst.start + dst.stop) // 2, self.height // 2
+        n = self.line_length
+        cv.line(mask, (cx - n, cy), (cx + n, cy), 1, 1)
+        cv.line(mask, (cx, cy - n), (cx, cy + n), 1, 1)
+        cx, cy = x + side // 2, y + side // 2
+        n = self.crop_line_length
+        cv.line(mask, (cx - n, cy), (cx + n, cy), 1, 1)
+        cv.line(mask, (cx, cy - n), (cx, cy + n), 1, 1)
+        self._crosshair = np.nonzero(mask)
+
+    def _convert_into(self, src: np.ndarray, src_order: str, dst: np.ndarray):
+        if self.channels == 4:
+            code = cv.COLOR_BGR2BGRA if src_order == self.order else cv.COLOR_BGR2RGBA
+            cv.cvtColor(src, code, dst=dst)
+        elif src_order == self.order:
+            np.copyto(dst, src)
+        else:
+            cv.cvtColor(src, cv.COLOR_BGR2RGB, dst=dst)
+
+    def draw(self, frame: CameraFrameWrapper) -> Optional[float]:
+        """
+        Preview, crop and crosshairs for one frame. Returns the sharpness of
+        the crop, the number the display shows for focusing, or None when
+        the renderer was built with sharpness=False.
+        """
+        t0 = time.perf_counter()
+        preview = frame.preview
+        h, w = preview.shape[:2]
+        if self._layout_for != (w, h):
+            self._layout(preview.shape)
+        scaled, src, dst = self._preview
+        out = self.output
+        size = (scaled, self.height)
+        if self.channels == 3 and preview.order == self.order and src.stop - src.start == scaled:
+            # straight into the output, nothing to convert or cut off
+            cv.resize(preview.raw, size, dst=out[:, dst], interpolation=self.interpolation)
+        else:
+            cv.resize(preview.raw, size, dst=self._scratch, interpolation=self.interpolation)
+            self._convert_into(self._scratch[:, src], preview.order, out[:, dst])
+        t1 = time.perf_counter()
+
+        # straight from the full resolution frame, no intermediate copy
+        side = self.crop_side
+        image = frame.image
+        ih, iw = image.shape[:2]
+        y0, x0 = ih // 2 - side // 2, iw // 2 - side // 2
+        region = image.raw[y0 : y0 + side, x0 : x0 + side]
+        y, x = self._crop_at
+        self._convert_into(region, image.order, out[y : y + side, x : x + side])
+        sharpness = None
+        if self.sharpness:
+            # on bgr, the same number the writer saves with a capture
+            bgr = region if image.order == "bgr" else cv.cvtColor(region, cv.COLOR_RGB2BGR)
+            sharpness = CamUtils.sharpness(bgr)
+        t2 = time.perf_counter()
+
+        # truncated like the np.mean(...).astype(np.uint8) it replaces
+        b, g, r = (int(v) for v in cv.mean(region)[:3])
+        luminance = 0.299 * r + 0.587 * g + 0.114 * b
+        out[self._crosshair[0], self._crosshair[1], :3] = 0 if luminance > 127 else 255
+        t3 = time.perf_counter()
+
+        self.timings["preview"].add((t1 - t0) * 1e3)
+        self.timings["crop"].add((t2 - t1) * 1e3)
+        self.timings["crosshair"].add((t3 - t2) * 1e3)
+        return sharpness
+
+    def draw_text(self, lines: Sequence[str]) -> np.ndarray:
+        """
+        Shadowed text lines over the last draw(). Returns the output buffer,
+        which is reused by the next frame.
+        """
+        t0 = time.perf_counter()
+        x, y = self.text_origin
+        stale = self._strips[len(lines) :]
+        strips = []
+        for i, text in enumerate(lines):
+            strip = self._strips[i] if i < len(self._strips) else None
+            if strip is None or strip.text != text:
+                if strip is not None:
+                    stale.append(strip)
+                strip = _TextStrip(
+                    text,
+                    (x, y + i * self.line_height),
+                    self.font_scale,
+                    self.shadow,
+                    self._background,
+                    self.channels,
+                )
+            strips.append(strip)
+        self._strips = strips
+
+        # neighbouring lines' boxes overlap, so all of them are cleared
+        # before any is blended; blending over black where nothing else
+        # repaints keeps unchanged lines from accumulating
+        for strip in stale + strips:
+            if strip.visible:
+                self._clear(strip)
+        for strip in strips:
+            if strip.visible:
+                self._blend(strip)
+        self.timings["text"].add((time.perf_counter() - t0) * 1e3)
+        return self.output
+
+    def _blend(self, strip: _TextStrip):
+        region = self.output[strip.box]
+        cv.multiply(region, strip.keep, dst=region, scale=1 / 255)
+        cv.add(region, strip.add, dst=region)
+
+    def _clear(self, strip: _TextStrip):
+        region = self.output[strip.box]
+        cv.multiply(region, strip.clear, dst=region)
+
+    def snapshot(self) -> np.ndarray:
+        # an independent 3 channel copy for consumers that hold on to the
+        # image, e.g. AsyncImageStream encodes it later on its own thread
+        return self.output[..., :3].copy()
+
+    def timing_summary(self) -> Dict[str, float]:
+        # mean ms per stage
+        return {s: round(self.timings[s].summary()["mean"], 3) for s in STAGES}
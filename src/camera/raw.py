@@ -0,0 +1,186 @@
+import json
+import multiprocessing
+import re
+import struct
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+# CFAPattern values, 0 = red, 1 = green, 2 = blue
+BAYER_PATTERNS = {
+    "RGGB": (0, 1, 1, 2),
+    "GRBG": (1, 0, 2, 1),
+    "GBRG": (1, 2, 0, 1),
+    "BGGR": (2, 1, 1, 0),
+}
+
+RGB_TO_XYZ = np.array(
+    [
+        [0.4124564, 0.3575761, 0.1804375],
+        [0.2126729, 0.7151522, 0.0721750],
+        [0.0193339, 0.1191920, 0.9503041],
+    ]
+)
+
+
+def parse_format(fmt: str):
+    # e.g. SRGGB12_CSI2P -> ("RGGB", 12, True), SRGGB16 -> ("RGGB", 16, False)
+    match = re.fullmatch(r"S([RGB]{4})(\d+)(_CSI2P)?", str(fmt))
+    if match is None or match.group(1) not in BAYER_PATTERNS:
+        # e.g. the PISP_COMP1 compressed raw a Pi 5 gives without a format
+        raise ValueError(
+            f"Unsupported raw format {fmt}, expected an unpacked or CSI2P "
+            "Bayer format such as SRGGB12_CSI2P"
+        )
+    return match.group(1), int(match.group(2)), match.group(3) is not None
+
+
+def unpack(raw: np.ndarray, fmt: str, size) -> np.ndarray:
+    width, height = size
+    _, bits, packed = parse_format(fmt)
+    raw = raw[:height]
+
+    if not packed:
+        return raw.view(np.uint16)[:, :width]
+
+    if bits == 10:
+        # 4 pixels in 5 bytes: four high bytes, then the 2 low bits of each
+        groups = raw[:, : width * 5 // 4].reshape(height, -1, 5).astype(np.uint16)
+        out = np.empty((height, groups.shape[1], 4), dtype=np.uint16)
+        for i in range(4):
+            out[..., i] = (groups[..., i] << 2) | ((groups[..., 4] >> (2 * i)) & 0x3)
+    elif bits == 12:
+        # 2 pixels in 3 bytes: two high bytes, then both low nibbles
+        groups = raw[:, : width * 3 // 2].reshape(height, -1, 3).astype(np.uint16)
+        out = np.empty((height, groups.shape[1], 2), dtype=np.uint16)
+        out[..., 0] = (groups[..., 0] << 4) | (groups[..., 2] & 0xF)
+        out[..., 1] = (groups[..., 1] << 4) | (groups[..., 2] >> 4)
+    else:
+        raise ValueError(f"Unsupported packed format {fmt}")
+    return out.reshape(height, -1)[:, :width]
+
+
+def _rational(value, denominator=10000):
+    return int(round(value * denominator)), denominator
+
+
+class _IFD:
+    # TIFF types: BYTE, ASCII, SHORT, LONG, RATIONAL, SRATIONAL
+    _formats = {1: "B", 2: "s", 3: "H", 4: "I", 5: "II", 10: "ii"}
+
+    def __init__(self):
+        self.entries = []
+
+    def add(self, tag, kind, values):
+        if kind == 2:
+            values = [values.encode("ascii", "replace") + b"\0"]
+            count = len(values[0])
+        else:
+            values = list(values) if isinstance(values, (list, tuple)) else [values]
+            count = len(values)
+            if kind in (5, 10):
+                values = [v for pair in values for v in pair]
+        self.entries.append((tag, kind, count, values))
+
+    def _pack(self, kind, count, values):
+        if kind == 2:
+            return values[0]
+        return struct.pack(f"<{self._formats[kind] * count}", *values)
+
+    def write(self, data: bytes) -> bytes:
+        entries = sorted(self.entries)
+        ifd_size = 2 + 12 * len(entries) + 4
+        extra = b""
+        extra_offset = 8 + ifd_size
+
+        payloads = [self._pack(kind, count, values) for _, kind, count, values in entries]
+        extra_size = sum(len(p) + len(p) % 2 for p in payloads if len(p) > 4)
+        data_offset = extra_offset + extra_size
+
+        ifd = struct.pack("<H", len(entries))
+        for (tag, kind, count, _), payload in zip(entries, payloads):
+            if tag == 273:  # StripOffsets
+                payload = struct.pack("<I", data_offset)
+            if len(payload) <= 4:
+                ifd += struct.pack("<HHI", tag, kind, count) + payload.ljust(4, b"\0")
+            else:
+                ifd += struct.pack("<HHII", tag, kind, count, extra_offset + len(extra))
+                extra += payload + b"\0" * (len(payload) % 2)
+        ifd += struct.pack("<I", 0)
+
+        return b"II*\0" + struct.pack("<I", 8) + ifd + extra + data
+
+
+def write_dng(path, raw: np.ndarray, fmt: str, size, metadata: dict):
+    pattern, bits, _ = parse_format(fmt)
+    pixels = unpack(raw, fmt, size)
+    height, width = pixels.shape
+
+    red_gain, blue_gain = metadata.get("ColourGains", (1.0, 1.0))
+    black_levels = metadata.get("SensorBlackLevels", (4096,) * 4)
+    ccm = metadata.get("ColourCorrectionMatrix")
+    ccm = np.eye(3) if ccm is None else np.array(ccm).reshape(3, 3)
+    # camera RGB -> white balanced -> sRGB -> XYZ, DNG wants the inverse;
+    # with the gains folded in, the matrix maps D65 white to AsShotNeutral
+    gains = np.diag((red_gain, 1.0, blue_gain))
+    colour_matrix = np.linalg.inv(RGB_TO_XYZ @ ccm @ gains)
+
+    keys = ("ExposureTime", "AnalogueGain", "ColourGains", "ColourTemperature", "Lux")
+    description = {k: metadata[k] for k in keys if k in metadata}
+
+    ifd = _IFD()
+    ifd.add(254, 4, 0)  # NewSubfileType: full resolution raw
+    ifd.add(256, 4, width)
+    ifd.add(257, 4, height)
+    ifd.add(258, 3, 16)  # BitsPerSample
+    ifd.add(259, 3, 1)  # Compression: none
+    ifd.add(262, 3, 32803)  # PhotometricInterpretation: CFA
+    ifd.add(270, 2, json.dumps(description))  # ImageDescription
+    ifd.add(271, 2, "Raspberry Pi")
+    ifd.add(272, 2, "imx477")
+    ifd.add(273, 4, 0)  # StripOffsets, filled in by _IFD.write
+    ifd.add(274, 3, 1)  # Orientation
+    ifd.add(277, 3, 1)  # SamplesPerPixel
+    ifd.add(278, 4, height)  # RowsPerStrip
+    ifd.add(279, 4, pixels.nbytes)  # StripByteCounts
+    ifd.add(284, 3, 1)  # PlanarConfiguration
+    ifd.add(305, 2, "vaflya-cam")
+    ifd.add(306, 2, datetime.now().strftime("%Y:%m:%d %H:%M:%S"))
+    ifd.add(33421, 3, (2, 2))  # CFARepeatPatternDim
+    ifd.add(33422, 1, BAYER_PATTERNS[pattern])  # CFAPattern
+    if "ExposureTime" in metadata:
+        ifd.add(33434, 5, [(int(metadata["ExposureTime"]), 1_000_000)])
+    if "AnalogueGain" in metadata:
+        ifd.add(34855, 3, int(metadata["AnalogueGain"] * 100))  # ISOSpeedRatings
+    ifd.add(50706, 1, (1, 4, 0, 0))  # DNGVersion
+    ifd.add(50708, 2, "Raspberry Pi imx477")  # UniqueCameraModel
+    ifd.add(50713, 3, (2, 2))  # BlackLevelRepeatDim
+    ifd.add(50714, 4, [int(b) >> (16 - bits) for b in black_levels])  # BlackLevel
+    ifd.add(50717, 4, (1 << bits) - 1)  # WhiteLevel
+    ifd.add(50721, 10, [_rational(v) for v in colour_matrix.flatten()])  # ColorMatrix1
+    ifd.add(50728, 5, [_rational(1 / red_gain), (1, 1), _rational(1 / blue_gain)])
+    ifd.add(50778, 3, 21)  # CalibrationIlluminant1: D65
+
+    with open(path, "wb") as f:
+        f.write(ifd.write(np.ascontiguousarray(pixels, dtype="<u2").tobytes()))
+    return path
+
+
+class RawWriter:
+    def __init__(self, workers=1):
+        # fork before the ring buffer exists, main.py cannot be re-imported
+        # by spawn
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("fork")
+        )
+        self._pool.submit(int).result()
+        self.submitted = 0
+
+    def submit(self, path, raw: np.ndarray, fmt: str, size, metadata: dict) -> Future:
+        # raw must already be a copy of the request buffer
+        self.submitted += 1
+        return self._pool.submit(write_dng, path, raw, fmt, size, metadata)
+
+    def close(self):
+        self._pool.shutdown(wait=True)
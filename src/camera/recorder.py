@@ -0,0 +1,278 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from datetime import datetime
+from multiprocessing import resource_tracker, shared_memory
+from typing import List, Optional
+
+import cv2 as cv
+import numpy as np
+
+from .utils import RollingStats
+
+logger = logging.getLogger("recorder")
+
+# tried in order, the first one the local OpenCV/ffmpeg build can open wins
+CODECS = (("avc1", ".mp4"), ("mp4v", ".mp4"), ("MJPG", ".avi"))
+
+
+def _open_segment(output_path, index, timestamp, fps, size):
+    # name segments by the wall clock time of their first frame
+    wall = time.time() - (time.monotonic() - timestamp)
+    stamp = datetime.fromtimestamp(wall).strftime("%Y.%m.%d-%H:%M:%S")
+    for fourcc, ext in CODECS:
+        path = os.path.join(output_path, f"{stamp}-rec{index:03d}{ext}")
+        writer = cv.VideoWriter(path, cv.VideoWriter_fourcc(*fourcc), fps, size)
+        if writer.isOpened():
+            return writer, path
+        writer.release()
+    raise RuntimeError("No usable video codec")
+
+
+def _encode_loop(conn):
+    # runs in the encoder process, frames arrive through shared memory slots
+    shm = frames = writer = None
+    while True:
+        message = conn.recv()
+        kind = message[0]
+
+        if kind == "open":
+            _, shm_name, shape, fps, output_path, segment_seconds = message
+            shm = shared_memory.SharedMemory(shm_name)
+            # the parent owns and unlinks the segment
+            resource_tracker.unregister(shm._name, "shared_memory")
+            frames = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+            size = (shape[2], shape[1])
+            segment, segment_start = 0, None
+
+        elif kind == "frame":
+            _, slot, timestamp, sent = message
+            try:
+                if segment_start is None or timestamp - segment_start >= segment_seconds:
+                    if writer is not None:
+                        writer.release()
+                    writer, path = _open_segment(
+                        output_path, segment, timestamp, fps, size
+                    )
+                    segment, segment_start = segment + 1, timestamp
+                    conn.send(("segment", path))
+                writer.write(frames[slot])
+                conn.send(("done", slot, time.monotonic() - sent))
+            except Exception as e:
+                conn.send(("error", slot, str(e)))
+
+        elif kind == "close":
+            if writer is not None:
+                writer.release()
+            writer = frames = None
+            if shm is not None:
+                shm.close()
+                shm = None
+            conn.send(("closed",))
+
+        elif kind == "exit":
+            break
+
+
+class VideoEncoder:
+    # forked early, like RawWriter, so the child does not inherit the camera
+    # threads and ring buffer
+    def __init__(self):
+        ctx = multiprocessing.get_context("fork")
+        self.conn, child = ctx.Pipe()
+        self._process = ctx.Process(target=_encode_loop, args=(child,), daemon=True)
+        self._process.start()
+        child.close()
+
+    def close(self):
+        try:
+            self.conn.send(("exit",))
+        except (BrokenPipeError, OSError):
+            pass
+        self._process.join(timeout=2)
+
+
+class Recorder:
+    """
+    Records frames from the camera ring into segmented video files. A thread
+    walks every seq in order, starting with the pre-roll already in the
+    ring, and copies each frame into a free shared memory slot for the
+    encoder process. While all slots are busy the thread waits, so the ring
+    absorbs encoder back-pressure; frames it laps count as dropped_ring.
+    dropped_encoder counts frames given up on after the encoder stalled for
+    stall_timeout.
+    """
+
+    stall_timeout = 1.0
+
+    def __init__(self, camera, encoder: VideoEncoder, slots=8):
+        self.camera = camera
+        self.encoder = encoder
+        self.slots = slots
+        self._thread = None
+        self._running = False
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.recorded = 0
+        self.dropped_ring = 0
+        self.dropped_encoder = 0
+        self.failed = 0
+        self.segments: List[str] = []
+        self.started_at: Optional[float] = None
+        self.encode_latency = RollingStats()
+
+    @property
+    def recording(self) -> bool:
+        return self._running
+
+    def start(
+        self,
+        output_path="gallery/",
+        preroll_seconds=1.0,
+        segment_seconds=60.0,
+        stream="main",
+        fps=None,
+    ) -> bool:
+        # HTTP handlers may start and stop concurrently
+        with self._lock:
+            if self._running:
+                return False
+
+            frames = self.camera.frames
+            newest = frames.get(0)
+            if newest is None:
+                raise RuntimeError("No frames to record")
+            image = newest.lores if stream == "lores" else newest.image
+            if image is None:
+                raise ValueError(f"Stream {stream} is not configured")
+
+            os.makedirs(output_path, exist_ok=True)
+            shape = (self.slots, *image.shape[:2], 3)
+            self._shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+            self._slots = np.ndarray(shape, dtype=np.uint8, buffer=self._shm.buf)
+            self._free = list(range(self.slots))
+
+            self._reset()
+            # the sensor rate, frames.fps() is capped by how fast the
+            # callback copies frames into the ring
+            fps = fps or self.camera.frame_rate() or 30.0
+            self.encoder.conn.send(
+                ("open", self._shm.name, shape, fps, output_path, segment_seconds)
+            )
+
+            self._running = True
+            self._thread = threading.Thread(
+                target=self._run, args=(preroll_seconds, stream), daemon=True
+            )
+            self._thread.start()
+            logger.info(f"Recording {stream} at {fps:.1f} fps to {output_path}")
+            return True
+
+    def stop(self):
+        with self._lock:
+            if not self._running:
+                return self.stats()
+            self._running = False
+            self._thread.join()
+            self._thread = None
+            return self.stats()
+
+    def _poll(self, timeout=0.0):
+        # collect encoder replies, frees slots
+        conn = self.encoder.conn
+        while conn.poll(timeout):
+            message = conn.recv()
+            kind = message[0]
+            if kind == "done":
+                self._free.append(message[1])
+                self.encode_latency.add(message[2])
+                self.recorded += 1
+            elif kind == "error":
+                self._free.append(message[1])
+                self.failed += 1
+                logger.error(f"Encoder error: {message[2]}")
+            elif kind == "segment":
+                self.segments.append(message[1])
+                logger.info(f"Recording segment {message[1]}")
+            elif kind == "closed":
+                return True
+            timeout = 0.0
+        return False
+
+    def _send(self, frame, stream):
+        self._poll()
+        deadline = time.monotonic() + self.stall_timeout
+        while not self._free and time.monotonic() < deadline:
+            self._poll(timeout=deadline - time.monotonic())
+        if not self._free:
+            self.dropped_encoder += 1
+            return
+
+        image = frame.lores if stream == "lores" else frame.image
+        slot = self._free.pop()
+        if image.shape[:2] != self._slots.shape[1:3]:
+            # resolution changed under us, those frames cannot go in this file
+            self._free.append(slot)
+            self.dropped_ring += 1
+            return
+        # "rgb" is OpenCV's BGR byte order, what the encoder expects. Converted
+        # straight into shared memory, as_order() would cache a full frame
+        # copy on the ring slot until it is overwritten
+        if image.order == "rgb":
+            np.copyto(self._slots[slot], image.raw)
+        else:
+            cv.cvtColor(image.raw, cv.COLOR_BGR2RGB, dst=self._slots[slot])
+        if not self.camera.frames.is_intact(frame):
+            self._free.append(slot)
+            self.dropped_ring += 1
+            return
+        self.encoder.conn.send(("frame", slot, frame.timestamp, time.monotonic()))
+
+    def _run(self, preroll_seconds, stream):
+        frames = self.camera.frames
+        self.started_at = time.monotonic()
+        seq = frames.seq
+        try:
+            if preroll_seconds > 0:
+                for frame in frames.frames_between(
+                    self.started_at - preroll_seconds, self.started_at
+                ):
+                    self._send(frame, stream)
+                    seq = max(seq, frame.seq)
+
+            while self._running:
+                if frames.wait_for_frame(seq, timeout=0.5) is None:
+                    continue
+                seq += 1
+                frame = frames.by_seq(seq)
+                if frame is None:
+                    self.dropped_ring += 1
+                    continue
+                self._send(frame, stream)
+        finally:
+            # frames the walk never reached were not recorded either
+            self.dropped_ring += max(0, frames.seq - seq)
+            self.encoder.conn.send(("close",))
+            deadline = time.monotonic() + 10
+            while not self._poll(timeout=1.0) and time.monotonic() < deadline:
+                pass
+            del self._slots
+            self._shm.close()
+            self._shm.unlink()
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        return {
+            "recording": self._running,
+            "seconds": round(elapsed, 2),
+            "recorded": self.recorded,
+            "dropped_ring": self.dropped_ring,
+            "dropped_encoder": self.dropped_encoder,
+            "failed": self.failed,
+            "segments": list(self.segments),
+            "encode_latency": self.encode_latency.summary(),
+        }
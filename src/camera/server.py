@@ -2,12 +2,16 @@ import json
 import logging
 import dataclasses
 from typing import Callable
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import socket
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import parse_qs, urlparse
 
 import threading
 from .types import CameraParameters, CameraParameter
-from .camera import Camera
+from .camera import Camera, ChangeExpiredError, ChangeTimeoutError
+from .control_worker import ControlUpdateWorker
+from .events import TelemetryPublisher
 from dataclasses import dataclass
 
 logging.basicConfig(
@@ -25,9 +29,19 @@ class CameraParameter:
     
 
 class CameraParameterHandler(BaseHTTPRequestHandler):
+    # persistent connections, idle ones are closed after timeout seconds
+    protocol_version = "HTTP/1.1"
+    timeout = 30
+    # headers and body are separate writes, Nagle would hold the body back
+    # until the client's delayed ACK on a reused connection
+    disable_nagle_algorithm = True
+
     camera: Camera
     camera_params = None
     capture_callback = None
+    control_worker: ControlUpdateWorker = None
+    telemetry: TelemetryPublisher = None
+    camera_server: "CameraServer" = None
 
     def _send_cors_headers(self):
         self.send_header("Access-Control-Allow-Origin", "*")
@@ -35,12 +49,178 @@ class CameraParameterHandler(BaseHTTPRequestHandler):
         self.send_header("Access-Control-Allow-Headers", "Content-Type, Access-Control-Allow-Headers, Authorization, X-Requested-With")
         self.send_header("Access-Control-Max-Age", "86400")  # 24 hours
 
+    def _send_json(self, payload, status=200):
+        # HTTP/1.1 keep-alive needs a length on every response
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self._send_cors_headers()
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_events(self, rate):
+        # text/event-stream, one "state" event per telemetry snapshot at up
+        # to `rate` per second. Runs until the client goes away.
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self._send_cors_headers()
+        self.end_headers()
+
+        telemetry = self.telemetry
+        interval = 1 / rate if rate > 0 else 0.0
+        version, sent_at = 0, 0.0
+        telemetry.subscribe()
+        try:
+            self.wfile.write(b"retry: 1000\n\n")
+            while self.camera_server.running:
+                delay = sent_at + interval - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                version, payload = telemetry.wait(version, timeout=15)
+                if payload is None:
+                    # comment line, keeps proxies and idle timeouts away
+                    self.wfile.write(b": keep-alive\n\n")
+                    continue
+                sent_at = time.monotonic()
+                self.wfile.write(b"event: state\ndata: " + payload + b"\n\n")
+        except (BrokenPipeError, ConnectionError, OSError):
+            pass
+        finally:
+            telemetry.unsubscribe()
+
     def log_message(self, format, *args):
         logger.info(format % args)
 
+    @staticmethod
+    def _options(data, fields):
+        options = {}
+        for name, cast in fields:
+            value = data.get(name)
+            if isinstance(value, list):  # parse_qs values
+                value = value[0]
+            if value is not None:
+                options[name] = cast(value)
+        return options
+
+    @staticmethod
+    def _change_response(change, **extra):
+        # expected_seq is only an estimate, the frame that really carries
+        # the change comes from change_id: effective_seq with POST /params
+        # "wait", or /capture with after_change
+        return {
+            "status": "success",
+            **extra,
+            "expected_seq": change.expected_seq,
+            "change_id": change.id,
+        }
+
+    def _capture(self, options) -> bool:
+        # after_change may name a change that already left the history,
+        # answered as 410 so the client can tell it from a bad request, or
+        # one that never took effect, answered as 504 with nothing saved
+        try:
+            self.capture_callback(**options)
+        except ChangeExpiredError as e:
+            self._send_json({"error": e.args[0], "expired": True}, 410)
+            return False
+        except ChangeTimeoutError as e:
+            self._send_json({"error": e.args[0], "change_id": e.change_id}, 504)
+            return False
+        return True
+
+    @classmethod
+    def _capture_options(cls, data):
+        return cls._options(
+            data,
+            (
+                ("after_change", int),
+                ("seconds_ago", float),
+                ("burst_seconds", float),
+                ("burst_count", int),
+                ("raw", lambda v: str(v).lower() in ("1", "true", "yes")),
+                ("best", int),
+            ),
+        )
+
+    @classmethod
+    def _record_options(cls, data):
+        return cls._options(
+            data,
+            (
+                ("preroll_seconds", float),
+                ("segment_seconds", float),
+                ("stream", str),
+            ),
+        )
+
+    @staticmethod
+    def _param_updates(data, cfg):
+        # POST /params body: any subset of CameraParameters fields, checked
+        # against the sensor limits. Returns control worker updates and errors.
+        updates, errors = {}, []
+
+        def number(name, low, high, values=data):
+            try:
+                value = float(values[name])
+            except (TypeError, ValueError):
+                errors.append(f"{name} must be a number")
+                return None
+            if not low <= value <= high:
+                errors.append(f"{name} must be between {low} and {high}")
+                return None
+            return value
+
+        fields = {f.name for f in dataclasses.fields(CameraParameters)}
+        unknown = set(data) - fields - {"wait"}
+        if unknown:
+            errors.append(f"Unknown fields: {sorted(unknown)}")
+
+        if "analogue_gain" in data:
+            updates["analogue_gain"] = number("analogue_gain", cfg.min_gain, cfg.max_gain)
+        if "exposure_time" in data:
+            updates["exposure_time"] = number(
+                "exposure_time", cfg.min_exposure, cfg.max_exposue
+            )
+        if "colour_gains" in data:
+            gains = data["colour_gains"]
+            if not isinstance(gains, (list, tuple)) or len(gains) != 2:
+                errors.append("colour_gains must be [blue, red]")
+            else:
+                gains = {f"colour_gains[{i}]": gain for i, gain in enumerate(gains)}
+                for name, label in zip(("blue_gain", "red_gain"), gains):
+                    updates[name] = number(
+                        label, cfg.min_colour_gain, cfg.max_colour_gain, gains
+                    )
+        if "resolution" in data:
+            resolution = data["resolution"]
+            if (
+                not isinstance(resolution, (list, tuple))
+                or len(resolution) != 2
+                or not all(isinstance(v, int) and v > 0 for v in resolution)
+            ):
+                errors.append("resolution must be [width, height]")
+            else:
+                updates["resolution"] = tuple(resolution)
+
+        auto = {data[k] for k in ("AeEnable", "AwbEnable") if k in data}
+        if len(auto) > 1:
+            errors.append("AeEnable and AwbEnable must be equal")
+        elif auto:
+            updates["auto"] = bool(auto.pop())
+            manual = {"analogue_gain", "exposure_time", "colour_gains"} & set(data)
+            if updates["auto"] and manual:
+                errors.append(f"{sorted(manual)} cannot be set with auto mode")
+
+        return {k: v for k, v in updates.items() if v is not None}, errors
+
     def do_OPTIONS(self):
         self.send_response(200)
         self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", "2")
         self._send_cors_headers()
         self.end_headers()
         self.wfile.write(b"OK")
@@ -55,77 +235,48 @@ class CameraParameterHandler(BaseHTTPRequestHandler):
             
             if self.camera is None:
                 logger.error("Camera not initialized")
-                self.send_response(500)
-                self.send_header("Content-Type", "application/json")
-                self._send_cors_headers()
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "Camera not initialized"}).encode())
+                self._send_json({"error": "Camera not initialized"}, 500)
                 return
             
             if path in ["analogue_gain", "red_gain", "blue_gain", "exposure_time"] and 'value' in query:
                 value = float(query['value'][0])
-                latest = self.camera._params_latest
-                
-                if path == "analogue_gain":
-                    latest.analogue_gain = value
-                    logger.info(f"Updated analogue_gain to {value} via GET")
-                elif path == "red_gain":
-                    gains = latest.colour_gains
-                    latest.colour_gains = gains[0], value
-                    logger.info(f"Updated red_gain to {value} via GET")
-                elif path == "blue_gain":
-                    gains = latest.colour_gains
-                    latest.colour_gains = value, gains[1]
-                    logger.info(f"Updated blue_gain to {value} via GET")
-                elif path == "exposure_time":
-                    latest.exposure_time = value
-                    logger.info(f"Updated exposure_time to {value} via GET")
-                
-                # Set AeEnable and AwbEnable to False when manually changing parameters
-                latest.AeEnable = False
-                latest.AwbEnable = False
-                
-                self.camera.reconfigure(latest)
+
+                # manual values switch auto mode off in the worker
+                change = self.control_worker.submit(**{path: value})
+                logger.info(f"Queued {path}={value} via GET as change {change.id}")
                     
-                self.send_response(200)
-                self.send_header("Content-Type", "application/json")
-                self._send_cors_headers()
-                self.end_headers()
-                self.wfile.write(json.dumps({"status": "success"}).encode())
+                self._send_json(self._change_response(change))
                 return
             
             if path == "auto_mode":
                 # Get the current auto mode status
                 is_auto = getattr(self.camera._params_latest, "AeEnable", False) and getattr(self.camera._params_latest, "AwbEnable", False)
                 
-                self.send_response(200)
-                self.send_header("Content-Type", "application/json")
-                self._send_cors_headers()
-                self.end_headers()
-                self.wfile.write(json.dumps({"auto_mode": is_auto}).encode())
+                self._send_json({"auto_mode": is_auto})
                 return
             
             if path == "capture":
                 if self.capture_callback is not None:
-                    self.capture_callback()
+                    if not self._capture(self._capture_options(query)):
+                        return
                     logger.info("Capture triggered via GET")
                 
-                self.send_response(200)
-                self.send_header("Content-Type", "application/json")
-                self._send_cors_headers()
-                self.end_headers()
-                self.wfile.write(json.dumps({"status": "success"}).encode())
+                self._send_json({"status": "success"})
                 return
             
-            if not path or path == "params":
-                self.send_response(200)
-                self.send_header("Content-Type", "application/json")
-                self._send_cors_headers()
-                self.end_headers()
+            if path == "record":
+                self._send_json(self.camera.recorder.stats())
+                return
+
+            if path == "events":
+                rate = float(query.get("rate", [self.telemetry.rate])[0])
+                self._send_events(min(rate, self.telemetry.rate))
+                return
 
+            if not path or path == "params":
                 params = dataclasses.asdict(self.camera._params_latest)
                 params["auto_mode"] = getattr(self.camera._params_latest, "AeEnable", False) and getattr(self.camera._params_latest, "AwbEnable", False)
-                self.wfile.write(json.dumps(params).encode())
+                self._send_json(params)
                 logger.info(f"Sent camera parameters: {params}")
                 return
 
@@ -138,26 +289,14 @@ class CameraParameterHandler(BaseHTTPRequestHandler):
             elif path == "resolution":
                 value = self.camera._params_latest.resolution
             else:
-                self.send_response(404)
-                self.send_header("Content-Type", "application/json")
-                self._send_cors_headers()
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": "Parameter not found"}).encode())
+                self._send_json({"error": "Parameter not found"}, 404)
                 return
 
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json")
-            self._send_cors_headers()
-            self.end_headers()
-            self.wfile.write(json.dumps({"value": value}).encode())
+            self._send_json({"value": value})
 
         except Exception as e:
             logger.error(f"Error handling GET request: {e}")
-            self.send_response(500)
-            self.send_header("Content-Type", "application/json")
-            self._send_cors_headers()
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": str(e)}).encode())
+            self._send_json({"error": str(e)}, 500)
 
     def do_POST(self):
         try:
@@ -179,106 +318,105 @@ class CameraParameterHandler(BaseHTTPRequestHandler):
             try:
                 # Handle auto mode request
                 if path == "auto_mode" and "enabled" in data:
-                    enabled = data["enabled"]
-                    
-                    if enabled:
-                        logger.info("Enabling auto mode")
-                        self.camera.set_auto()
-                    else:
-                        logger.info("Disabling auto mode")
-                        # Create parameters with auto disabled
-                        latest = self.camera._params_latest
-                        latest.AeEnable = False
-                        latest.AwbEnable = False
-                        self.camera.reconfigure(latest)
+                    enabled = bool(data["enabled"])
+                    logger.info(f"{'Enabling' if enabled else 'Disabling'} auto mode")
+                    change = self.control_worker.submit(auto=enabled)
                     
-                    self.send_response(200)
-                    self.send_header("Content-Type", "application/json")
-                    self._send_cors_headers()
-                    self.end_headers()
-                    self.wfile.write(json.dumps({"status": "success", "auto_mode": enabled}).encode())
+                    self._send_json(self._change_response(change, auto_mode=enabled))
                     return
                 
-                latest = self.camera._params_latest
-                
-                if not hasattr(latest, "AeEnable"):
-                    latest.AeEnable = False
-                if not hasattr(latest, "AwbEnable"):
-                    latest.AwbEnable = False
-                
-                if path == "analogue_gain" and "value" in data:
-                    latest.analogue_gain = float(data['value'])
-                    latest.AeEnable = False
-                    latest.AwbEnable = False
-                    logger.info(f"Updated analogue_gain to {data['value']}")
-
-                elif path == "red_gain" and "value" in data:
-                    gains = latest.colour_gains 
-                    latest.colour_gains = gains[0], float(data["value"])
-                    latest.AeEnable = False
-                    latest.AwbEnable = False
-                    logger.info(f"Updated red_gain to {data['value']}")
-
-                elif path == "blue_gain" and "value" in data:
-                    gains = latest.colour_gains 
-                    latest.colour_gains = float(data["value"]), gains[1]
-                    latest.AeEnable = False
-                    latest.AwbEnable = False
-                    logger.info(f"Updated blue_gain to {data['value']}")
-
-                elif path == "exposure_time" and "value" in data:
-                    latest.exposure_time = float(data['value'])
-                    latest.AeEnable = False
-                    latest.AwbEnable = False
-                    logger.info(f"Updated exposure_time to {data['value']}")
+                if path in ["analogue_gain", "red_gain", "blue_gain", "exposure_time"] and "value" in data:
+                    change = self.control_worker.submit(**{path: float(data["value"])})
+                    logger.info(f"Queued {path}={data['value']} as change {change.id}")
 
                 elif path == "capture":
                     logger.info("Capture request received")
                     if self.capture_callback is not None:
-                        self.capture_callback()
+                        if not self._capture(self._capture_options(data)):
+                            return
                         logger.info("Capture callback executed")
                     else:
                         logger.warning("No capture callback registered")
                     
-                    self.send_response(200)
-                    self.send_header("Content-Type", "application/json")
-                    self._send_cors_headers()
-                    self.end_headers()
-                    self.wfile.write(json.dumps({"status": "success"}).encode())
+                    self._send_json({"status": "success"})
                     return
 
-                else:
-                    self.send_response(404)
-                    self.send_header("Content-Type", "application/json")
-                    self._send_cors_headers()
-                    self.end_headers()
-                    self.wfile.write(json.dumps({"error": "Parameter not found"}).encode())
+                elif path == "params":
+                    updates, errors = self._param_updates(data, self.camera.cfg)
+                    if errors:
+                        self._send_json({"error": "; ".join(errors), "errors": errors}, 400)
+                        return
+                    if not updates:
+                        self._send_json({"error": "No parameters given"}, 400)
+                        return
+
+                    # one worker submit, applied in a single camera update
+                    change = self.control_worker.submit(**updates)
+                    logger.info(f"Queued {updates} as change {change.id}")
+                    response = self._change_response(change)
+                    if data.get("wait"):
+                        change.applied.wait(timeout=2.0)
+                        response["effective_seq"] = change.effective_seq
+                    self._send_json(response)
+                    return
+
+                elif path in ("record/start", "record/stop"):
+                    if path == "record/start":
+                        started = self.camera_server.start_recording(
+                            **self._record_options(data)
+                        )
+                        stats = dict(self.camera.recorder.stats(), started=started)
+                    else:
+                        stats = self.camera_server.stop_recording()
+
+                    self._send_json(stats)
                     return
 
-                self.camera.reconfigure(latest)
+                else:
+                    self._send_json({"error": "Parameter not found"}, 404)
+                    return
                 
-                self.send_response(200)
-                self.send_header("Content-Type", "application/json")
-                self._send_cors_headers()
-                self.end_headers()
-                self.wfile.write(json.dumps({"status": "success"}).encode())
+                self._send_json(self._change_response(change))
 
             except Exception as e:
                 logger.error(f"Error processing request: {e}")
-                self.send_response(400)
-                self.send_header("Content-Type", "application/json")
-                self._send_cors_headers()
-                self.end_headers()
-                self.wfile.write(json.dumps({"error": str(e)}).encode())
+                self._send_json({"error": str(e)}, 400)
                 return
 
         except Exception as e:
             logger.error(f"Error handling POST request: {e}")
-            self.send_response(500)
-            self.send_header("Content-Type", "application/json")
-            self._send_cors_headers()
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": str(e)}).encode())
+            self._send_json({"error": str(e)}, 500)
+
+
+class ControlHTTPServer(ThreadingHTTPServer):
+    # one thread per connection, so a slow request or a stalled client does
+    # not hold up the others. Open connections are tracked so shutdown can
+    # wake handlers blocked on idle keep-alive sockets.
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        self._connections = set()
+        self._connections_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def process_request(self, request, client_address):
+        with self._connections_lock:
+            self._connections.add(request)
+        super().process_request(request, client_address)
+
+    def shutdown_request(self, request):
+        with self._connections_lock:
+            self._connections.discard(request)
+        super().shutdown_request(request)
+
+    def close_connections(self):
+        with self._connections_lock:
+            connections = list(self._connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
 
 
 class CameraServer:
@@ -288,12 +426,22 @@ class CameraServer:
         host="0.0.0.0",
         port=8081,
         callback_capture=None,
+        record_path="gallery/",
+        events_rate=5.0,
     ):
         self.host = host
+        self.record_path = record_path
         self.port = port
         self.server = None
+        self.thread = None
         self.camera = camera
         self.capture_callback = callback_capture
+        self.control_worker = ControlUpdateWorker(camera)
+        # GET /events, one sampler shared by every subscriber
+        self.telemetry = TelemetryPublisher(
+            camera, rate=events_rate, stats=self._control_stats
+        )
+        self.running = False
         logger.info(f"Camera server initialized at {host}:{port}")
 
     def start(self):
@@ -301,18 +449,45 @@ class CameraServer:
         CameraParameterHandler.capture_callback = self.capture_callback
         CameraParameterHandler.camera = self.camera
         CameraParameterHandler.camera_params = self.camera._params_latest
+        CameraParameterHandler.control_worker = self.control_worker
+        CameraParameterHandler.camera_server = self
+        CameraParameterHandler.telemetry = self.telemetry
+        self.running = True
+        self.control_worker.start()
+        self.telemetry.start()
 
-        self.server = HTTPServer((self.host, self.port), CameraParameterHandler)
+        self.server = ControlHTTPServer((self.host, self.port), CameraParameterHandler)
         logger.info(f"Server created at {self.host}:{self.port}")
 
         self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
         self.thread.start()
         logger.info("Server thread started")
 
+    def _control_stats(self):
+        return {
+            "controls_applied": self.control_worker.applied,
+            "controls_merged": self.control_worker.merged,
+        }
+
+    def start_recording(self, **options) -> bool:
+        # preroll_seconds, segment_seconds, stream, see Recorder.start
+        return self.camera.recorder.start(self.record_path, **options)
+
+    def stop_recording(self):
+        return self.camera.recorder.stop()
+
     def stop(self):
         logger.info("Stopping camera server...")
-        if self.thread:
-            self.thread.join(timeout=0)
+        self.running = False
+        # wakes /events handlers so shutdown does not wait for their timeout
+        self.telemetry.stop()
         if self.server:
             self.server.shutdown()
+            self.server.close_connections()
+            self.server.server_close()
+            self.server = None
+        if self.thread:
+            self.thread.join(timeout=1)
+            self.thread = None
+        self.control_worker.stop()
         logger.info("Camera server stopped")
\ No newline at end of file
@@ -1,10 +1,13 @@
 import dataclasses
+import threading
 from typing import Tuple
 from typing import List
 from typing import Literal
 from typing import Union
+from typing import Optional
 
 import numpy as np
+import cv2 as cv
 
 
 @dataclasses.dataclass
@@ -21,14 +24,103 @@ class CameraParameter:
     name: Literal["analogue_gain", "red_gain", "blue_gain", "exposure_time"]
     value: Union[float, int]
 
+@dataclasses.dataclass
+class ControlChange:
+    id: int
+    target: Optional[CameraParameters] = None
+    requested_seq: int = 0
+    expected_seq: int = 0
+    effective_seq: Optional[int] = None
+    applied: threading.Event = dataclasses.field(
+        default_factory=threading.Event, repr=False, compare=False
+    )
+
+@dataclasses.dataclass
+class BurstResult:
+    paths: List[str]
+    dropped: int = 0
+    # best-of-burst: sharpness of every saved frame, paths sharpest first
+    scores: List[float] = dataclasses.field(default_factory=list)
+
 @dataclasses.dataclass
 class RuntimeFrameMetadata:
     lux: float
     temperature: float
 
+@dataclasses.dataclass
+class CaptureMetadata:
+    # what a saved capture records, in the image and in the gallery index
+    timestamp: float  # wall clock of the frame, seconds since the epoch
+    seq: int
+    exposure_time: int
+    analogue_gain: float
+    colour_gains: Tuple[float, float]
+    lux: float
+    temperature: float
+    resolution: Tuple[int, int]
+    sharpness: Optional[float] = None
+    burst: Optional[str] = None
+    burst_index: Optional[int] = None
+
+class LazyFrame:
+    _conversions = {
+        ("bgr", "rgb"): cv.COLOR_BGR2RGB,
+        ("rgb", "bgr"): cv.COLOR_RGB2BGR,
+        ("bgr", "gray"): cv.COLOR_BGR2GRAY,
+        ("rgb", "gray"): cv.COLOR_RGB2GRAY,
+    }
+
+    def __init__(self, raw: np.ndarray, order: Literal["bgr", "rgb"] = "bgr"):
+        self.raw = raw
+        self.order = order
+        self._converted = {}
+
+    @property
+    def shape(self):
+        return self.raw.shape
+
+    def _convert(self, image: np.ndarray, order: str) -> np.ndarray:
+        if order == self.order:
+            return image
+        return cv.cvtColor(image, self._conversions[(self.order, order)])
+
+    def as_order(self, order: str = "rgb") -> np.ndarray:
+        if order not in self._converted:
+            self._converted[order] = self._convert(self.raw, order)
+        return self._converted[order]
+
+    def crop(self, x: int, y: int, w: int, h: int, order: str = "rgb") -> np.ndarray:
+        if order in self._converted:
+            return self._converted[order][y : y + h, x : x + w].copy()
+
+        region = self.raw[y : y + h, x : x + w]
+        if order == self.order:
+            return region.copy()
+        return self._convert(region, order)
+
+    def center_crop(self, side: int, order: str = "rgb") -> np.ndarray:
+        h, w = self.raw.shape[:2]
+        return self.crop(w // 2 - side // 2, h // 2 - side // 2, side, side, order)
+
+    def resize(
+        self, size: Tuple[int, int], order: str = "rgb", interpolation=cv.INTER_AREA
+    ) -> np.ndarray:
+        return self._convert(cv.resize(self.raw, size, interpolation=interpolation), order)
+
+
 @dataclasses.dataclass
 class CameraFrameWrapper:
-    frame: np.ndarray
+    image: LazyFrame
     metadata: CameraParameters
     timestamp: float
     runtime_metadata: RuntimeFrameMetadata
+    seq: int = 0
+    lores: Optional[LazyFrame] = None
+
+    @property
+    def frame(self) -> np.ndarray:
+        return self.image.as_order("rgb")
+
+    @property
+    def preview(self) -> LazyFrame:
+        return self.lores if self.lores is not None else self.image
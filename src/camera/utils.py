@@ -1,24 +1,53 @@
-from .types import CameraFrameWrapper
+from .types import (
+    CameraFrameWrapper,
+    CameraParameters,
+    LazyFrame,
+    RuntimeFrameMetadata,
+)
+from .backend import probe_camera_controls
 
-import picamera2 as pc2
+import cv2 as cv
 import numpy as np
-import logging
+import bisect
+import math
+import threading
 import time
 
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
 
 class Config:
-    _camera = pc2.Picamera2()
-    _camera.set_logging(level=logging.CRITICAL)
-    _cfg = _camera.create_still_configuration(raw={})
-    _camera.configure(_cfg)
+    _camera_controls = probe_camera_controls()
 
-    min_gain = _camera.camera_controls["AnalogueGain"][0]
-    max_gain = _camera.camera_controls["AnalogueGain"][1]
-    min_exposure = _camera.camera_controls["ExposureTime"][0]
-    max_exposue = _camera.camera_controls["ExposureTime"][1]
-    _camera.close()
+    min_gain = _camera_controls["AnalogueGain"][0]
+    max_gain = _camera_controls["AnalogueGain"][1]
+    min_exposure = _camera_controls["ExposureTime"][0]
+    max_exposue = _camera_controls["ExposureTime"][1]
+    min_colour_gain = _camera_controls.get("ColourGains", (0.0, 32.0))[0]
+    max_colour_gain = _camera_controls.get("ColourGains", (0.0, 32.0))[1]
+
+
+class RollingStats:
+    def __init__(self, size=512):
+        self._values = np.zeros(size, dtype=np.float64)
+        self._index = 0
+        self.count = 0
+
+    def add(self, value: float):
+        self._values[self._index] = value
+        self._index = (self._index + 1) % len(self._values)
+        self.count += 1
+
+    def summary(self) -> Dict[str, float]:
+        values = self._values[: min(self.count, len(self._values))]
+        if len(values) == 0:
+            return {"count": 0, "mean": 0.0, "p99": 0.0, "max": 0.0}
+        return {
+            "count": self.count,
+            "mean": float(values.mean()),
+            "p99": float(np.percentile(values, 99)),
+            "max": float(values.max()),
+        }
 
 
 class CamUtils:
@@ -34,23 +63,290 @@ class CamUtils:
             return
         return microseconds / 1_000_000
 
+    @staticmethod
+    def sharpness(crop: np.ndarray) -> float:
+        # mean difference to a 13x13 box blur, the focus readout on the display
+        gray = cv.cvtColor(crop, cv.COLOR_BGR2GRAY)
+        return float(np.mean(cv.absdiff(gray, cv.blur(gray, (13, 13)))))
+
+    @staticmethod
+    def sharpness_batch(crops: np.ndarray, ksize=13) -> np.ndarray:
+        # the same metric for (N, H, W, 3) BGR crops at once: the crops are
+        # stacked into one tall image so a single cvtColor and blur cover
+        # all of them, the rows where neighbours bleed into the blur are
+        # left out of the mean
+        n, h, w = crops.shape[:3]
+        gray = cv.cvtColor(crops.reshape(n * h, w, 3), cv.COLOR_BGR2GRAY)
+        diff = cv.absdiff(gray, cv.blur(gray, (ksize, ksize))).reshape(n, h, w)
+        r = ksize // 2
+        return diff[:, r : h - r, r : w - r].mean(axis=(1, 2))
+
+
+class FrameConsumer:
+    def __init__(self, frames: "FrameList", name: str):
+        self.name = name
+        self.last_seq = frames.seq
+        self.received = 0
+        self.dropped = 0
+        self._frames = frames
+
+    def wait_for_frame(self, timeout=None) -> Optional[CameraFrameWrapper]:
+        frame = self._frames.wait_for_frame(self.last_seq, timeout)
+        if frame is None:
+            return None
+
+        self.dropped += frame.seq - self.last_seq - 1
+        self.received += 1
+        self.last_seq = frame.seq
+        return frame
+
 
 class FrameList:
-    def __init__(self, capacity_seconds=2):
-        self._list: List[CameraFrameWrapper] = list()
+    def __init__(self, capacity_seconds=2, max_fps=40, max_bytes=1 << 30):
+        # max_fps is only the initial guess, resize() takes the sensor mode's
+        # rate so the ring always spans capacity_seconds
         self._capacity = capacity_seconds
+        self._max_slots = self._slots_for(max_fps)
+        self._max_bytes = max_bytes
+        self._slots = self._max_slots
+
+        # one preallocated (N, H, W, 3) block per stream, allocated by resize()
+        self._frames: Optional[np.ndarray] = None
+        self._lores_frames: Optional[np.ndarray] = None
+        self._timestamps = np.zeros(self._slots, dtype=np.float64)
+        self._images: List[Optional[LazyFrame]] = [None] * self._slots
+        self._lores_images: List[Optional[LazyFrame]] = [None] * self._slots
+        self._metadata: List[Optional[CameraParameters]] = [None] * self._slots
+        self._runtime_metadata: List[Optional[RuntimeFrameMetadata]] = [
+            None
+        ] * self._slots
+
+        self._head = 0  # next slot to write
+        self._count = 0
+
+        # seq of the newest committed frame, only ever written by the producer
+        self._seq = 0
+        self._slot_seq = np.zeros(self._slots, dtype=np.int64)
+        self._waiters = 0
+        self._published = threading.Condition()
+        # named consumers are for the long-lived loops (preview, recorder,
+        # telemetry), not per request
+        self._consumers: Dict[str, FrameConsumer] = {}
+        self._consumers_lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    @staticmethod
+    def _resolution(block: Optional[np.ndarray]) -> Optional[Tuple[int, int]]:
+        if block is None:
+            return None
+        return block.shape[2], block.shape[1]
+
+    @property
+    def resolution(self) -> Optional[Tuple[int, int]]:
+        return self._resolution(self._frames)
+
+    @property
+    def lores_resolution(self) -> Optional[Tuple[int, int]]:
+        return self._resolution(self._lores_frames)
+
+    def _block(self, resolution: Optional[Tuple[int, int]]) -> Optional[np.ndarray]:
+        if resolution is None:
+            return None
+        width, height = int(resolution[0]), int(resolution[1])
+        return np.empty((self._slots, height, width, 3), dtype=np.uint8)
+
+    def _slots_for(self, fps: float) -> int:
+        return max(2, int(math.ceil(self._capacity * fps)))
+
+    def resize(
+        self,
+        resolution: Tuple[int, int],
+        lores_resolution: Optional[Tuple[int, int]] = None,
+        fps: Optional[float] = None,
+    ):
+        def normalized(r):
+            return None if r is None else (int(r[0]), int(r[1]))
+
+        max_slots = self._max_slots if fps is None else self._slots_for(fps)
+        if (
+            self._frames is not None
+            and self.resolution == normalized(resolution)
+            and self.lores_resolution == normalized(lores_resolution)
+            and self._max_slots == max_slots
+        ):
+            return
+        self._max_slots = max_slots
+
+        # fewer slots for big frames, full resolution would not fit otherwise
+        slot_bytes = sum(
+            r[0] * r[1] * 3
+            for r in (normalized(resolution), normalized(lores_resolution))
+            if r is not None
+        )
+        self._slots = max(2, min(self._max_slots, self._max_bytes // slot_bytes))
+        self._timestamps = np.zeros(self._slots, dtype=np.float64)
+        self._slot_seq = np.zeros(self._slots, dtype=np.int64)
+
+        # drop the old blocks before allocating the new ones
+        self._frames = self._lores_frames = None
+        self._frames = self._block(resolution)
+        self._lores_frames = self._block(lores_resolution)
+        self._images = [None] * self._slots
+        self._lores_images = [None] * self._slots
+        self._metadata = [None] * self._slots
+        self._runtime_metadata = [None] * self._slots
+        self._head = 0
+        self._count = 0
+
+    def next_slot(self) -> np.ndarray:
+        return self._frames[self._head]
+
+    def next_lores_slot(self) -> Optional[np.ndarray]:
+        if self._lores_frames is None:
+            return None
+        return self._lores_frames[self._head]
+
+    def commit(
+        self,
+        metadata: CameraParameters,
+        runtime_metadata: RuntimeFrameMetadata,
+        timestamp: float,
+        order="bgr",
+    ):
+        slot = self._head
+        seq = self._seq + 1
+        self._timestamps[slot] = timestamp
+        # fresh LazyFrame per frame, conversions cached on the old one die with it
+        self._images[slot] = LazyFrame(self._frames[slot], order)
+        if self._lores_frames is not None:
+            self._lores_images[slot] = LazyFrame(self._lores_frames[slot], order)
+        self._metadata[slot] = metadata
+        self._runtime_metadata[slot] = runtime_metadata
+        self._slot_seq[slot] = seq
+
+        self._head = (slot + 1) % self._slots
+        self._count = min(self._count + 1, self._slots)
+        self._seq = seq
+
+        # consumers bump _waiters before re-checking _seq, so skipping the
+        # lock when nobody is waiting cannot lose a wakeup
+        if self._waiters:
+            with self._published:
+                self._published.notify_all()
 
     def add(self, frame: CameraFrameWrapper):
-        self._list.append(frame)
-        to_remove = 0
-        for i, f in enumerate(self._list):
-            if time.monotonic() - f.timestamp > self._capacity:
-                to_remove += 1
+        h, w = frame.image.shape[:2]
+        lores_resolution = None
+        if frame.lores is not None:
+            lores_resolution = frame.lores.shape[1::-1]
+        self.resize((w, h), lores_resolution)
+        np.copyto(self.next_slot(), frame.image.raw)
+        if frame.lores is not None:
+            np.copyto(self.next_lores_slot(), frame.lores.raw)
+        self.commit(
+            frame.metadata, frame.runtime_metadata, frame.timestamp, frame.image.order
+        )
+
+    def _slot(self, index: int) -> int:
+        # index 0 is the oldest buffered frame, count - 1 the newest
+        return (self._head - self._count + index) % self._slots
 
-        self._list = self._list[to_remove:]
+    def _bisect(self, timestamp: float, right=False) -> int:
+        timestamps = self._timestamps
+        start = self._head - self._count
+        slots = self._slots
+        search = bisect.bisect_right if right else bisect.bisect_left
+        return search(
+            range(self._count),
+            timestamp,
+            key=lambda i: timestamps[(start + i) % slots],
+        )
+
+    def _wrap(self, slot: int) -> CameraFrameWrapper:
+        return CameraFrameWrapper(
+            image=self._images[slot],
+            metadata=self._metadata[slot],
+            timestamp=float(self._timestamps[slot]),
+            runtime_metadata=self._runtime_metadata[slot],
+            seq=int(self._slot_seq[slot]),
+            lores=self._lores_images[slot],
+        )
+
+    def by_seq(self, seq: int) -> Optional[CameraFrameWrapper]:
+        age = self._seq - seq
+        if age < 0 or age >= self._count:
+            return None
+        return self._wrap((self._head - 1 - age) % self._slots)
+
+    def wait_for_frame(
+        self, after_seq: int, timeout=None
+    ) -> Optional[CameraFrameWrapper]:
+        if self._seq <= after_seq:
+            with self._published:
+                self._waiters += 1
+                try:
+                    if not self._published.wait_for(
+                        lambda: self._seq > after_seq, timeout
+                    ):
+                        return None
+                finally:
+                    self._waiters -= 1
+
+        return self._wrap((self._head - 1) % self._slots)
+
+    def is_intact(self, frame: CameraFrameWrapper) -> bool:
+        # the producer writes into frame's slot only after publishing
+        # frame.seq + slots - 1, check this after reading a buffered frame
+        return self._seq - frame.seq < self._slots - 1
+
+    def consumer(self, name: str) -> FrameConsumer:
+        with self._consumers_lock:
+            if name not in self._consumers:
+                self._consumers[name] = FrameConsumer(self, name)
+            return self._consumers[name]
+
+    def consumer_stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            name: {"received": c.received, "dropped": c.dropped}
+            for name, c in list(self._consumers.items())
+        }
+
+    def fps(self) -> float:
+        # frame intervals over what is buffered, not a count divided by the
+        # capacity, which would cap the rate at the ring's size
+        if self._count < 2:
+            return 0.0
+        newest = self._timestamps[self._slot(self._count - 1)]
+        if time.monotonic() - newest > self._capacity:
+            return 0.0  # stalled
+        span = newest - self._timestamps[self._slot(0)]
+        return (self._count - 1) / span if span > 0 else 0.0
+
+    def nearest(self, timestamp: float) -> Optional[CameraFrameWrapper]:
+        if self._count == 0:
+            return None
+
+        i = self._bisect(timestamp)
+        if i == self._count:
+            i -= 1
+        elif i > 0:
+            before = self._timestamps[self._slot(i - 1)]
+            after = self._timestamps[self._slot(i)]
+            if timestamp - before <= after - timestamp:
+                i -= 1
+        return self._wrap(self._slot(i))
 
     def get(self, seconds_ago: float):
-        time_errors = []
-        for f in self._list:
-            time_errors.append((time.monotonic() - seconds_ago) - f.timestamp)
-        return self._list[np.argmin(time_errors)]
+        return self.nearest(time.monotonic() - seconds_ago)
+
+    def frames_between(self, t0: float, t1: float) -> List[CameraFrameWrapper]:
+        # t0, t1 are time.monotonic() values, both ends inclusive, oldest first
+        lo = self._bisect(t0)
+        hi = self._bisect(t1, right=True)
+        return [self._wrap(self._slot(i)) for i in range(lo, hi)]
@@ -0,0 +1,113 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+import cv2 as cv
+
+from .metadata import CaptureIndex, embed
+from .types import CaptureMetadata, LazyFrame
+from .utils import CamUtils, RollingStats
+
+logger = logging.getLogger("gallery-writer")
+
+
+class GalleryWriter:
+    def __init__(self, workers=2, max_queue=8, put_timeout=None):
+        self.put_timeout = put_timeout
+        self.queue_wait = RollingStats()
+        self.encode_time = RollingStats()
+        self.write_time = RollingStats()
+        self.written = 0
+        self.failed = 0
+        # called with the path of every file written, from a writer thread
+        self.on_written: List[Callable[[str], None]] = []
+        # index.jsonl of each gallery directory written to
+        self.index = CaptureIndex()
+        self._queue = queue.Queue(max_queue)
+        self._threads = [
+            threading.Thread(target=self._run, name=f"gallery-writer-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(
+        self,
+        image: LazyFrame,
+        path: str,
+        order="rgb",
+        params=(),
+        metadata: Optional[CaptureMetadata] = None,
+    ) -> Future:
+        # image must not alias a ring buffer slot (see Camera.pin). Blocks
+        # while the queue is full and raises queue.Full after put_timeout.
+        # metadata is embedded in the file and appended to the gallery index.
+        future = Future()
+        self._queue.put(
+            (image, path, order, list(params), metadata, future, time.perf_counter()),
+            timeout=self.put_timeout,
+        )
+        return future
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            image, path, order, params, metadata, future, queued = item
+            started = time.perf_counter()
+            self.queue_wait.add(started - queued)
+            try:
+                ext = os.path.splitext(path)[1] or ".png"
+                ok, encoded = cv.imencode(ext, image.as_order(order), params)
+                if not ok:
+                    raise RuntimeError(f"Failed to encode {path}")
+                data = encoded.tobytes()
+                if metadata is not None:
+                    if metadata.sharpness is None:
+                        metadata.sharpness = CamUtils.sharpness(
+                            image.center_crop(170, order="bgr")
+                        )
+                    data = embed(data, ext, metadata)
+                encoded_at = time.perf_counter()
+                self.encode_time.add(encoded_at - started)
+
+                with open(path, "wb") as f:
+                    f.write(data)
+                if metadata is not None:
+                    self.index.append(path, metadata)
+                self.write_time.add(time.perf_counter() - encoded_at)
+
+                self.written += 1
+                future.set_result(path)
+                for callback in self.on_written:
+                    callback(path)
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error saving {path}: {e}")
+                future.set_exception(e)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth,
+            "written": self.written,
+            "failed": self.failed,
+            "queue_wait": self.queue_wait.summary(),
+            "encode": self.encode_time.summary(),
+            "write": self.write_time.summary(),
+        }
+
+    def close(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
@@ -0,0 +1,433 @@
+import bisect
+import functools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+import cv2
+
+from ..camera.metadata import CaptureIndex
+from .static import ReuseAddressServer, StaticRequestHandler
+
+logger = logging.getLogger("gallery")
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+THUMBS_DIR = ".thumbs"
+GALLERY_PAGE = os.path.join(os.path.dirname(__file__), "..", "client", "gallery.html")
+
+
+class ThumbnailCache:
+    """
+    JPEG thumbnails under <root>/.thumbs/, mirroring the gallery layout. A
+    thumbnail is valid while its mtime is not older than the image's, so
+    an overwritten capture gets a new one. submit() queues generation on
+    a background thread, get() generates on demand when nothing valid is
+    cached yet.
+    """
+
+    def __init__(self, root, width=320, quality=80):
+        self.root = os.path.abspath(root)
+        self.width = width
+        self.quality = quality
+        self.generated = 0
+        self.failed = 0
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def path(self, relpath: str) -> str:
+        return os.path.join(self.root, THUMBS_DIR, relpath + ".jpg")
+
+    def is_valid(self, relpath: str) -> bool:
+        try:
+            source = os.stat(os.path.join(self.root, relpath)).st_mtime
+            return os.stat(self.path(relpath)).st_mtime >= source
+        except FileNotFoundError:
+            return False
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def submit(self, relpath: str):
+        with self._lock:
+            if relpath in self._pending:
+                return
+            self._pending.add(relpath)
+        self._queue.put(relpath)
+
+    def get(self, relpath: str) -> Optional[str]:
+        if not self.is_valid(relpath) and not self.generate(relpath):
+            return None
+        return self.path(relpath)
+
+    def generate(self, relpath: str) -> bool:
+        source = os.path.join(self.root, relpath)
+        # the decoder skips most of the work for JPEG when reducing by 4
+        image = cv2.imread(source, cv2.IMREAD_REDUCED_COLOR_4)
+        if image is None:
+            image = cv2.imread(source, cv2.IMREAD_COLOR)
+        if image is None:
+            self.failed += 1
+            logger.error(f"Cannot read {source} for a thumbnail")
+            return False
+
+        h, w = image.shape[:2]
+        if w > self.width:
+            size = (self.width, max(1, round(h * self.width / w)))
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode(
+            ".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+        )
+        if not ok:
+            self.failed += 1
+            return False
+
+        path = self.path(relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # concurrent readers see the old or the new file, never a partial one
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(encoded.tobytes())
+        os.replace(tmp, path)
+        self.generated += 1
+        return True
+
+    def _run(self):
+        while True:
+            relpath = self._queue.get()
+            if relpath is None:
+                break
+            with self._lock:
+                self._pending.discard(relpath)
+            try:
+                if not self.is_valid(relpath):
+                    self.generate(relpath)
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Thumbnail for {relpath} failed: {e}")
+
+
+class GalleryIndex:
+    """
+    Captures under root, newest first. Entries are kept sorted by
+    (mtime, path) and only directories whose mtime changed since the last
+    refresh are listed again, with a stat for new names only, so a refresh
+    over an unchanged gallery costs one stat per directory. added() inserts
+    or updates a file without any listing.
+    """
+
+    def __init__(self, root, refresh_interval=1.0):
+        self.root = os.path.abspath(root)
+        self.refresh_interval = refresh_interval
+        self._keys: List[Tuple[float, str]] = []
+        self._entries: Dict[str, dict] = {}
+        self._by_dir: Dict[str, set] = {}
+        # directory -> (mtime when listed, subdirectories)
+        self._dirs: Dict[str, Tuple[float, List[str]]] = {}
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _insert(self, relpath: str, stat):
+        self._remove(relpath)
+        directory, name = os.path.split(relpath)
+        self._entries[relpath] = {
+            "path": relpath,
+            "name": name,
+            "gallery": directory,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+        }
+        self._by_dir.setdefault(directory, set()).add(relpath)
+        bisect.insort(self._keys, (stat.st_mtime, relpath))
+
+    def _remove(self, relpath: str):
+        entry = self._entries.pop(relpath, None)
+        if entry is not None:
+            self._by_dir[entry["gallery"]].discard(relpath)
+            index = bisect.bisect_left(self._keys, (entry["mtime"], relpath))
+            del self._keys[index]
+
+    def _scan(self, directory: str) -> List[str]:
+        # relist one directory, returns its subdirectories
+        gone = set(self._by_dir.get(directory, ()))
+        subdirs = []
+        with os.scandir(os.path.join(self.root, directory)) as it:
+            for item in it:
+                relpath = os.path.join(directory, item.name)
+                if item.is_dir():
+                    if not item.name.startswith("."):
+                        subdirs.append(relpath)
+                elif item.name.lower().endswith(IMAGE_EXTENSIONS):
+                    gone.discard(relpath)
+                    # captures get new names, only new files need a stat
+                    if relpath not in self._entries:
+                        self._insert(relpath, item.stat())
+        for relpath in gone:
+            self._remove(relpath)
+        return subdirs
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._refreshed_at < self.refresh_interval:
+            return
+        with self._lock:
+            self._refreshed_at = now
+            seen = set()
+            pending = [""]
+            while pending:
+                directory = pending.pop()
+                try:
+                    mtime = os.stat(os.path.join(self.root, directory)).st_mtime
+                except FileNotFoundError:
+                    continue
+                seen.add(directory)
+                listed = self._dirs.get(directory)
+                if listed is None or listed[0] != mtime:
+                    listed = self._dirs[directory] = (mtime, self._scan(directory))
+                pending.extend(listed[1])
+
+            # added() can index files in directories not listed yet
+            for directory in (set(self._dirs) | set(self._by_dir)) - seen:
+                self._dirs.pop(directory, None)
+                for relpath in list(self._by_dir.get(directory, ())):
+                    self._remove(relpath)
+                self._by_dir.pop(directory, None)
+
+    def added(self, path: str) -> Optional[str]:
+        # a capture was written, returns its path relative to root
+        relpath = os.path.relpath(os.path.abspath(path), self.root)
+        if relpath.startswith("..") or not relpath.lower().endswith(IMAGE_EXTENSIONS):
+            return None
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self._insert(relpath, stat)
+        return relpath
+
+    def page(self, page=0, per_page=60, gallery=None) -> dict:
+        self.refresh()
+        with self._lock:
+            keys = self._keys
+            if gallery is not None:
+                keys = [k for k in keys if self._entries[k[1]]["gallery"] == gallery]
+            total = len(keys)
+            end = total - page * per_page
+            start = max(0, end - per_page)
+            items = [self._entries[k[1]] for k in reversed(keys[start:max(0, end)])]
+        return {
+            "total": total,
+            "page": page,
+            "per_page": per_page,
+            "pages": (total + per_page - 1) // per_page,
+            "items": items,
+        }
+
+    def galleries(self) -> List[dict]:
+        self.refresh()
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for entry in self._entries.values():
+                counts[entry["gallery"]] = counts.get(entry["gallery"], 0) + 1
+        return [{"gallery": g, "count": n} for g, n in sorted(counts.items())]
+
+
+class GalleryRequestHandler(StaticRequestHandler):
+    # index.jsonl is appended to, thumbnails are rerendered in place and a
+    # capture can be fetched while it is still being written, so everything
+    # revalidates by ETag and an unchanged file costs a 304
+    cache_control = "no-cache"
+    # set on the class GalleryServer creates
+    page: Optional[str] = None
+    index: GalleryIndex = None
+    thumbnails: ThumbnailCache = None
+    captures: CaptureIndex = None
+    # numeric CaptureMetadata fields /api/captures filters with min_/max_
+    ranged = (
+        "timestamp",
+        "seq",
+        "exposure_time",
+        "analogue_gain",
+        "lux",
+        "temperature",
+        "sharpness",
+        "burst_index",
+    )
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def translate_path(self, path):
+        # the gallery page instead of the root directory listing
+        if self.page is not None and urlparse(path).path == "/":
+            return self.page
+        return super().translate_path(path)
+
+    def end_headers(self):
+        # the controls page is served from another port
+        self.send_header("Access-Control-Allow-Origin", "*")
+        super().end_headers()
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _with_urls(self, items):
+        return [
+            dict(
+                item,
+                url="/" + quote(item["path"]),
+                thumbnail=f"/{THUMBS_DIR}/" + quote(item["path"]) + ".jpg",
+            )
+            for item in items
+        ]
+
+    def _send_captures(self, query):
+        # e.g. ?gallery=gallery3&max_lux=10 or ?burst=<id>&order=-sharpness&limit=1
+        gallery = os.path.normpath(query.get("gallery", [""])[0] or ".")
+        if gallery.startswith("..") or os.path.isabs(gallery):
+            self._send_json({"error": "Unknown gallery"}, 404)
+            return
+        try:
+            ranges = {}
+            for field in self.ranged:
+                low = query.get(f"min_{field}", [None])[0]
+                high = query.get(f"max_{field}", [None])[0]
+                if low is not None or high is not None:
+                    ranges[field] = (
+                        float(low) if low is not None else None,
+                        float(high) if high is not None else None,
+                    )
+            limit = query.get("limit", [None])[0]
+            limit = int(limit) if limit is not None else None
+        except ValueError:
+            self._send_json({"error": "Filters and limit must be numbers"}, 400)
+            return
+        equals = {"burst": query["burst"][0]} if "burst" in query else None
+        order = query.get("order", [None])[0]
+
+        records = self.captures.query(
+            os.path.join(self.index.root, gallery), ranges, equals, order, limit
+        )
+        gallery = "" if gallery == "." else gallery
+        items = [dict(r, path=os.path.join(gallery, r["file"])) for r in records]
+        self._send_json({"total": len(items), "items": self._with_urls(items)})
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        path = unquote(parsed.path)
+        query = parse_qs(parsed.query)
+
+        if path == "/api/index":
+            try:
+                page = max(0, int(query.get("page", [0])[0]))
+                per_page = min(500, max(1, int(query.get("per_page", [60])[0])))
+            except ValueError:
+                self._send_json({"error": "page and per_page must be integers"}, 400)
+                return
+            result = self.index.page(page, per_page, query.get("gallery", [None])[0])
+            result["items"] = self._with_urls(result["items"])
+            self._send_json(result)
+            return
+
+        if path == "/api/captures":
+            self._send_captures(query)
+            return
+
+        if path == "/api/galleries":
+            self._send_json(self.index.galleries())
+            return
+
+        prefix = f"/{THUMBS_DIR}/"
+        if path.startswith(prefix) and path.endswith(".jpg"):
+            relpath = os.path.normpath(path[len(prefix) : -len(".jpg")])
+            if relpath.startswith("..") or os.path.isabs(relpath):
+                self.send_error(404)
+                return
+            if self.thumbnails.get(relpath) is None:
+                self.send_error(404)
+                return
+
+        super().do_GET()
+
+
+class GalleryServer:
+    """
+    Serves the captures under directory: the files themselves, JPEG
+    thumbnails under /.thumbs/<path>.jpg, a newest-first index as JSON
+    at /api/index?page=&per_page=&gallery= and capture metadata queries
+    over each gallery's index.jsonl at /api/captures. Call added() with
+    every saved capture (see GalleryWriter.on_written) to index it and
+    render its thumbnail in the background. page (src/client/gallery.html
+    by default) is served at /.
+    """
+
+    def __init__(self, directory, port=4800, thumbnail_width=320, page=GALLERY_PAGE):
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self.port = port
+        self.index = GalleryIndex(self.directory)
+        self.thumbnails = ThumbnailCache(self.directory, width=thumbnail_width)
+        self.server_thread = None
+
+        handler_class = type(
+            "GalleryHandler",
+            (GalleryRequestHandler,),
+            {
+                "page": os.path.abspath(page) if page else None,
+                "index": self.index,
+                "thumbnails": self.thumbnails,
+                "captures": CaptureIndex(),
+            },
+        )
+        # see StaticHTTPServer, directory has to reach __init__
+        handler_class = functools.partial(handler_class, directory=self.directory)
+
+        self.httpd = ReuseAddressServer(("", self.port), handler_class)
+
+    def added(self, path: str):
+        relpath = self.index.added(path)
+        if relpath is not None:
+            self.thumbnails.submit(relpath)
+
+    def start(self):
+        if self.server_thread is not None and self.server_thread.is_alive():
+            return
+        self.thumbnails.start()
+        self.index.refresh(force=True)
+        self.server_thread = threading.Thread(
+            target=self.httpd.serve_forever, daemon=True
+        )
+        self.server_thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thumbnails.stop()
+        if self.server_thread is not None:
+            self.server_thread.join(timeout=1)
+            self.server_thread = None
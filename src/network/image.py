@@ -1,21 +1,187 @@
+import asyncio
+import base64
+import dataclasses
+import hashlib
 import http.server
+import json
+import queue
+import struct
 import socketserver
 import numpy as np
 import threading
 import cv2
 import socket
 import time
+from urllib.parse import parse_qs, urlparse
+
+
+STREAM_HEADERS = (
+    ("Content-type", "multipart/x-mixed-replace; boundary=--boundary"),
+    ("Cache-Control", "no-store, no-cache, must-revalidate, max-age=0"),
+    ("Access-Control-Allow-Origin", "*"),
+)
+
+
+def mjpeg_part(jpeg: bytes) -> bytes:
+    return (
+        b"--boundary\r\n"
+        b"Content-Type: image/jpeg\r\n"
+        + f"Content-Length: {len(jpeg)}\r\n\r\n".encode()
+        + jpeg
+        + b"\r\n"
+    )
+
+
+# /frames.ws message header: version, format, width, height, length of the
+# JSON metadata that follows, frame seq, frame timestamp (little endian)
+WS_HEADER = struct.Struct("<BBHHHId")
+WS_FORMATS = {"jpeg": 0, "rgb565": 1}
+WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def ws_accept(key: str) -> str:
+    return base64.b64encode(hashlib.sha1(key.encode() + WS_GUID).digest()).decode()
+
+
+def ws_binary(payload: bytes) -> bytes:
+    # single unmasked binary frame, server to client
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x82, length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x82, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x82, 127, length)
+    return header + payload
+
+
+def scaled_size(shape, width: int):
+    height, frame_width = shape[:2]
+    return width, max(1, round(height * width / frame_width))
+
+
+class RateController:
+    """
+    Picks the JPEG quality and width one viewer receives. Every window it
+    compares the achieved send rate against max_kbps (if given) and checks
+    for dropped frames, which mean the link could not keep up. Over budget
+    it lowers quality first, then resolution, and restores them in reverse
+    order once there is headroom. Quality and scale move in fixed steps so
+    viewers in similar conditions share an encoding.
+    """
+
+    scales = (1.0, 0.75, 0.5, 0.375, 0.25)
+    quality_step = 10
+    min_quality = 40
+    headroom = 0.7
+
+    def __init__(self, quality=90, max_kbps=None, width=None, window=1.0, format="jpeg"):
+        self.format = format
+        self.max_quality = quality
+        self.max_kbps = max_kbps
+        self.max_width = width
+        self.window = window
+        self.quality = quality
+        self.scale = 0
+        self.kbps = 0.0
+        self._bytes = 0
+        self._dropped = 0
+        self._window_start = time.monotonic()
+
+    @classmethod
+    def from_query(cls, query: str, quality=90, formats=("jpeg",)):
+        # ?max_kbps=2000&width=640&format=rgb565, raises ValueError on bad values
+        params = {k: v[-1] for k, v in parse_qs(query).items()}
+        max_kbps = float(params["max_kbps"]) if "max_kbps" in params else None
+        width = int(params["width"]) if "width" in params else None
+        format = params.get("format", formats[0])
+        if (max_kbps is not None and max_kbps <= 0) or (width is not None and width <= 0):
+            raise ValueError("max_kbps and width must be positive")
+        if format not in formats:
+            raise ValueError(f"format must be one of {formats}")
+        if format == "rgb565" and width is None:
+            width = 320  # uncompressed, keep it small by default
+        return cls(quality, max_kbps, width, format=format)
+
+    def variant(self, frame_width: int):
+        width = min(frame_width, self.max_width or frame_width)
+        width = max(16, int(width * self.scales[self.scale]))
+        if self.format != "jpeg":
+            return self.format, 0, width
+        return self.format, self.quality, width
+
+    def record(self, nbytes: int, dropped: int):
+        self._bytes += nbytes
+        elapsed = time.monotonic() - self._window_start
+        if elapsed < self.window:
+            return
+
+        self.kbps = self._bytes * 8 / 1000 / elapsed
+        new_drops = dropped - self._dropped
+        self._bytes = 0
+        self._dropped = dropped
+        self._window_start = time.monotonic()
+
+        if new_drops or (self.max_kbps and self.kbps > self.max_kbps):
+            if (
+                self.format == "jpeg"
+                and self.quality - self.quality_step >= self.min_quality
+            ):
+                self.quality -= self.quality_step
+            elif self.scale < len(self.scales) - 1:
+                self.scale += 1
+        elif not self.max_kbps or self.kbps < self.max_kbps * self.headroom:
+            if self.scale > 0:
+                self.scale -= 1
+            elif self.quality < self.max_quality:
+                self.quality = min(self.max_quality, self.quality + self.quality_step)
+
+
+class StreamClient:
+    def __init__(self, address, max_queue=2, rate: RateController = None, transport="mjpeg"):
+        self.address = address
+        self.rate = rate or RateController()
+        self.transport = transport
+        self.sent = 0
+        self.dropped = 0
+        self._queue = queue.Queue(max_queue)
+
+    def offer(self, message: bytes):
+        # never blocks the broadcaster, a slow client loses its oldest frame
+        while True:
+            try:
+                self._queue.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def next(self, timeout=0.5):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
 
 
 class ImageStream:
-    def __init__(self, port=9000, host=None, fps=35, jpeg_qualty=90):
+    def __init__(self, port=9000, host=None, fps=35, jpeg_qualty=90, client_queue=2):
         self._image = None
+        self._frame_info = (0, 0.0, None)
+        self._version = 0
+        self._published = threading.Condition()
         self.jpeg_quality = jpeg_qualty
         self.port = port
         self.host = host or self._get_host()
         self.thread = None
+        self.broadcast_thread = None
+        self.httpd = None
         self.running = False
         self.fps = fps
+        self.client_queue = client_queue
+        self.encoded = 0
         self.clients = []
         self.client_lock = threading.Lock()
 
@@ -33,74 +199,183 @@ class ImageStream:
             finally:
                 s.close()
 
-    def input_image(self, image: np.ndarray):
-        self._image = image
+    def input_image(self, image: np.ndarray, seq=None, timestamp=None, params=None):
+        # seq, timestamp and params (e.g. the frame's CameraParameters) travel
+        # with the pixels to /frames.ws viewers
+        with self._published:
+            self._image = image
+            self._version += 1
+            self._frame_info = (
+                self._version if seq is None else seq,
+                time.monotonic() if timestamp is None else timestamp,
+                params,
+            )
+            self._published.notify_all()
 
     def start(self):
         if self.thread is not None:
             return
 
+        class ReuseAddressServer(socketserver.ThreadingTCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        self.httpd = ReuseAddressServer(("", self.port), self._create_handler())
         self.running = True
-        self.thread = threading.Thread(target=self._run_server)
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
         self.thread.daemon = True
         self.thread.start()
+        self.broadcast_thread = threading.Thread(target=self._broadcast, daemon=True)
+        self.broadcast_thread.start()
         return f"http://{self.host}:{self.port}/video.mjpg"
 
     def stop(self):
         self.running = False
+        with self._published:
+            self._published.notify_all()
         if self.thread:
+            self.httpd.shutdown()
+            self.httpd.server_close()
             self.thread.join(timeout=1)
+            self.broadcast_thread.join(timeout=1)
             self.thread = None
+            self.broadcast_thread = None
             time.sleep(0.1)
 
-    def _run_server(self):
-        handler = self._create_handler()
+    def _subscribe(self, client):
+        with self.client_lock:
+            self.clients.append(client)
+        with self._published:
+            self._published.notify_all()
+        return client
 
-        class ReuseAddressServer(socketserver.TCPServer):
-            allow_reuse_address = True
+    def _unsubscribe(self, client: StreamClient):
+        with self.client_lock:
+            self.clients.remove(client)
 
-        with ReuseAddressServer(("", self.port), handler) as httpd:
-            while self.running:
-                httpd.handle_request()
+    def _encode(self, image: np.ndarray, variant) -> bytes:
+        format, quality, width = variant
+        if width != image.shape[1]:
+            size = scaled_size(image.shape, width)
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        self.encoded += 1
+        if format == "rgb565":
+            return cv2.cvtColor(image, cv2.COLOR_BGR2BGR565).tobytes()
+        _, jpeg_data = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return jpeg_data.tobytes()
+
+    def _wrap(self, transport, payload: bytes, variant, shape, frame_info) -> bytes:
+        if transport == "mjpeg":
+            return mjpeg_part(payload)
+
+        seq, timestamp, params = frame_info
+        if dataclasses.is_dataclass(params):
+            params = dataclasses.asdict(params)
+        meta = json.dumps(params).encode()
+        width, height = scaled_size(shape, variant[2])
+        header = WS_HEADER.pack(
+            1, WS_FORMATS[variant[0]], width, height, len(meta), seq & 0xFFFFFFFF, timestamp
+        )
+        return ws_binary(header + meta + payload)
+
+    def _broadcast(self):
+        # one encode per new frame and (quality, width) variant, shared by
+        # every client that wants it. Sleeps while the image is unchanged or
+        # nobody is watching.
+        version = 0
+        next_frame = 0.0
+        while self.running:
+            with self._published:
+                self._published.wait_for(
+                    lambda: not self.running
+                    or (self.clients and self._version != version)
+                )
+                if not self.running:
+                    break
+
+            # fps only caps the encode rate, a frame arriving after a quiet
+            # period goes out immediately
+            delay = next_frame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            with self._published:
+                image, version = self._image, self._version
+                frame_info = self._frame_info
+            with self.client_lock:
+                clients = list(self.clients)
+
+            next_frame = time.monotonic() + 1.0 / self.fps
+            encodings = {}
+            messages = {}
+            for client in clients:
+                variant = client.rate.variant(image.shape[1])
+                key = (client.transport, *variant)
+                if key not in messages:
+                    if variant not in encodings:
+                        encodings[variant] = self._encode(image, variant)
+                    messages[key] = self._wrap(
+                        client.transport, encodings[variant], variant, image.shape, frame_info
+                    )
+                client.offer(messages[key])
+
+    def stats(self):
+        with self.client_lock:
+            clients = list(self.clients)
+        return {
+            "encoded": self.encoded,
+            "clients": [
+                {
+                    "address": c.address,
+                    "sent": c.sent,
+                    "dropped": c.dropped,
+                    "quality": c.rate.quality,
+                    "width_scale": c.rate.scales[c.rate.scale],
+                    "kbps": round(c.rate.kbps, 1),
+                }
+                for c in clients
+            ],
+        }
 
     def _create_handler(self):
         stream_instance = self
-        jpeg_qualty = self.jpeg_quality
 
         class ImageHandler(http.server.BaseHTTPRequestHandler):
             def do_GET(self):
-                if self.path == "/video.mjpg":
+                url = urlparse(self.path)
+                if url.path == "/video.mjpg":
+                    try:
+                        rate = RateController.from_query(
+                            url.query, stream_instance.jpeg_quality
+                        )
+                    except ValueError:
+                        self.send_response(400)
+                        self.end_headers()
+                        return
+
                     self.send_response(200)
-                    self.send_header(
-                        "Content-type", "multipart/x-mixed-replace; boundary=--boundary"
-                    )
-                    self.send_header(
-                        "Cache-Control",
-                        "no-store, no-cache, must-revalidate, max-age=0",
-                    )
-                    self.send_header("Access-Control-Allow-Origin", "*")
+                    for name, value in STREAM_HEADERS:
+                        self.send_header(name, value)
                     self.end_headers()
 
+                    client = stream_instance._subscribe(
+                        StreamClient(
+                            self.client_address, stream_instance.client_queue, rate
+                        )
+                    )
                     try:
                         while stream_instance.running:
-                            if stream_instance._image is not None:
-                                image = stream_instance._image
-                                _, jpeg_data = cv2.imencode(
-                                    ".jpg",
-                                    image,
-                                    [cv2.IMWRITE_JPEG_QUALITY, jpeg_qualty],
-                                )
-
-                                self.wfile.write(b"--boundary\r\n")
-                                self.wfile.write(b"Content-Type: image/jpeg\r\n")
-                                self.wfile.write(
-                                    f"Content-Length: {len(jpeg_data)}\r\n\r\n".encode()
-                                )
-                                self.wfile.write(jpeg_data.tobytes())
-                                self.wfile.write(b"\r\n")
-                                time.sleep(1.0 / stream_instance.fps)
+                            part = client.next()
+                            if part is None:
+                                continue
+
+                            self.wfile.write(part)
+                            client.sent += 1
+                            client.rate.record(len(part), client.dropped)
                     except (BrokenPipeError, ConnectionResetError):
                         pass
+                    finally:
+                        stream_instance._unsubscribe(client)
 
                 else:
                     self.send_response(404)
@@ -120,3 +395,193 @@ class ImageStream:
             self.clients = []
         except Exception as e:
             print(f"Error during ImageStream cleanup: {e}")
+
+
+class AsyncStreamClient:
+    # fed from the broadcaster thread, drained by one coroutine
+    def __init__(self, address, loop: asyncio.AbstractEventLoop, rate=None, transport="mjpeg"):
+        self.address = address
+        self.rate = rate or RateController()
+        self.transport = transport
+        self.sent = 0
+        self.dropped = 0
+        self._loop = loop
+        self._latest = None
+        self._lock = threading.Lock()
+        self._ready = asyncio.Event()
+
+    def offer(self, message: bytes):
+        with self._lock:
+            if self._latest is not None:
+                # still writing the previous frame, keep only the newest
+                self.dropped += 1
+                self._latest = message
+                return
+            self._latest = message
+        self._loop.call_soon_threadsafe(self._ready.set)
+
+    async def next(self) -> bytes:
+        await self._ready.wait()
+        self._ready.clear()
+        with self._lock:
+            message, self._latest = self._latest, None
+        return message
+
+
+class AsyncImageStream(ImageStream):
+    """
+    ImageStream served from one asyncio loop instead of a thread per viewer.
+    Besides /video.mjpg it offers /frames.ws, a WebSocket that sends one
+    binary message per frame: WS_HEADER, the JSON params passed to
+    input_image(), then JPEG or RGB565 pixels (?format=jpeg|rgb565).
+    Encoding still happens once per frame and variant in the broadcaster
+    thread.
+    """
+    request_timeout = 5
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._loop = None
+        self._stopping = None
+        self._tasks = set()
+
+    def start(self):
+        if self.thread is not None:
+            return
+
+        ready = threading.Event()
+        self.running = True
+        self.thread = threading.Thread(
+            target=lambda: asyncio.run(self._serve(ready)), daemon=True
+        )
+        self.thread.start()
+        ready.wait()
+        self.broadcast_thread = threading.Thread(target=self._broadcast, daemon=True)
+        self.broadcast_thread.start()
+        return f"http://{self.host}:{self.port}/video.mjpg"
+
+    def stop(self):
+        self.running = False
+        with self._published:
+            self._published.notify_all()
+        if self.thread:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+            self.thread.join(timeout=1)
+            self.broadcast_thread.join(timeout=1)
+            self.thread = None
+            self.broadcast_thread = None
+
+    async def _serve(self, ready: threading.Event):
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        server = await asyncio.start_server(
+            self._handle, port=self.port, reuse_address=True
+        )
+        ready.set()
+        async with server:
+            await self._stopping.wait()
+            for task in list(self._tasks):
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _watch(self, reader: asyncio.StreamReader, task: asyncio.Task):
+        # viewers never send anything after the request, EOF means they left
+        try:
+            await reader.read()
+        except ConnectionError:
+            pass
+        task.cancel()
+
+    async def _watch_ws(self, reader: asyncio.StreamReader, task: asyncio.Task):
+        # client frames are masked; only a close frame matters here
+        try:
+            while True:
+                opcode, length = await reader.readexactly(2)
+                length &= 0x7F
+                if length == 126:
+                    (length,) = struct.unpack("!H", await reader.readexactly(2))
+                elif length == 127:
+                    (length,) = struct.unpack("!Q", await reader.readexactly(8))
+                await reader.readexactly(4 + length)
+                if opcode & 0x0F == 0x8:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        task.cancel()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        watcher = None
+        client = None
+        try:
+            request = await asyncio.wait_for(
+                reader.readuntil(b"\r\n\r\n"), self.request_timeout
+            )
+            lines = request.decode("latin-1").split("\r\n")
+            target = lines[0].split(" ")[1]
+            headers = {
+                name.strip().lower(): value.strip()
+                for name, _, value in (line.partition(":") for line in lines[1:] if line)
+            }
+            url = urlparse(target)
+
+            if url.path == "/video.mjpg":
+                transport, formats = "mjpeg", ("jpeg",)
+            elif url.path == "/frames.ws" and "sec-websocket-key" in headers:
+                transport, formats = "ws", tuple(WS_FORMATS)
+            else:
+                writer.write(b"HTTP/1.0 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+                await writer.drain()
+                return
+            try:
+                rate = RateController.from_query(url.query, self.jpeg_quality, formats)
+            except ValueError:
+                writer.write(b"HTTP/1.0 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+                await writer.drain()
+                return
+
+            if transport == "ws":
+                accept = ws_accept(headers["sec-websocket-key"])
+                writer.write(
+                    b"HTTP/1.1 101 Switching Protocols\r\n"
+                    b"Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                    + f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode()
+                )
+                watch = self._watch_ws
+            else:
+                lines = "".join(f"{name}: {value}\r\n" for name, value in STREAM_HEADERS)
+                writer.write(f"HTTP/1.0 200 OK\r\n{lines}\r\n".encode())
+                watch = self._watch
+
+            client = self._subscribe(
+                AsyncStreamClient(
+                    writer.get_extra_info("peername"), self._loop, rate, transport
+                )
+            )
+            watcher = asyncio.create_task(watch(reader, task))
+
+            while self.running:
+                message = await client.next()
+                writer.write(message)
+                # backpressure: a slow viewer waits here while the newest
+                # frame replaces older ones in its client slot
+                await writer.drain()
+                client.sent += 1
+                client.rate.record(len(message), client.dropped)
+        except (
+            asyncio.CancelledError,
+            asyncio.TimeoutError,
+            asyncio.IncompleteReadError,
+            asyncio.LimitOverrunError,
+            ConnectionError,
+            IndexError,
+        ):
+            pass
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            if client is not None:
+                self._unsubscribe(client)
+            self._tasks.discard(task)
+            writer.close()
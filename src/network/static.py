@@ -1,24 +1,234 @@
+import email.utils
+import functools
+import gzip
 import http.server
-import socketserver
+import mimetypes
+import re
 import threading
 import os
 import time
+from typing import Dict, Optional, Tuple
+
+COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml")
+RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+def etag(st: os.stat_result) -> str:
+    # strong validator: a file with the same inode, size and mtime is
+    # byte-identical for our purposes
+    return f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+class AssetCache:
+    """
+    Small text assets (HTML, JS, CSS) held in memory, raw and gzipped, so
+    the UI is served without touching the disk or compressing per request.
+    An entry is rebuilt when the file's stat changes.
+    """
+
+    def __init__(self, max_size=1 << 20, level=9):
+        self.max_size = max_size
+        self.level = level
+        self._assets: Dict[str, Tuple[Tuple[int, int], bytes, bytes]] = {}
+        self._lock = threading.Lock()
+
+    def cacheable(self, ctype: str, st: os.stat_result) -> bool:
+        return st.st_size <= self.max_size and ctype.startswith(COMPRESSIBLE)
+
+    def preload(self, directory: str):
+        # compress everything up front, not on the first visitor's request
+        for root, _, files in os.walk(directory):
+            for name in files:
+                path = os.path.join(root, name)
+                st = os.stat(path)
+                ctype = mimetypes.guess_type(path)[0] or ""
+                if self.cacheable(ctype, st):
+                    self.get(path, st)
+
+    def get(self, path: str, st: os.stat_result) -> Tuple[bytes, bytes]:
+        key = (st.st_mtime_ns, st.st_size)
+        asset = self._assets.get(path)
+        if asset is None or asset[0] != key:
+            with open(path, "rb") as f:
+                body = f.read()
+            asset = (key, body, gzip.compress(body, self.level, mtime=0))
+            with self._lock:
+                self._assets[path] = asset
+        return asset[1], asset[2]
+
+
+class StaticRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """
+    SimpleHTTPRequestHandler with keep-alive, strong ETags, single byte
+    ranges, gzip from an AssetCache and file bodies sent with sendfile.
+    Directory listings and redirects are left to the base class.
+    """
+
+    protocol_version = "HTTP/1.1"
+    timeout = 30
+    # headers and body are separate writes, see CameraParameterHandler
+    disable_nagle_algorithm = True
+    cache_control = "no-cache"
+    assets: Optional[AssetCache] = None
+
+    def _cache_control(self, path: str) -> str:
+        return self.cache_control
+
+    def _not_modified(self, tag: str, st: os.stat_result) -> bool:
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+            return "*" in tags or tag in tags
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since is not None:
+            try:
+                since = email.utils.parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            return since.timestamp() >= int(st.st_mtime)
+        return False
+
+    def _range(self, tag: str, size: int):
+        # (start, end) for a satisfiable single range, "invalid" for an
+        # unsatisfiable one, None to send the whole file
+        header = self.headers.get("Range")
+        if header is None:
+            return None
+        if_range = self.headers.get("If-Range")
+        if if_range is not None and if_range.strip() != tag:
+            return None
+        match = RANGE.match(header.strip())
+        if match is None:
+            return None  # multiple ranges or another unit, full body is valid
+        first, last = match.groups()
+        if not first:
+            if not last or int(last) == 0:
+                return "invalid"
+            return max(0, size - int(last)), size - 1
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if start >= size or end < start:
+            return "invalid"
+        return start, end
+
+    def _resolve(self) -> Optional[str]:
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            index = os.path.join(path, "index.html")
+            if not self.path.split("?", 1)[0].endswith("/") or not os.path.isfile(index):
+                return None  # redirect or listing
+            path = index
+        return path
+
+    def _serve(self, head: bool):
+        path = self._resolve()
+        if path is None:
+            f = super().send_head()
+            if f:
+                try:
+                    if not head:
+                        self.copyfile(f, self.wfile)
+                finally:
+                    f.close()
+            return
+
+        try:
+            f = open(path, "rb")
+        except OSError:
+            self.send_error(404, "File not found")
+            return
+
+        try:
+            st = os.fstat(f.fileno())
+            ctype = self.guess_type(path)
+            tag = etag(st)
+            body = None
+            if self.assets is not None and self.assets.cacheable(ctype, st):
+                raw, gzipped = self.assets.get(path, st)
+                body = raw
+                if "gzip" in self.headers.get("Accept-Encoding", ""):
+                    body, tag = gzipped, tag[:-1] + '-gz"'
+
+            if self._not_modified(tag, st):
+                self.send_response(304)
+                self.send_header("ETag", tag)
+                self.send_header("Cache-Control", self._cache_control(path))
+                self.end_headers()
+                return
+
+            span = self._range(tag, st.st_size) if body is None else None
+            if span == "invalid":
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{st.st_size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            start, end = span or (0, (len(body) if body is not None else st.st_size) - 1)
+            self.send_response(206 if span else 200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(end - start + 1))
+            self.send_header("Last-Modified", self.date_time_string(st.st_mtime))
+            self.send_header("ETag", tag)
+            self.send_header("Cache-Control", self._cache_control(path))
+            if body is not None:
+                self.send_header("Vary", "Accept-Encoding")
+                if body is not raw:
+                    self.send_header("Content-Encoding", "gzip")
+            else:
+                self.send_header("Accept-Ranges", "bytes")
+            if span:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{st.st_size}")
+            self.end_headers()
+
+            if head:
+                return
+            if body is not None:
+                self.wfile.write(body)
+            else:
+                # zero copy from the page cache where the platform has sendfile
+                self.connection.sendfile(f, start, end - start + 1)
+        except ConnectionError:
+            # the client went away mid-download
+            self.close_connection = True
+        finally:
+            f.close()
+
+    def do_GET(self):
+        self._serve(head=False)
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+
+class ReuseAddressServer(http.server.ThreadingHTTPServer):
+    # one thread per connection, a large download does not block the
+    # other clients
+    allow_reuse_address = True
+    daemon_threads = True
 
 
 class StaticHTTPServer:
-    def __init__(self, directory, port=8000):
+    def __init__(
+        self, directory, port=8000, cache_control="no-cache", precompress=True
+    ):
+        # UI files revalidate by ETag
         self.directory = os.path.abspath(directory)
         self.port = port
         self.server_thread = None
 
+        assets = None
+        if precompress:
+            assets = AssetCache()
+            assets.preload(self.directory)
         handler_class = type(
             "CustomHTTPRequestHandler",
-            (http.server.SimpleHTTPRequestHandler,),
-            {"directory": self.directory},
+            (StaticRequestHandler,),
+            {"cache_control": cache_control, "assets": assets},
         )
-
-        class ReuseAddressServer(socketserver.TCPServer):
-            allow_reuse_address = True
+        # directory has to reach __init__, SimpleHTTPRequestHandler ignores a
+        # class attribute and serves the cwd
+        handler_class = functools.partial(handler_class, directory=self.directory)
 
         self.httpd = ReuseAddressServer(("", self.port), handler_class)
 
@@ -0,0 +1,10 @@
+import pytest
+
+from src.camera import Camera, SyntheticCamera
+
+
+@pytest.fixture
+def camera():
+    cam = Camera(backend=SyntheticCamera())
+    yield cam
+    cam.close()
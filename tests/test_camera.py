@@ -0,0 +1,25 @@
+import pytest
+
+from src.camera import CameraParameters
+from src.camera.camera import STILL_FRAME_DURATION_LIMITS, ChangeTimeoutError
+
+
+def test_manual_exposure_after_auto_is_not_capped(camera):
+    # AE limits frames to 100 ms, leaving it must lift that cap
+    camera.reconfigure(CameraParameters(1.0, (2.0, 2.0), 10000, AeEnable=True))
+    change_id = camera.reconfigure(CameraParameters(2.0, (1.5, 2.5), 500_000))
+
+    assert camera._controls_active["FrameDurationLimits"] == STILL_FRAME_DURATION_LIMITS
+    assert camera._controls_active["ExposureValue"] == 0.0
+    frame = camera.capture_after(change_id, timeout=5.0)
+    assert frame is not None
+    assert frame.metadata.exposure_time == 500_000
+
+
+def test_capture_after_unapplied_change_saves_nothing(camera, tmp_path):
+    # reserved but never applied, so no frame ever carries it
+    change = camera.reserve_change()
+
+    with pytest.raises(ChangeTimeoutError):
+        camera.capture_and_save(str(tmp_path), after_change=change.id)
+    assert list(tmp_path.iterdir()) == []
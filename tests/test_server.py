@@ -0,0 +1,39 @@
+import functools
+import http.client
+import json
+
+import pytest
+
+from src.camera import CameraServer
+
+
+@pytest.fixture
+def server(camera, tmp_path):
+    server = CameraServer(
+        camera,
+        host="127.0.0.1",
+        port=0,
+        callback_capture=functools.partial(camera.capture_and_save, str(tmp_path)),
+    )
+    server.start()
+    yield server
+    server.stop()
+
+
+def post(server, path, payload):
+    connection = http.client.HTTPConnection("127.0.0.1", server.server.server_address[1])
+    connection.request("POST", path, json.dumps(payload), {"Content-Type": "application/json"})
+    response = connection.getresponse()
+    body = json.loads(response.read())
+    connection.close()
+    return response.status, body
+
+
+def test_capture_after_change_timeout_is_an_error(server, camera, tmp_path):
+    change = camera.reserve_change()
+
+    status, body = post(server, "/capture", {"after_change": change.id})
+
+    assert status == 504
+    assert body["change_id"] == change.id
+    assert list(tmp_path.iterdir()) == []